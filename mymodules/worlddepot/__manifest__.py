@@ -18,7 +18,7 @@
     'version': '0.1',
 
     # any module necessary for this one to work correctly
-    'depends': ['base','contacts','web','mail','stock','project','product', 'stock_barcode'],
+    'depends': ['base','contacts','web','mail','stock','project','product', 'stock_barcode', 'stock_picking_batch'],
 
     # always loaded
     'data': [
@@ -52,10 +52,17 @@
         'views/outbound_order_charge.xml',
         'views/my_dashboard.xml',
         'views/my_route.xml',
-        #'views/my_excel_template.xml',
+        'views/picking_purge.xml',
+        'views/location_grid.xml',
+        'views/location_grid_data.xml',
+        'views/stock_atp.xml',
+        'views/storage_snapshot.xml',
+        'views/report_export.xml',
+        'views/my_excel_template.xml',
         #'views/pallet_barcode_assets.xml',
         #'views/sequence.xml',
         'views/my_sequence.xml',
+        'views/my_cron.xml',
         'views/menus.xml',
         #'views/pallet_barcode_action.xml',
     ],
@@ -3,5 +3,6 @@
 from . import auth_controller
 from . import validator_token
 from . import api_logs
+from . import idempotency
 from . import hoymiles
 
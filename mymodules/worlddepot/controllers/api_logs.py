@@ -89,8 +89,14 @@ def api_logger(func):
 '''
 
 
-def api_logger(func):
-    """Decorator to log API requests, responses, and exceptions using independent transactions."""
+def api_logger(func=None, response_summary=None):
+    """Decorator to log API requests, responses, and exceptions using independent transactions.
+
+    ``response_summary`` maps the response to what is stored, for endpoints with large answers;
+    use it as ``@api_logger(response_summary=...)``.
+    """
+    if func is None:
+        return lambda func: api_logger(func, response_summary=response_summary)
 
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -104,7 +110,8 @@ def api_logger(func):
         try:
             response = func(*args, **kwargs)
             status = 'success'
-            response_str = json.dumps(response) if response else ''
+            logged = response_summary(response) if response_summary and response else response
+            response_str = json.dumps(logged) if logged else ''
             exception_details = None
         except Exception as e:
             # Rollback main transaction before handling error
@@ -1,5 +1,3 @@
-import secrets
-from datetime import datetime, timedelta
 from odoo import http
 from odoo.http import request
 import json
@@ -18,29 +16,24 @@ class AuthController(http.Controller):
         if not api_key or not api_secret:
             return {'error': 'Missing API credentials'}
 
-        # Search only by api_key and active status
-        api_user = request.env['world.depot.api.user'].sudo().search([
-            ('api_key', '=', api_key),
-            ('active', '=', True)
-        ], limit=1)
-
         # Verify existence and secret validity
-        if not api_user or not api_user.verify_secret(api_secret):
+        api_user = request.env['world.depot.api.user'].sudo().authenticate(api_key, api_secret)
+        if not api_user:
             return {'error': 'Invalid credentials'}
 
-        # Generate secure token (32 random bytes)
-        token = secrets.token_urlsafe(32)
-        expires = datetime.now() + timedelta(hours=1)
-
-        # Store token
-        request.env['world.depot.api.token'].sudo().create({
-            'user_id': api_user.user_id.id,
-            'token': token,
-            'expires': expires
-        })
-
-        return {
-            'access_token': token,
-            'expires_in': 3600,
-            'expires_at': expires.strftime('%Y-%m-%d %H:%M:%S')
-        }
+        # Hand out the current token while it is still valid long enough
+        return request.env['world.depot.api.token'].sudo()._issue_token(api_user.user_id)
+
+    @http.route('/world_depot/api/auth/refresh', type='json', auth='none', methods=['POST'], csrf=False)
+    @api_logger
+    def refresh_token(self, **params):
+        data = json.loads(request.httprequest.data)
+        refresh_token = data.get('refresh_token')
+
+        if not refresh_token:
+            return {'error': 'Missing refresh token'}
+
+        result = request.env['world.depot.api.token'].sudo()._refresh(refresh_token)
+        if not result:
+            return {'error': 'Invalid or expired refresh token'}
+        return result
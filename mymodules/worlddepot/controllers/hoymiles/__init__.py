@@ -4,6 +4,8 @@ from . import inbound_controller
 from . import inbound_controller_ofo
 from . import outbound_controller
 from . import outbound_controller_ofo
+from . import export_controller
+from . import stock_controller
 from . import hoymiles_token_utils
 from . import hoymiles_api_urls
 from . import hoymiles_api_logs
@@ -0,0 +1,151 @@
+import json
+import logging
+import zlib
+from odoo import http, fields
+from odoo.http import request, Response
+from ..validator_token import validate_token
+
+_logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = 2000
+# Compressed bytes buffered before a chunk is sent to the client
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_QUERIES = {
+    'inbound': [
+        ('order', """
+            SELECT o.id, o.billno, o.reference, o.state, o.date, o.a_date, o.i_date,
+                   o.bl_no, o.cntr_no, o.pallets
+              FROM world_depot_inbound_order o
+             WHERE o.project = %(project_id)s AND o.date BETWEEN %(date_from)s AND %(date_to)s
+          ORDER BY o.id
+        """),
+        ('line', """
+            SELECT l.id, l.inbound_order_id AS order_id, o.billno, l.pallet_no, l.pallets,
+                   p.default_code, p.barcode, l.quantity, l.weight_total
+              FROM world_depot_inbound_order_product l
+              JOIN world_depot_inbound_order o ON o.id = l.inbound_order_id
+              LEFT JOIN product_product p ON p.id = l.product_id
+             WHERE o.project = %(project_id)s AND o.date BETWEEN %(date_from)s AND %(date_to)s
+          ORDER BY l.id
+        """),
+        ('serial', """
+            SELECT ml.id, sp.inbound_order_id AS order_id, o.billno, sp.name AS picking,
+                   p.default_code, p.barcode, lot.name AS serial_number, ml.quantity, ml.date
+              FROM stock_move_line ml
+              JOIN stock_picking sp ON sp.id = ml.picking_id
+              JOIN world_depot_inbound_order o ON o.id = sp.inbound_order_id
+              JOIN stock_lot lot ON lot.id = ml.lot_id
+              JOIN product_product p ON p.id = ml.product_id
+             WHERE o.project = %(project_id)s AND o.date BETWEEN %(date_from)s AND %(date_to)s
+               AND ml.state = 'done'
+          ORDER BY ml.id
+        """),
+    ],
+    'outbound': [
+        ('order', """
+            SELECT o.id, o.billno, o.reference, o.state, o.date, o.p_date, o.o_date,
+                   o.load_ref, o.delivery_method
+              FROM world_depot_outbound_order o
+             WHERE o.project = %(project_id)s AND o.date BETWEEN %(date_from)s AND %(date_to)s
+          ORDER BY o.id
+        """),
+        ('line', """
+            SELECT l.id, l.outbound_order_id AS order_id, o.billno, l.cntr_no, l.pallet_no, l.pallets,
+                   p.default_code, p.barcode, l.quantity
+              FROM world_depot_outbound_order_product l
+              JOIN world_depot_outbound_order o ON o.id = l.outbound_order_id
+              LEFT JOIN product_product p ON p.id = l.product_id
+             WHERE o.project = %(project_id)s AND o.date BETWEEN %(date_from)s AND %(date_to)s
+          ORDER BY l.id
+        """),
+        ('serial', """
+            SELECT ml.id, sp.outbound_order_id AS order_id, o.billno, sp.name AS picking,
+                   p.default_code, p.barcode, lot.name AS serial_number, ml.quantity, ml.date
+              FROM stock_move_line ml
+              JOIN stock_picking sp ON sp.id = ml.picking_id
+              JOIN world_depot_outbound_order o ON o.id = sp.outbound_order_id
+              JOIN stock_lot lot ON lot.id = ml.lot_id
+              JOIN product_product p ON p.id = ml.product_id
+             WHERE o.project = %(project_id)s AND o.date BETWEEN %(date_from)s AND %(date_to)s
+               AND ml.state = 'done'
+          ORDER BY ml.id
+        """),
+    ],
+}
+
+
+def _stream_export(registry, kind, params):
+    """Yield gzip compressed NDJSON chunks of the export.
+
+    Runs after the request cursor is closed, so it reads through its own cursor. Each query is
+    read with a named (server-side) cursor to keep memory flat whatever the period size.
+    """
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    buffer = []
+    buffered = 0
+    with registry.cursor() as cr:
+        for record_type, query in EXPORT_QUERIES[kind]:
+            with cr._cnx.cursor(name=f'world_depot_export_{record_type}') as named_cr:
+                named_cr.itersize = EXPORT_FETCH_SIZE
+                named_cr.execute(query, params)
+                columns = None
+                for row in named_cr:
+                    if columns is None:
+                        columns = [desc[0] for desc in named_cr.description]
+                    line = dict(zip(columns, row), type=record_type)
+                    data = compressor.compress((json.dumps(line, default=str) + '\n').encode())
+                    if data:
+                        buffer.append(data)
+                        buffered += len(data)
+                    if buffered >= EXPORT_CHUNK_SIZE:
+                        yield b''.join(buffer)
+                        buffer, buffered = [], 0
+        cr.rollback()
+    buffer.append(compressor.flush())
+    yield b''.join(buffer)
+
+
+class ExportAPI(http.Controller):
+
+    @http.route(['/world_depot/hoymiles/api/export/<string:kind>',
+                 '/world_depot/ofoundation/api/export/<string:kind>'],
+                type='http', auth='none', methods=['GET', 'POST'], csrf=False)
+    @validate_token
+    def export_orders(self, kind, date_from=None, date_to=None, **params):
+        """Export orders, lines and shipped serials of the API user's project for a period.
+
+        ``kind`` is ``inbound`` or ``outbound``; ``date_from`` and ``date_to`` filter on the
+        order date (YYYY-MM-DD, both included). The body is a gzip file of NDJSON where each
+        line carries a ``type`` of ``order``, ``line`` or ``serial``.
+        """
+        api_user = request.api_user
+        if not api_user or not api_user.project:
+            return Response(json.dumps({'error': 'API user has no project'}), status=403,
+                            mimetype='application/json')
+        if kind not in EXPORT_QUERIES:
+            return Response(json.dumps({'error': f'Unknown export: {kind}'}), status=404,
+                            mimetype='application/json')
+        try:
+            date_from = fields.Date.to_date(date_from)
+            date_to = fields.Date.to_date(date_to)
+        except ValueError:
+            return Response(json.dumps({'error': 'Dates must use the YYYY-MM-DD format'}), status=400,
+                            mimetype='application/json')
+        if not date_from or not date_to:
+            return Response(json.dumps({'error': 'date_from and date_to are required'}), status=400,
+                            mimetype='application/json')
+
+        query_params = {'project_id': api_user.project.id, 'date_from': date_from, 'date_to': date_to}
+        _logger.info("Export %s for project %s from %s to %s", kind, api_user.project.name, date_from, date_to)
+        filename = f'{kind}_{date_from}_{date_to}.ndjson.gz'
+        return Response(
+            _stream_export(request.registry, kind, query_params),
+            headers=[
+                # The file itself is gzip, no Content-Encoding: clients save the .ndjson.gz as sent
+                ('Content-Type', 'application/gzip'),
+                ('Content-Disposition', f'attachment; filename="{filename}"'),
+            ],
+            direct_passthrough=True,
+        )
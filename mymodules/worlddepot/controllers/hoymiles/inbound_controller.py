@@ -1,10 +1,12 @@
 import json
 import logging
+import psycopg2
 from odoo import http
 from odoo.exceptions import UserError
 from ..validator_token import validate_token
 from odoo.http import request, Response
 from ..api_logs import api_logger
+from ..idempotency import idempotent
 
 _logger = logging.getLogger(__name__)
 
@@ -15,6 +17,7 @@ class InboundOrderAPI(http.Controller):
                 csrf=False)
     @validate_token
     @api_logger
+    @idempotent
     def create_inbound_order(self, **params):
         try:
             data = json.loads(request.httprequest.data)
@@ -39,16 +42,17 @@ class InboundOrderAPI(http.Controller):
                         return {'success': False, 'error': f'Product not found: {product["product_id"]}'}
 
             # check duplicate reference
-            existing_order = request.env['world.depot.inbound.order'].sudo().search(
-                [('reference', '=', data['reference']), ('state', '!=', 'cancel')], limit=1)
-            if existing_order:
-                return {'success': False, 'error': f'Duplicate reference: {data["reference"]}'}
-
             api_user = request.api_user
             if not api_user:
                 return {'success': False, 'error': 'API user not found for token'}
             odoo_project = api_user.project
 
+            existing_order = request.env['world.depot.inbound.order'].sudo().search(
+                [('project', '=', odoo_project.id), ('reference', '=', data['reference']),
+                 ('state', '!=', 'cancel')], limit=1)
+            if existing_order:
+                return {'success': False, 'error': f'Duplicate reference: {data["reference"]}'}
+
             # odoo_project = request.env['project.project'].sudo().search([('name', '=', 'HOYMILES')], limit=1)
             # Prepare order vals
             order_vals = {
@@ -89,7 +93,12 @@ class InboundOrderAPI(http.Controller):
             order_vals['inbound_order_product_ids'] = pallet_lines
 
             # Create order
-            order = request.env['world.depot.inbound.order'].sudo().create(order_vals)
+            # A concurrent request may have created the same reference meanwhile
+            try:
+                with request.env.cr.savepoint():
+                    order = request.env['world.depot.inbound.order'].sudo().create(order_vals)
+            except psycopg2.errors.UniqueViolation:
+                return {'success': False, 'error': f'Duplicate reference: {data["reference"]}'}
 
             return {
                 'success': True,
@@ -187,39 +196,22 @@ class InboundOrderAPI(http.Controller):
                 if field in data:
                     updates[field] = data[field]
 
-            # Update pallets structure if provided
+            # Unknown products are rejected before anything is written
+            pallets = data.get('pallets') or []
             if 'pallets' in data:
-                # Delete existing pallet lines
-                order.inbound_order_product_ids.unlink()
-
-                # Create new pallet structure
-                pallet_lines = []
-                for pallet in data.get('pallets', []):
-                    pallet_vals = {
-                        'pallet_type': pallet.get('pallet_type', ''),
-                        'pallet_no': pallet.get('pallet_no', ''),
-                        'pallets': pallet['pallets'],
-                        'inbound_order_product_pallet_ids': []
-                    }
-
-                    # Add products to pallet
-                    for product in pallet.get('products', []):
-                        product_vals = {
-                            'product_id': product['product_id'],
-                            'quantity': product['quantity'],
-                            'adr': product.get('adr', False),
-                            'un_number': product.get('un_number', False),
-                        }
-                        pallet_vals['inbound_order_product_pallet_ids'].append((0, 0, product_vals))
-
-                    pallet_lines.append((0, 0, pallet_vals))
-
-                updates['inbound_order_product_ids'] = pallet_lines
-
-            if updates:
-                order.write(updates)
-
-            return {'success': True, 'billno': order.billno}
+                order._resolve_api_products(list({
+                    product['product_id'] for pallet in pallets for product in pallet.get('products', [])}))
+
+            # Header and pallets are applied together or not at all
+            changes = {}
+            with request.env.cr.savepoint():
+                if updates:
+                    order.write(updates)
+                # Reconcile pallets structure if provided, touching only the rows that changed
+                if 'pallets' in data:
+                    changes = order._apply_api_pallets(pallets)
+
+            return {'success': True, 'billno': order.billno, 'changes': changes}
 
         except Exception as e:
             _logger.error("API Error: %s", str(e))
@@ -1,10 +1,12 @@
 import json
 import logging
+import psycopg2
 from odoo import http, fields
 from odoo.exceptions import UserError
 from ..validator_token import validate_token
 from odoo.http import request
 from ..api_logs import api_logger
+from ..idempotency import idempotent
 
 _logger = logging.getLogger(__name__)
 
@@ -15,6 +17,7 @@ class OutboundOrderAPI(http.Controller):
                 csrf=False)
     @validate_token
     @api_logger
+    @idempotent
     def create_outbound_order(self, **params):
         try:
             data = json.loads(request.httprequest.data)
@@ -39,8 +42,14 @@ class OutboundOrderAPI(http.Controller):
                         return {'success': False, 'error': f'Product not found: {product["product_id"]}'}
 
             # Check duplicate reference
+            api_user = request.api_user
+            if not api_user:
+                return {'success': False, 'error': 'API user not found for token'}
+            odoo_project = api_user.project
+
             existing_order = request.env['world.depot.outbound.order'].sudo().search(
-                [('reference', '=', data['reference']), ('state', '!=', 'cancel')], limit=1)
+                [('project', '=', odoo_project.id), ('reference', '=', data['reference']),
+                 ('state', '!=', 'cancel')], limit=1)
             if existing_order:
                 return {'success': False, 'error': f'Duplicate reference: {data["reference"]}'}
 
@@ -61,11 +70,6 @@ class OutboundOrderAPI(http.Controller):
                     'mobile': data.get('mobile', ''),
                 })
 
-            api_user = request.api_user
-            if not api_user:
-                return {'success': False, 'error': 'API user not found for token'}
-            odoo_project = api_user.project
-
             # odoo_project = request.env['project.project'].sudo().search([('name', '=', 'HOYMILES')], limit=1)
             # Prepare order values
             order_vals = {
@@ -101,7 +105,12 @@ class OutboundOrderAPI(http.Controller):
                 order_vals['outbound_order_product_ids'].append((0, 0, product_vals))
 
             # Create the order
-            order = request.env['world.depot.outbound.order'].sudo().create(order_vals)
+            # A concurrent request may have created the same reference meanwhile
+            try:
+                with request.env.cr.savepoint():
+                    order = request.env['world.depot.outbound.order'].sudo().create(order_vals)
+            except psycopg2.errors.UniqueViolation:
+                return {'success': False, 'error': f'Duplicate reference: {data["reference"]}'}
 
             return {
                 'success': True,
@@ -0,0 +1,232 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from odoo import http, fields
+from odoo.http import request
+from ..validator_token import validate_token
+from ..api_logs import api_logger
+
+_logger = logging.getLogger(__name__)
+
+# Answers are cached per project and query for a short time, partners tend to poll
+STOCK_CACHE_TTL = 30
+STOCK_CACHE_SIZE = 256
+# Maximum number of product codes in one bulk request
+STOCK_BULK_LIMIT = 10000
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Lot detail with the reserved definition of the available to promise table: per pallet, the larger
+# of the quantity on open move lines and the pallet reservations, capped at the pallet's stock of the
+# owner; shared over the lots of the pallet by quantity, so the lot totals equal the ATP totals
+LOT_QUERY = """
+    WITH planned AS (
+        SELECT package_id, product_id, location_id, SUM(quantity) AS quantity
+          FROM stock_move_line
+         WHERE state NOT IN ('done', 'cancel') AND package_id IS NOT NULL
+           AND owner_id IS NOT DISTINCT FROM %(owner_id)s AND (%(all)s OR product_id = ANY(%(products)s))
+      GROUP BY package_id, product_id, location_id
+    ), reserved AS (
+        SELECT r.package_id, r.product_id, r.location_id, SUM(r.quantity) AS quantity
+          FROM world_depot_pallet_reservation r
+          JOIN stock_picking p ON p.id = r.picking_id
+         WHERE p.state NOT IN ('done', 'cancel') AND r.owner_id IS NOT DISTINCT FROM %(owner_id)s
+           AND (%(all)s OR r.product_id = ANY(%(products)s))
+      GROUP BY r.package_id, r.product_id, r.location_id
+    ), quants AS (
+        SELECT q.product_id, q.package_id, q.location_id, q.lot_id, l.name = 'Output' AS output,
+               SUM(q.quantity) AS on_hand,
+               SUM(SUM(q.quantity)) OVER (PARTITION BY q.product_id, q.package_id, q.location_id) AS pallet_on_hand
+          FROM stock_quant q
+          JOIN stock_location l ON l.id = q.location_id AND l.usage = 'internal'
+         WHERE q.owner_id = %(owner_id)s AND q.quantity > 0 AND (%(all)s OR q.product_id = ANY(%(products)s))
+      GROUP BY q.product_id, q.package_id, q.location_id, q.lot_id, l.name
+    )
+    SELECT s.product_id, lot.name, s.output, SUM(s.on_hand),
+           SUM(LEAST(s.pallet_on_hand, GREATEST(COALESCE(planned.quantity, 0), COALESCE(reserved.quantity, 0)))
+               * s.on_hand / s.pallet_on_hand)
+      FROM quants s
+ LEFT JOIN planned ON planned.package_id = s.package_id AND planned.product_id = s.product_id
+                  AND planned.location_id = s.location_id
+ LEFT JOIN reserved ON reserved.package_id = s.package_id AND reserved.product_id = s.product_id
+                   AND reserved.location_id = s.location_id
+ LEFT JOIN stock_lot lot ON lot.id = s.lot_id
+  GROUP BY s.product_id, lot.name, s.output
+"""
+
+
+def _summarize_response(response):
+    """What the API log keeps of a stock answer: the outcome and its size, not the stock itself"""
+    summary = {key: response.get(key) for key in ('success', 'error', 'project', 'generated_at')
+               if key in response}
+    if 'products' in response:
+        summary['product_count'] = len(response['products'])
+        summary['not_found_count'] = len(response.get('not_found') or [])
+    return summary
+
+
+def _cache_get(key):
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            _cache.move_to_end(key)
+            return cached[1]
+    return None
+
+
+def _cache_set(key, value):
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + STOCK_CACHE_TTL, value)
+        _cache.move_to_end(key)
+        while len(_cache) > STOCK_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+class StockAPI(http.Controller):
+
+    def _resolve_codes(self, codes):
+        """Map product codes (default code or barcode) to products in one search.
+
+        :return: ``(products by code, codes not found)``
+        """
+        codes = [str(code) for code in codes]
+        products = request.env['product.product'].sudo().with_context(active_test=False).search(
+            ['|', ('default_code', 'in', codes), ('barcode', 'in', codes)])
+        by_code = {}
+        for product in products:
+            for key in (product.default_code, product.barcode):
+                if key:
+                    by_code.setdefault(key, product)
+        return {code: by_code[code] for code in codes if code in by_code}, \
+            [code for code in codes if code not in by_code]
+
+    def _get_stock(self, owner, products, detail):
+        """Stock of ``owner`` per product, and per container or lot when ``detail`` asks for it.
+
+        On hand covers all internal locations. Goods already picked to Output are counted as
+        reserved, they are on their way out; free is what can still be ordered.
+        """
+        rows = defaultdict(lambda: defaultdict(lambda: {'on_hand': 0.0, 'reserved': 0.0, 'free': 0.0}))
+
+        def add(product_id, key, on_hand, reserved, free, output):
+            values = rows[product_id][key]
+            values['on_hand'] += on_hand
+            if output:
+                values['reserved'] += on_hand
+            else:
+                values['reserved'] += reserved
+                values['free'] += free
+
+        if detail == 'lot':
+            request.env.flush_all()
+            request.env.cr.execute(LOT_QUERY, {
+                'owner_id': owner.id,
+                'all': products is None,
+                'products': products.ids if products is not None else [0],
+            })
+            for product_id, lot_name, output, on_hand, reserved in request.env.cr.fetchall():
+                add(product_id, lot_name or '', on_hand, reserved, on_hand - reserved, output)
+        else:
+            domain = [('owner_id', '=', owner.id)]
+            if products is not None:
+                domain.append(('product_id', 'in', products.ids))
+            atp_rows = request.env['world.depot.stock.atp'].sudo().search_read(
+                domain, ['product_id', 'pallet_prefix', 'location_class', 'on_hand', 'reserved', 'free'], load=None)
+            for row in atp_rows:
+                key = (row['pallet_prefix'] or '') if detail == 'container' else ''
+                add(row['product_id'], key, row['on_hand'], row['reserved'], row['free'],
+                    row['location_class'] == 'output')
+        return rows
+
+    def _stock_response(self, api_user, codes, detail):
+        project = api_user.project
+        if not project or not project.owner:
+            return {'success': False, 'error': 'API user has no project owner'}
+        if detail not in (None, 'container', 'lot'):
+            return {'success': False, 'error': f'Unknown detail: {detail}'}
+
+        cache_key = (project.id, detail, tuple(codes) if codes is not None else None)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        not_found = []
+        products = None
+        if codes is not None:
+            by_code, not_found = self._resolve_codes(codes)
+            products = request.env['product.product'].sudo().browse(
+                list(dict.fromkeys(product.id for product in by_code.values())))
+
+        rows = self._get_stock(project.owner, products, detail)
+        if products is None:
+            products = request.env['product.product'].sudo().browse(list(rows))
+
+        result_products = []
+        for product in products:
+            keys = rows.get(product.id, {})
+            totals = {'on_hand': 0.0, 'reserved': 0.0, 'free': 0.0}
+            for values in keys.values():
+                for name in totals:
+                    totals[name] += values[name]
+            product_data = {
+                'product_code': product.default_code,
+                'barcode': product.barcode,
+                **totals,
+            }
+            if detail:
+                product_data[detail + 's'] = [
+                    {detail: key or None, **values} for key, values in sorted(keys.items())
+                ]
+            result_products.append(product_data)
+
+        result = {
+            'success': True,
+            'project': project.name,
+            'generated_at': fields.Datetime.to_string(fields.Datetime.now()),
+            'products': result_products,
+            'not_found': not_found,
+        }
+        _cache_set(cache_key, result)
+        return result
+
+    @http.route(['/world_depot/hoymiles/api/stock',
+                 '/world_depot/ofoundation/api/stock'],
+                type='json', auth='none', methods=['POST'], csrf=False)
+    @validate_token
+    @api_logger(response_summary=_summarize_response)
+    def get_stock(self, **params):
+        """Stock of the API user's project.
+
+        Optional ``product_code`` limits the answer to one product (default code or barcode);
+        optional ``detail`` (``container`` or ``lot``) adds a breakdown per product.
+        """
+        try:
+            data = json.loads(request.httprequest.data or '{}')
+            code = data.get('product_code')
+            return self._stock_response(request.api_user, [str(code)] if code else None, data.get('detail'))
+        except Exception as e:
+            _logger.error("API Error: %s", str(e))
+            return {'success': False, 'error': str(e)}
+
+    @http.route(['/world_depot/hoymiles/api/stock/bulk',
+                 '/world_depot/ofoundation/api/stock/bulk'],
+                type='json', auth='none', methods=['POST'], csrf=False)
+    @validate_token
+    @api_logger(response_summary=_summarize_response)
+    def get_stock_bulk(self, **params):
+        """Stock of many products in one call: ``product_codes`` is the list of codes"""
+        try:
+            data = json.loads(request.httprequest.data or '{}')
+            codes = data.get('product_codes')
+            if not isinstance(codes, list) or not codes:
+                return {'success': False, 'error': 'product_codes must be a non empty list'}
+            if len(codes) > STOCK_BULK_LIMIT:
+                return {'success': False, 'error': f'At most {STOCK_BULK_LIMIT} product codes per request'}
+            codes = list(dict.fromkeys(str(code) for code in codes))
+            return self._stock_response(request.api_user, codes, data.get('detail'))
+        except Exception as e:
+            _logger.error("API Error: %s", str(e))
+            return {'success': False, 'error': str(e)}
@@ -0,0 +1,47 @@
+import hashlib
+import json
+import logging
+from functools import wraps
+from odoo.http import request
+
+_logger = logging.getLogger(__name__)
+
+
+def idempotent(func):
+    """Decorator replaying the stored response of requests sent with an Idempotency-Key header.
+
+    Must run after validate_token, which sets request.api_user. Requests without the header are
+    processed as before. Only successful responses are stored; failed ones release the key so the
+    client can retry.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (request.httprequest.headers.get('Idempotency-Key') or '').strip()
+        api_user = getattr(request, 'api_user', None)
+        if not key or not api_user:
+            return func(*args, **kwargs)
+
+        if len(key) > 255:
+            return {'success': False, 'error': 'Idempotency-Key must not exceed 255 characters'}
+
+        request_hash = hashlib.sha256(request.httprequest.data or b'').hexdigest()
+        Idempotency = request.env['world.depot.api.idempotency'].sudo()
+        record, claimed = Idempotency._claim(api_user.id, key, request.httprequest.path, request_hash)
+
+        if not claimed:
+            if record.request_hash != request_hash or record.request_path != request.httprequest.path:
+                return {'success': False, 'error': 'Idempotency-Key already used with a different request'}
+            if not record.response_data:
+                return {'success': False, 'error': 'A request with this Idempotency-Key is still being processed'}
+            _logger.info("Replaying stored response for idempotency key %s", key)
+            return json.loads(record.response_data)
+
+        response = func(*args, **kwargs)
+        if isinstance(response, dict) and response.get('success'):
+            record.write({'response_data': json.dumps(response)})
+        else:
+            record.unlink()
+        return response
+
+    return wrapper
@@ -0,0 +1,61 @@
+import math
+import threading
+import time
+
+# Idle buckets are dropped after this many seconds so removed API users do not accumulate
+_BUCKET_IDLE_TIMEOUT = 3600
+
+
+class AdmissionController:
+    """In-memory token buckets and concurrency counters per API user.
+
+    State lives in the worker process, so the limits apply per worker: with several HTTP workers
+    a partner can reach the configured rate on each of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> [tokens, last refill timestamp]
+        self._active = {}  # key -> number of requests in progress
+
+    def acquire(self, key, rate, burst, max_concurrent):
+        """Admit a request for ``key``.
+
+        Returns None when the request may proceed, otherwise the number of seconds the client
+        should wait before retrying. A rate or max_concurrent of 0 disables that limit. Every
+        admitted request must be followed by a call to release().
+        """
+        now = time.monotonic()
+        with self._lock:
+            if max_concurrent and self._active.get(key, 0) >= max_concurrent:
+                return 1
+
+            if rate > 0:
+                capacity = max(burst, 1)
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                if tokens < 1:
+                    self._buckets[key] = [tokens, now]
+                    return max(1, math.ceil((1 - tokens) / rate))
+                self._buckets[key] = [tokens - 1, now]
+
+            self._active[key] = self._active.get(key, 0) + 1
+            if len(self._buckets) > 1000:
+                self._drop_idle_buckets(now)
+        return None
+
+    def release(self, key):
+        with self._lock:
+            active = self._active.get(key, 0) - 1
+            if active > 0:
+                self._active[key] = active
+            else:
+                self._active.pop(key, None)
+
+    def _drop_idle_buckets(self, now):
+        for key in [k for k, (_tokens, updated) in self._buckets.items()
+                    if now - updated > _BUCKET_IDLE_TIMEOUT]:
+            del self._buckets[key]
+
+
+admission = AdmissionController()
@@ -4,6 +4,7 @@ import logging
 from odoo import http, fields
 from odoo.http import request
 from functools import wraps
+from .rate_limiter import admission
 
 _logger = logging.getLogger(__name__)
 
@@ -44,8 +45,8 @@ def validate_token(func):
             )
 
         if token_rec.expires < fields.Datetime.now():
-            token_rec.unlink()
-            _logger.info("Expired token deleted: %s", token)
+            # Kept until the cron cleanup so its refresh token can still be used
+            _logger.info("Expired token used: %s", token)
             return http.Response(
                 json.dumps({'error': 'Token expired'}),
                 status=401,
@@ -63,7 +64,25 @@ def validate_token(func):
         # Store the API user record in the request for later use in endpoints
         request.api_user = api_user
 
+        if not api_user:
+            return func(*args, **kwargs)
+
+        # Admission control: throttle the partner before it takes a worker away from warehouse users
+        retry_after = admission.acquire(api_user.id, api_user.rate_limit, api_user.rate_limit_burst,
+                                        api_user.max_concurrent_requests)
+        if retry_after is not None:
+            _logger.warning("API rate limit exceeded for %s, retry after %ss", api_user.api_key, retry_after)
+            return http.Response(
+                json.dumps({'error': 'Too many requests'}),
+                status=429,
+                headers=[('Retry-After', str(retry_after))],
+                mimetype='application/json'
+            )
+
         # Proceed to the endpoint function
-        return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            admission.release(api_user.id)
 
     return wrapper
@@ -13,8 +13,9 @@ from . import waybill
 from . import my_picking_type
 from . import my_package_barcode
 from . import my_api_user
+from . import my_api_idempotency
 from . import my_location
-#from . import my_excel_template
+from . import my_excel_template
 from . import my_product_template
 from . import inbound_order_summary
 from . import outbound_order_summary
@@ -27,4 +28,15 @@ from . import charge_item
 from . import inbound_order_charge
 from . import outbound_order_pack_info
 from . import outbound_order_charge
-from . import my_dashboard
\ No newline at end of file
+from . import my_dashboard
+from . import picking_purge
+from . import excel_template_registry
+from . import cmr_renderer
+from . import report_export
+from . import kpi_counter
+from . import location_grid
+from . import bin_occupancy
+from . import outbound_wave
+from . import pallet_reservation
+from . import stock_atp
+from . import storage_snapshot
\ No newline at end of file
@@ -0,0 +1,191 @@
+import logging
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+
+class BinOccupancy(models.Model):
+    _name = 'world.depot.bin.occupancy'
+    _description = 'Bin Occupancy'
+    _order = 'name'
+
+    location_id = fields.Many2one('stock.location', string='Bin', required=True, ondelete='cascade')
+    hall_id = fields.Many2one('stock.location', string='Hall', index=True, ondelete='cascade')
+    name = fields.Char(string='Location', help='Full name of the bin, also the putaway order')
+    project_id = fields.Many2one('project.project', string='Reserved for Project', ondelete='set null')
+    is_adr_zone = fields.Boolean(string='ADR Zone')
+    quant_count = fields.Integer(string='Quants')
+    pending_count = fields.Integer(string='Incoming Lines', help='Move lines not yet done with this bin as destination')
+    occupied = fields.Boolean(string='Occupied')
+
+    _sql_constraints = [
+        ('location_uniq', 'unique(location_id)', 'A bin can only have one occupancy row!'),
+    ]
+
+    def init(self):
+        # Putaway looks up free bins by zone and project in putaway order
+        self.env.cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self._table}_free_bin_idx
+                ON {self._table} (is_adr_zone, project_id, name) WHERE NOT occupied
+        """)
+
+    @api.model
+    def _refresh(self, root_location=None):
+        """Bring the occupancy rows of the bins of all active location grids up to date in one upsert.
+
+        A bin is a leaf internal location below the hall of a grid. It is occupied when it holds
+        stock or is the destination of a move line not yet done. ``root_location`` restricts the
+        refresh to the bins below that location.
+        """
+        self.env.flush_all()
+        root_path = f"{root_location.parent_path}%" if root_location else '%'
+        self.env.cr.execute(f"""
+            WITH bins AS (
+                SELECT DISTINCT ON (l.id) l.id AS location_id, hall.id AS hall_id, l.complete_name AS name,
+                       COALESCE(l.putaway_project_id, aisle.putaway_project_id) AS project_id,
+                       EXISTS (SELECT 1 FROM stock_location zone
+                                WHERE zone.is_adr_zone AND l.parent_path LIKE zone.parent_path || '%%') AS is_adr_zone
+                  FROM world_depot_location_grid g
+                  JOIN stock_location hall ON hall.id = g.parent_location_id
+                  JOIN stock_location l ON l.parent_path LIKE hall.parent_path || '%%' AND l.id != hall.id
+                  JOIN stock_location aisle ON aisle.id = l.location_id
+                 WHERE g.active AND l.active AND l.usage = 'internal' AND l.parent_path LIKE %(root_path)s
+                   AND NOT EXISTS (SELECT 1 FROM stock_location child WHERE child.location_id = l.id AND child.active)
+            ), quants AS (
+                SELECT location_id, COUNT(*) AS cnt FROM stock_quant
+                 WHERE quantity > 0 AND location_id IN (SELECT location_id FROM bins)
+              GROUP BY location_id
+            ), pending AS (
+                SELECT location_dest_id, COUNT(*) AS cnt FROM stock_move_line
+                 WHERE state NOT IN ('done', 'cancel') AND location_dest_id IN (SELECT location_id FROM bins)
+              GROUP BY location_dest_id
+            ), upserted AS (
+                -- Only new and changed bins are written, unchanged rows are left unlocked
+                INSERT INTO {self._table} (location_id, hall_id, name, project_id, is_adr_zone,
+                                           quant_count, pending_count, occupied,
+                                           create_uid, create_date, write_uid, write_date)
+                SELECT b.location_id, b.hall_id, b.name, b.project_id, b.is_adr_zone,
+                       COALESCE(q.cnt, 0), COALESCE(p.cnt, 0), COALESCE(q.cnt, 0) + COALESCE(p.cnt, 0) > 0,
+                       %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+                  FROM bins b
+             LEFT JOIN quants q ON q.location_id = b.location_id
+             LEFT JOIN pending p ON p.location_dest_id = b.location_id
+             LEFT JOIN {self._table} o ON o.location_id = b.location_id
+                 WHERE o.id IS NULL
+                    OR (o.hall_id, o.name, o.project_id, o.is_adr_zone, o.quant_count, o.pending_count, o.occupied)
+                       IS DISTINCT FROM (b.hall_id, b.name, b.project_id, b.is_adr_zone, COALESCE(q.cnt, 0),
+                                         COALESCE(p.cnt, 0), COALESCE(q.cnt, 0) + COALESCE(p.cnt, 0) > 0)
+                    ON CONFLICT (location_id) DO UPDATE
+                   SET hall_id = EXCLUDED.hall_id, name = EXCLUDED.name, project_id = EXCLUDED.project_id,
+                       is_adr_zone = EXCLUDED.is_adr_zone, quant_count = EXCLUDED.quant_count,
+                       pending_count = EXCLUDED.pending_count, occupied = EXCLUDED.occupied,
+                       write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+                 WHERE {self._table}.occupied IS DISTINCT FROM EXCLUDED.occupied
+                    OR ({self._table}.hall_id, {self._table}.name, {self._table}.project_id,
+                        {self._table}.is_adr_zone, {self._table}.quant_count, {self._table}.pending_count)
+                       IS DISTINCT FROM (EXCLUDED.hall_id, EXCLUDED.name, EXCLUDED.project_id,
+                                         EXCLUDED.is_adr_zone, EXCLUDED.quant_count, EXCLUDED.pending_count)
+             RETURNING location_id
+            ), removed AS (
+                -- Drop rows of locations that are no longer bins of a grid
+                DELETE FROM {self._table} o
+                 USING stock_location l
+                 WHERE l.id = o.location_id AND l.parent_path LIKE %(root_path)s
+                   AND o.location_id NOT IN (SELECT location_id FROM bins)
+             RETURNING o.location_id
+            )
+            SELECT (SELECT COUNT(*) FROM upserted), (SELECT COUNT(*) FROM removed)
+        """, {'root_path': root_path, 'uid': self.env.uid})
+        written, removed = self.env.cr.fetchone()
+        self.invalidate_model()
+        _logger.info("Refreshed bin occupancy: %s bins written, %s removed", written, removed)
+
+    @api.model
+    def _cron_refresh(self):
+        self._refresh()
+
+    @api.model
+    def _get_busy_bins(self, location_ids):
+        """Bins among ``location_ids`` that hold stock or are the destination of an open move line"""
+        self.env['stock.quant'].flush_model(['location_id', 'quantity'])
+        self.env['stock.move.line'].flush_model(['location_dest_id', 'state'])
+        self.env.cr.execute("""
+            SELECT location_id FROM stock_quant WHERE location_id = ANY(%(ids)s) AND quantity > 0
+             UNION
+            SELECT location_dest_id FROM stock_move_line
+             WHERE location_dest_id = ANY(%(ids)s) AND state NOT IN ('done', 'cancel')
+        """, {'ids': list(location_ids)})
+        return {row[0] for row in self.env.cr.fetchall()}
+
+    @api.model
+    def _find_free_bins(self, root_location, project, adr, limit, exclude_ids=()):
+        """Lock and return up to ``limit`` free bin location ids below ``root_location``.
+
+        Bins reserved for ``project`` come first, then bins without reservation, each in location
+        order. Bins locked by a concurrent putaway are skipped. The table is only refreshed by the
+        cron, so the locked candidates are checked against the stock and open move lines before
+        they are returned; bins found busy are marked occupied and replaced by the next ones.
+        """
+        found = []
+        exclude_ids = set(exclude_ids)
+        while len(found) < limit:
+            self.env.cr.execute(f"""
+                SELECT o.location_id
+                  FROM {self._table} o
+                  JOIN stock_location l ON l.id = o.location_id
+                 WHERE NOT o.occupied AND o.is_adr_zone = %(adr)s
+                   AND (o.project_id IS NULL OR o.project_id = %(project)s)
+                   AND l.parent_path LIKE %(root_path)s AND NOT o.location_id = ANY(%(exclude)s)
+              ORDER BY o.project_id IS NULL, o.name
+                 LIMIT %(limit)s
+                   FOR UPDATE OF o SKIP LOCKED
+            """, {
+                'adr': adr,
+                'project': project.id or None,
+                'root_path': f"{root_location.parent_path}%",
+                'exclude': list(exclude_ids),
+                'limit': limit - len(found),
+            })
+            candidate_ids = [row[0] for row in self.env.cr.fetchall()]
+            if not candidate_ids:
+                break
+            busy_ids = self._get_busy_bins(candidate_ids)
+            if busy_ids:
+                self.env.cr.execute(f"""
+                    UPDATE {self._table} SET occupied = TRUE, write_uid = %s, write_date = now() at time zone 'UTC'
+                     WHERE location_id = ANY(%s)
+                """, [self.env.uid, list(busy_ids)])
+                self.invalidate_model()
+            found += [location_id for location_id in candidate_ids if location_id not in busy_ids]
+            exclude_ids.update(candidate_ids)
+        return found
+
+    @api.model
+    def _assign_bins(self, root_location, project, pallets):
+        """Pick one free bin per pallet.
+
+        :param pallets: list of ``(key, is_adr)``
+        :return: dict key -> bin location id, for the pallets that got a bin
+
+        ADR pallets only go to ADR zones. Other pallets fill regular bins first and ADR zones only
+        once no regular bin is left. The chosen bins are marked occupied right away.
+        """
+        adr_keys = [key for key, adr in pallets if adr]
+        other_keys = [key for key, adr in pallets if not adr]
+
+        adr_bins = self._find_free_bins(root_location, project, True, len(adr_keys))
+        other_bins = self._find_free_bins(root_location, project, False, len(other_keys))
+        other_bins += self._find_free_bins(root_location, project, True, len(other_keys) - len(other_bins),
+                                           exclude_ids=adr_bins)
+
+        assignment = dict(zip(adr_keys, adr_bins))
+        assignment.update(zip(other_keys, other_bins))
+        if assignment:
+            self.env.cr.execute(f"""
+                UPDATE {self._table}
+                   SET occupied = TRUE, pending_count = pending_count + 1,
+                       write_uid = %s, write_date = now() at time zone 'UTC'
+                 WHERE location_id = ANY(%s)
+            """, [self.env.uid, list(assignment.values())])
+            self.invalidate_model()
+        return assignment
@@ -0,0 +1,71 @@
+from io import BytesIO
+
+from openpyxl.styles import Alignment
+
+from odoo import api, models, _
+from odoo.exceptions import UserError
+
+
+class CmrRenderer(models.AbstractModel):
+    _name = 'world.depot.cmr.renderer'
+    _description = 'CMR Renderer'
+
+    # Template row holding the layout of one product line in the project CMR template
+    _product_row = 24
+    # Columns B to G receive the product values
+    _product_first_column = 2
+
+    @api.model
+    def _get_compiled_template(self, project):
+        """Compiled CMR template of the project.
+
+        An outbound CMR Excel template configured for the project takes precedence over the
+        template file uploaded on the project itself.
+        """
+        template = self.env['world.depot.excel.template']._get_template(project, 'outbound', 'cmr')
+        if template:
+            compiled = template._get_compiled()
+            if not compiled['repeat_row']:
+                # No repeat row nor {{ line.* }} placeholder: product lines go to the fixed CMR row
+                compiled = dict(compiled, repeat_row=self._product_row)
+            return compiled
+
+        field_name = 'outbound_cmr_template_file'
+        attachment = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', 'project.project'),
+            ('res_field', '=', field_name),
+            ('res_id', '=', project.id),
+        ], limit=1)
+        if not attachment:
+            raise UserError(_("No CMR template is configured on project %s.") % project.display_name)
+        return self.env['world.depot.excel.template.registry']._get_compiled(
+            ('project.project', project.id, field_name), attachment.checksum,
+            lambda: attachment.raw, self._product_row)
+
+    @api.model
+    def render(self, project, values):
+        """Render a CMR and return the xlsx file content.
+
+        :param project: project whose outbound CMR template is used
+        :param values: dict with ``cells`` (cell reference -> value) and ``lines`` (one list of
+            values per product line, written from column B)
+        """
+        compiled = self._get_compiled_template(project)
+        workbook = self.env['world.depot.excel.template.registry'].render_workbook(
+            compiled, values, self._product_first_column)
+
+        # Product lines are top aligned and wrapped, the product name on the left
+        worksheet = workbook.active
+        align_left = Alignment(vertical="top", horizontal="left", wrap_text=True)
+        align_right = Alignment(vertical="top", horizontal="right", wrap_text=True)
+        first_row = compiled['repeat_row']
+        lines_count = len(values['lines'])
+        for row in worksheet.iter_rows(min_row=first_row, max_row=first_row + lines_count - 1,
+                                       min_col=self._product_first_column,
+                                       max_col=self._product_first_column + 5):
+            for cell in row:
+                cell.alignment = align_left if cell.column == self._product_first_column else align_right
+
+        output = BytesIO()
+        workbook.save(output)
+        return output.getvalue()
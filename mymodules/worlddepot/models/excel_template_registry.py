@@ -0,0 +1,152 @@
+import logging
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from copy import copy
+from io import BytesIO
+
+import openpyxl
+
+from odoo import api, models
+
+_logger = logging.getLogger(__name__)
+
+# Compiled templates of this worker: source key -> (version, compiled template)
+_REGISTRY_SIZE = 32
+_registry = OrderedDict()
+_registry_lock = threading.Lock()
+
+# A cell holding only "{{ name }}" is filled with data[name]; "{{ line.name }}" marks the repeat row
+PLACEHOLDER_RE = re.compile(r'^\{\{\s*([\w.]+)\s*\}\}$')
+
+
+class ExcelTemplateRegistry(models.AbstractModel):
+    _name = 'world.depot.excel.template.registry'
+    _description = 'Excel Template Registry'
+
+    @api.model
+    def _compile(self, content, repeat_row=0):
+        """Parse a template into its compiled form.
+
+        The compiled form holds the pickled workbook, the placeholder cell map of the active
+        sheet and the repeat region (row and column -> line field). Unpickling it is several
+        times faster than parsing the xlsx again.
+        """
+        workbook = openpyxl.load_workbook(BytesIO(content), read_only=False)
+        worksheet = workbook.active
+        cells = {}
+        line_columns = {}
+        placeholder_row = 0
+        for row in worksheet.iter_rows():
+            for cell in row:
+                if not isinstance(cell.value, str) or '{{' not in cell.value:
+                    continue
+                match = PLACEHOLDER_RE.match(cell.value.strip())
+                if not match:
+                    continue
+                name = match.group(1)
+                if name.startswith('line.'):
+                    placeholder_row = placeholder_row or cell.row
+                    if cell.row == placeholder_row:
+                        line_columns[cell.column] = name[5:]
+                else:
+                    cells.setdefault(name, []).append(cell.coordinate)
+        return {
+            'workbook': pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL),
+            'cells': cells,
+            'repeat_row': repeat_row or placeholder_row,
+            'line_columns': line_columns,
+        }
+
+    @api.model
+    def _get_compiled(self, key, version, loader, repeat_row=0):
+        """Return the compiled template of ``key``, compiling it when ``version`` changed.
+
+        :param key: hashable identifying the template source
+        :param version: value changing whenever the template changes (write date, checksum)
+        :param loader: callable returning the xlsx content, only called on a cache miss
+        """
+        with _registry_lock:
+            cached = _registry.get(key)
+            if cached and cached[0] == version:
+                _registry.move_to_end(key)
+                return cached[1]
+
+        compiled = self._compile(loader(), repeat_row)
+        with _registry_lock:
+            _registry[key] = (version, compiled)
+            _registry.move_to_end(key)
+            while len(_registry) > _REGISTRY_SIZE:
+                _registry.popitem(last=False)
+        _logger.info("Compiled Excel template %s (version %s)", key, version)
+        return compiled
+
+    @api.model
+    def render_workbook(self, compiled, data, first_column=1):
+        """Fill a fresh copy of a compiled template and return the workbook.
+
+        ``data`` may contain placeholder values by name, ``cells`` (cell reference -> value) and
+        ``lines``. Lines are dicts matched to the ``{{ line.x }}`` columns, or lists written from
+        ``first_column``. The repeat row is expanded in one operation.
+        """
+        workbook = pickle.loads(compiled['workbook'])
+        worksheet = workbook.active
+        for name, refs in compiled['cells'].items():
+            for ref in refs:
+                worksheet[ref] = data.get(name, '')
+        for ref, value in (data.get('cells') or {}).items():
+            worksheet[ref] = value
+        if compiled['repeat_row']:
+            self._fill_repeat_row(worksheet, compiled['repeat_row'], data.get('lines') or [],
+                                  compiled['line_columns'], first_column)
+        return workbook
+
+    @api.model
+    def render(self, compiled, data, first_column=1):
+        """Render a compiled template and return the xlsx file content"""
+        workbook = self.render_workbook(compiled, data, first_column)
+        output = BytesIO()
+        workbook.save(output)
+        return output.getvalue()
+
+    @api.model
+    def _fill_repeat_row(self, worksheet, row, lines, line_columns, first_column):
+        """Replace the repeat row by one row per line.
+
+        The rows are inserted in one operation; merged cells and row heights below the block are
+        shifted along, and every new row takes the styles of the repeat row.
+        """
+        if not lines:
+            worksheet.delete_rows(row)
+            return
+
+        extra = len(lines) - 1
+        if extra:
+            worksheet.insert_rows(row + 1, amount=extra)
+            for merged_range in worksheet.merged_cells.ranges:
+                if merged_range.min_row > row:
+                    merged_range.shift(0, extra)
+            for index in sorted((r for r in worksheet.row_dimensions if r > row), reverse=True):
+                if worksheet.row_dimensions[index].height is not None:
+                    worksheet.row_dimensions[index + extra].height = worksheet.row_dimensions[index].height
+                    worksheet.row_dimensions[index].height = None
+
+        max_column = worksheet.max_column
+        template_styles = [copy(worksheet.cell(row=row, column=col)._style) for col in range(1, max_column + 1)]
+        template_height = worksheet.row_dimensions[row].height
+
+        for offset, line in enumerate(lines):
+            row_index = row + offset
+            for col in range(1, max_column + 1):
+                cell = worksheet.cell(row=row_index, column=col)
+                cell._style = copy(template_styles[col - 1])
+                cell.value = None
+            if isinstance(line, dict):
+                for col, field_name in line_columns.items():
+                    worksheet.cell(row=row_index, column=col, value=line.get(field_name))
+            else:
+                for col, value in enumerate(line, start=first_column):
+                    worksheet.cell(row=row_index, column=col, value=value)
+            if template_height is not None:
+                worksheet.row_dimensions[row_index].height = template_height
@@ -1,12 +1,34 @@
 import logging
+import psycopg2
 from markupsafe import Markup
 from odoo import api, fields, models, _
+from odoo.tools import sql
 from odoo.exceptions import UserError, ValidationError
 from datetime import timedelta
+from collections import defaultdict
 
 _logger = logging.getLogger(__name__)
 
 
+def create_active_reference_index(cr, table):
+    """Create the partial unique index on (project, reference) of non-cancelled orders.
+
+    Existing duplicates make the index creation fail; they are logged so they can be cleaned up
+    and the index gets created on the next module update.
+    """
+    index_name = f'{table}_project_reference_active_uniq'
+    if sql.index_exists(cr, index_name):
+        return
+    try:
+        with cr.savepoint(flush=False):
+            cr.execute(f"""
+                CREATE UNIQUE INDEX {index_name} ON {table} (project, reference)
+                WHERE state != 'cancel'
+            """)
+    except psycopg2.IntegrityError:
+        _logger.warning("Duplicate active references in %s, unique index %s not created", table, index_name)
+
+
 class InboundOrder(models.Model):
     _name = 'world.depot.inbound.order'
     _description = 'Inbound Order'
@@ -48,7 +70,8 @@ class InboundOrder(models.Model):
                                 stored=True)
     remark = fields.Text(string='Remark')
     remark1 = fields.Text(string='Remark 1')
-    reference = fields.Char(string='Reference', help='Reference for the Order No of Owner', required=True)
+    reference = fields.Char(string='Reference', help='Reference for the Order No of Owner', required=True,
+                            index=True)
     bl_no = fields.Char(string='Bill of Lading')
     invoice_no = fields.Char(string='Invoice No')
     cntr_no = fields.Char(string='Container No')
@@ -177,6 +200,10 @@ class InboundOrder(models.Model):
             else:
                 record.inbound_trucking_charge = 0.0
 
+    def init(self):
+        """Enforce one active order per project and reference."""
+        create_active_reference_index(self.env.cr, self._table)
+
     # Methods
     @api.model
     def create(self, values):
@@ -595,6 +622,189 @@ class InboundOrder(models.Model):
             }
         }
 
+    def _resolve_api_products(self, codes):
+        """Map API product identifiers (database id, barcode or default code) to product ids in one search."""
+        def _key(code):
+            return code if isinstance(code, int) else str(code)
+
+        ids = [code for code in codes if isinstance(code, int)]
+        names = [str(code) for code in codes if not isinstance(code, int)]
+        resolved = {}
+        if ids:
+            for product in self.env['product.product'].sudo().browse(ids).exists():
+                resolved[product.id] = product.id
+        if names:
+            products = self.env['product.product'].sudo().search(
+                ['|', ('barcode', 'in', names), ('default_code', 'in', names)])
+            for product in products:
+                for key in (product.barcode, product.default_code):
+                    if key in names:
+                        resolved.setdefault(key, product.id)
+        missing = [str(code) for code in codes if _key(code) not in resolved]
+        if missing:
+            raise UserError(_("Product not found: %s") % ', '.join(missing))
+        return {code: resolved[_key(code)] for code in codes}
+
+    def _apply_api_pallets(self, pallets_data):
+        """Reconcile the pallet structure of the order with an API payload.
+
+        Pallets are matched by ``pallet_no`` and the products of a pallet by product, so only
+        the rows that actually differ are created, written or unlinked. Returns a dict with
+        the number of pallets and products created, updated and deleted.
+        """
+        self.ensure_one()
+        Pallet = self.env['world.depot.inbound.order.product'].sudo()
+        PalletProduct = self.env['world.depot.inbound.order.products.pallet'].sudo()
+        changes = dict.fromkeys([
+            'pallets_created', 'pallets_updated', 'pallets_deleted',
+            'products_created', 'products_updated', 'products_deleted',
+        ], 0)
+
+        codes = list({product['product_id'] for pallet in pallets_data for product in pallet.get('products', [])})
+        product_ids = self._resolve_api_products(codes)
+
+        # Existing pallets grouped by pallet_no, oldest first, so duplicates pair up in order
+        existing = {}
+        for pallet in self.inbound_order_product_ids.sorted('id'):
+            existing.setdefault(pallet.pallet_no or '', []).append(pallet)
+
+        pallets_to_create = []
+        pallet_writes = {}
+        products_to_create = []
+        product_writes = {}
+        products_to_delete = PalletProduct
+
+        for pallet_data in pallets_data:
+            pallet_no = pallet_data.get('pallet_no') or ''
+            pallet_vals = {
+                'pallet_type': pallet_data.get('pallet_type') or '',
+                'pallet_no': pallet_no,
+                'pallets': pallet_data['pallets'],
+            }
+            incoming = {}
+            for product in pallet_data.get('products', []):
+                product_id = product_ids[product['product_id']]
+                incoming[product_id] = incoming.get(product_id, 0.0) + product['quantity']
+
+            candidates = existing.get(pallet_no)
+            if not candidates:
+                pallet_vals['inbound_order_id'] = self.id
+                pallet_vals['inbound_order_product_pallet_ids'] = [
+                    (0, 0, {'product_id': product_id, 'quantity': quantity})
+                    for product_id, quantity in incoming.items()
+                ]
+                pallets_to_create.append(pallet_vals)
+                changes['pallets_created'] += 1
+                changes['products_created'] += len(incoming)
+                continue
+
+            pallet = candidates.pop(0)
+            diff = {}
+            if (pallet.pallet_type or '') != pallet_vals['pallet_type']:
+                diff['pallet_type'] = pallet_vals['pallet_type']
+            if pallet.pallets != pallet_vals['pallets']:
+                diff['pallets'] = pallet_vals['pallets']
+            if diff:
+                key = tuple(sorted(diff.items()))
+                pallet_writes[key] = pallet_writes.get(key, Pallet) | pallet
+
+            pallet_changed = bool(diff)
+            for line in pallet.inbound_order_product_pallet_ids.sorted('id'):
+                quantity = incoming.pop(line.product_id.id, None)
+                if quantity is None:
+                    products_to_delete |= line
+                    pallet_changed = True
+                elif line.quantity != quantity:
+                    product_writes[quantity] = product_writes.get(quantity, PalletProduct) | line
+                    pallet_changed = True
+            for product_id, quantity in incoming.items():
+                products_to_create.append({
+                    'inbound_order_product_id': pallet.id,
+                    'product_id': product_id,
+                    'quantity': quantity,
+                })
+                pallet_changed = True
+            if pallet_changed:
+                changes['pallets_updated'] += 1
+
+        pallets_to_delete = Pallet.concat(*[pallet for pallets in existing.values() for pallet in pallets])
+
+        changes['products_created'] += len(products_to_create)
+        changes['products_updated'] = sum(len(lines) for lines in product_writes.values())
+        changes['products_deleted'] = len(products_to_delete)
+        changes['pallets_deleted'] = len(pallets_to_delete)
+
+        if pallets_to_delete:
+            pallets_to_delete.inbound_order_product_pallet_ids.unlink()
+            pallets_to_delete.product_serial_number_ids.unlink()
+            pallets_to_delete.unlink()
+        if products_to_delete:
+            products_to_delete.unlink()
+        for quantity, lines in product_writes.items():
+            lines.write({'quantity': quantity})
+        for diff, pallets in pallet_writes.items():
+            pallets.write(dict(diff))
+        if products_to_create:
+            PalletProduct.create(products_to_create)
+        if pallets_to_create:
+            Pallet.create(pallets_to_create)
+        return changes
+
+    def action_assign_putaway(self):
+        """Send every pallet of the receipt to a free bin.
+
+        Pallets still heading to the default destination of the receipt get one free bin each below
+        that destination, reserved bins of the project first and dangerous goods to ADR zones only.
+        Free bins come from the occupancy table kept by the cron; each candidate is checked against
+        the current stock and open move lines before it is claimed, and the SKIP LOCKED claim keeps
+        concurrent putaways apart.
+        """
+        Occupancy = self.env['world.depot.bin.occupancy']
+        MoveLine = self.env['stock.move.line']
+        assigned_count = unassigned_count = 0
+        for record in self:
+            picking = record.stock_picking_id
+            if not picking or picking.state in ('done', 'cancel'):
+                raise UserError(_("Inbound order %s has no open receipt to put away.") % record.billno)
+
+            lines = picking.move_line_ids.filtered(
+                lambda l: l.result_package_id and l.location_dest_id == picking.location_dest_id)
+            pallets = {}
+            for line in lines:
+                pallets[line.result_package_id.id] = pallets.get(line.result_package_id.id) or line.product_id.is_dg
+            if not pallets:
+                continue
+
+            assignment = Occupancy._assign_bins(picking.location_dest_id, record.project, list(pallets.items()))
+            assigned_count += len(assignment)
+            unassigned_count += len(pallets) - len(assignment)
+            if not assignment:
+                continue
+
+            # One write per bin, so the ORM overrides and tracking on the destination still run
+            lines_by_bin = defaultdict(lambda: MoveLine)
+            for line in lines:
+                bin_id = assignment.get(line.result_package_id.id)
+                if bin_id:
+                    lines_by_bin[bin_id] |= line
+            for bin_id, bin_lines in lines_by_bin.items():
+                bin_lines.write({'location_dest_id': bin_id})
+            _logger.info("Putaway of inbound order %s: %s pallets assigned", record.billno, len(assignment))
+
+        message = _("%s pallets assigned to a bin.") % assigned_count
+        if unassigned_count:
+            message += " " + _("No free bin found for %s pallets.") % unassigned_count
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Putaway'),
+                'message': message,
+                'type': 'warning' if unassigned_count else 'success',
+                'sticky': bool(unassigned_count),
+            }
+        }
+
     def action_view_stock_picking(self):
         """View the related stock picking."""
         self.ensure_one()
@@ -603,15 +813,14 @@ class InboundOrder(models.Model):
         action['context'] = {'create': False}
         return action
 
-    @api.depends('inbound_order_product_ids')
+    @api.depends('inbound_order_product_ids.pallets', 'inbound_order_product_ids.weight_total',
+                 'inbound_order_product_ids.is_inbound_handling')
     def _onchange_sum(self):
         """Update pallets field based on inbound order products."""
-        total_pallets = sum(
-            product.pallets for product in self.inbound_order_product_ids if product.is_inbound_handling)
-        weight_total = sum(
-            product.weight_total for product in self.inbound_order_product_ids if product.is_inbound_handling)
-        self.pallets = total_pallets
-        self.weight_total = weight_total
+        for record in self:
+            handled = record.inbound_order_product_ids.filtered('is_inbound_handling')
+            record.pallets = sum(handled.mapped('pallets'))
+            record.weight_total = sum(handled.mapped('weight_total'))
         # scanning_quantity = sum(product.quantity for product in self.inbound_order_product_ids if product.is_scanning)
         # self.scanning_quantity = scanning_quantity
         # self.is_adr = any(product.adr for product in self.inbound_order_product_ids)
@@ -772,7 +981,7 @@ class InboundOrderProduct(models.Model):
             else:
                 record.product_description = ''
 
-    @api.depends('inbound_order_product_pallet_ids')
+    @api.depends('pallets', 'inbound_order_product_pallet_ids.quantity', 'inbound_order_product_pallet_ids.weight')
     def _compute_quantity(self):
         """Compute the total quantity based on pallets and quantity."""
         for record in self:
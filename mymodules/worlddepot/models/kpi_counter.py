@@ -0,0 +1,105 @@
+import logging
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# KPI code -> query returning (project id, key, value) rows; %(today)s is the current date
+KPI_QUERIES = {
+    'inbound_state': """
+        SELECT project, state, COUNT(*) FROM world_depot_inbound_order GROUP BY project, state
+    """,
+    'inbound_status': """
+        SELECT project, status, COUNT(*) FROM world_depot_inbound_order
+         WHERE state != 'cancel' GROUP BY project, status
+    """,
+    'outbound_state': """
+        SELECT project, state, COUNT(*) FROM world_depot_outbound_order GROUP BY project, state
+    """,
+    'outbound_status': """
+        SELECT project, status, COUNT(*) FROM world_depot_outbound_order
+         WHERE state != 'cancel' GROUP BY project, status
+    """,
+    'pallets_on_hand': """
+        SELECT p.id, 'on_hand', COUNT(DISTINCT q.package_id)
+          FROM stock_quant q
+          JOIN stock_location l ON l.id = q.location_id AND l.usage = 'internal'
+          JOIN project_project p ON p.owner = q.owner_id
+         WHERE q.quantity > 0 AND q.package_id IS NOT NULL
+      GROUP BY p.id
+    """,
+    'today_pallets': """
+        SELECT project, 'inbound', SUM(pallets) FROM world_depot_inbound_order
+         WHERE state != 'cancel' AND i_date = %(today)s GROUP BY project
+        UNION ALL
+        SELECT project, 'outbound', SUM(pallets) FROM world_depot_outbound_order
+         WHERE state != 'cancel' AND "picking_Out_date"::date = %(today)s GROUP BY project
+    """,
+    # Milestones reached but not yet reported to the partner, for projects with an API user
+    'pending_sync': """
+        WITH api_projects AS (SELECT DISTINCT project FROM world_depot_api_user WHERE active AND project IS NOT NULL)
+        SELECT project, 'inbound_confirmed', COUNT(*) FROM world_depot_inbound_order
+         WHERE project IN (SELECT project FROM api_projects)
+           AND state = 'confirm' AND NOT COALESCE(set_status_to_confirmed, FALSE)
+      GROUP BY project
+        UNION ALL
+        SELECT project, 'inbound_result', COUNT(*) FROM world_depot_inbound_order
+         WHERE project IN (SELECT project FROM api_projects)
+           AND status = 'inbound' AND NOT COALESCE(set_inbound_result_sync, FALSE)
+      GROUP BY project
+        UNION ALL
+        SELECT project, 'outbound_confirmed', COUNT(*) FROM world_depot_outbound_order
+         WHERE project IN (SELECT project FROM api_projects)
+           AND state = 'confirm' AND NOT COALESCE(set_status_to_confirmed, FALSE)
+      GROUP BY project
+        UNION ALL
+        SELECT project, 'outbound_result', COUNT(*) FROM world_depot_outbound_order
+         WHERE project IN (SELECT project FROM api_projects)
+           AND status = 'outbound' AND NOT COALESCE(set_outbound_result_sync, FALSE)
+      GROUP BY project
+    """,
+}
+
+
+class KpiCounter(models.Model):
+    _name = 'world.depot.kpi.counter'
+    _description = 'World Depot KPI Counter'
+    _order = 'kpi, project, key'
+
+    kpi = fields.Char(string='KPI', required=True, index=True)
+    project = fields.Many2one('project.project', string='Project', ondelete='cascade')
+    key = fields.Char(string='Key')
+    value = fields.Float(string='Value')
+
+    _sql_constraints = [
+        ('kpi_project_key_uniq', 'unique(kpi, project, key)', 'KPI counters must be unique per project and key!'),
+    ]
+
+    @api.model
+    def _cron_refresh(self):
+        """Recompute all counters with one grouped query per KPI and replace the table content"""
+        params = {'today': fields.Date.context_today(self)}
+        rows = []
+        for kpi, query in KPI_QUERIES.items():
+            self.env.cr.execute(query, params)
+            rows.extend((kpi, project_id, key, value or 0.0) for project_id, key, value in self.env.cr.fetchall())
+
+        self.env.cr.execute(f"DELETE FROM {self._table}")
+        if rows:
+            values_sql = ", ".join(["(%s, %s, %s, %s, now() at time zone 'UTC')"] * len(rows))
+            self.env.cr.execute(
+                f"INSERT INTO {self._table} (kpi, project, key, value, write_date) VALUES {values_sql}",
+                [value for row in rows for value in row])
+        self.env.invalidate_all()
+        _logger.info("Refreshed %s KPI counters", len(rows))
+
+    @api.model
+    def _get_totals(self):
+        """KPI totals over all projects as {kpi: {key: value}}, one grouped read of the small counter table"""
+        self.env.cr.execute(f"SELECT kpi, key, SUM(value), MAX(write_date) FROM {self._table} GROUP BY kpi, key")
+        totals = {}
+        updated = False
+        for kpi, key, value, write_date in self.env.cr.fetchall():
+            totals.setdefault(kpi, {})[key] = value
+            updated = max(updated, write_date) if updated else write_date
+        totals['updated'] = updated
+        return totals
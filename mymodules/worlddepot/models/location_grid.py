@@ -0,0 +1,184 @@
+import logging
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+
+_logger = logging.getLogger(__name__)
+
+
+class LocationGrid(models.Model):
+    _name = 'world.depot.location.grid'
+    _description = 'Location Grid'
+    _order = 'name'
+
+    name = fields.Char(string='Name', required=True)
+    active = fields.Boolean(string='Active', default=True)
+    parent_location_id = fields.Many2one('stock.location', string='Hall', required=True, ondelete='cascade',
+                                         domain=[('usage', '=', 'internal')],
+                                         help='Location under which the aisles are created, e.g. SPN/Stock/LOODS10')
+    aisle_from = fields.Integer(string='Aisle From', default=1, required=True)
+    aisle_to = fields.Integer(string='Aisle To', default=1, required=True)
+    level_from = fields.Integer(string='Level From', default=1, required=True,
+                                help='Set both level bounds to 0 for a hall of aisles without levels')
+    level_to = fields.Integer(string='Level To', default=1, required=True)
+    digits = fields.Integer(string='Digits', default=2, required=True,
+                            help='Aisle and level numbers are zero padded to this width')
+    aisle_barcode_pattern = fields.Char(string='Aisle Barcode', default='{warehouse}-{hall}-{aisle}', required=True,
+                                        help='Available placeholders: {warehouse}, {hall}, {aisle}')
+    level_barcode_pattern = fields.Char(string='Bin Barcode', default='{warehouse}-{hall}-{aisle}-{level}',
+                                        required=True,
+                                        help='Available placeholders: {warehouse}, {hall}, {aisle}, {level}')
+    missing_aisle_count = fields.Integer(string='Missing Aisles', readonly=True)
+    missing_bin_count = fields.Integer(string='Missing Bins', readonly=True)
+    preview = fields.Text(string='Preview', readonly=True)
+
+    _sql_constraints = [
+        ('aisle_range', 'CHECK(aisle_from > 0 AND aisle_to >= aisle_from)', 'Aisle range is invalid!'),
+        ('level_range', 'CHECK((level_from = 0 AND level_to = 0) OR (level_from > 0 AND level_to >= level_from))',
+         'Level range is invalid!'),
+        ('digits_range', 'CHECK(digits > 0 AND digits < 10)', 'Digits must be between 1 and 9!'),
+    ]
+
+    @api.constrains('aisle_barcode_pattern', 'level_barcode_pattern')
+    def _check_barcode_patterns(self):
+        for record in self:
+            try:
+                record._format_barcode(record.aisle_barcode_pattern, '01')
+                record._format_barcode(record.level_barcode_pattern, '01', '01')
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValidationError(_("Invalid barcode pattern on grid %s: %s") % (record.name, e))
+
+    def _format_barcode(self, pattern, aisle, level=''):
+        return pattern.format(
+            warehouse=self.parent_location_id.warehouse_id.code or '',
+            hall=self.parent_location_id.name or '',
+            aisle=aisle,
+            level=level,
+        )
+
+    def _get_plan(self):
+        """Diff the grid against the existing locations.
+
+        Returns ``(aisles, bins, skipped_barcodes)``: ``aisles`` maps each aisle name to its existing
+        location id (or False when missing), ``bins`` lists the ``(aisle name, level name)`` to create.
+        Existing children are read in one query, archived ones included so they are never duplicated.
+        """
+        self.ensure_one()
+        aisle_names = [f"{i:0{self.digits}d}" for i in range(self.aisle_from, self.aisle_to + 1)]
+        # A level range of 0 - 0 means the aisles are the bins themselves
+        level_names = [f"{j:0{self.digits}d}" for j in range(self.level_from, self.level_to + 1) if j]
+
+        self.env['stock.location'].flush_model(['name', 'location_id'])
+        self.env.cr.execute("""
+            SELECT aisle.name, aisle.id, bin.name
+              FROM stock_location aisle
+         LEFT JOIN stock_location bin ON bin.location_id = aisle.id
+             WHERE aisle.location_id = %s AND aisle.name IN %s
+        """, [self.parent_location_id.id, tuple(aisle_names)])
+        aisles = dict.fromkeys(aisle_names, False)
+        existing_bins = set()
+        for aisle_name, aisle_id, bin_name in self.env.cr.fetchall():
+            aisles[aisle_name] = aisle_id
+            if bin_name:
+                existing_bins.add((aisle_name, bin_name))
+
+        bins = [(a, lv) for a in aisle_names for lv in level_names if (a, lv) not in existing_bins]
+
+        # Barcodes are unique per company, leave the barcode empty rather than failing on a clash
+        barcodes = [self._format_barcode(self.aisle_barcode_pattern, a) for a, loc_id in aisles.items() if not loc_id]
+        barcodes += [self._format_barcode(self.level_barcode_pattern, a, lv) for a, lv in bins]
+        skipped_barcodes = set()
+        if barcodes:
+            skipped_barcodes = set(self.env['stock.location'].with_context(active_test=False).search(
+                [('barcode', 'in', barcodes)]).mapped('barcode'))
+        return aisles, bins, skipped_barcodes
+
+    def action_preview(self):
+        """Dry run: report what would be created without creating anything"""
+        for record in self:
+            aisles, bins, skipped_barcodes = record._get_plan()
+            missing_aisles = [name for name, loc_id in aisles.items() if not loc_id]
+            lines = [
+                _("%(aisles)s aisles and %(bins)s bins to create under %(hall)s.",
+                  aisles=len(missing_aisles), bins=len(bins), hall=record.parent_location_id.complete_name),
+            ]
+            if missing_aisles:
+                lines.append(_("Aisles: %s") % ', '.join(missing_aisles))
+            if bins:
+                lines.append(_("Bins: %s") % ', '.join(f"{a}/{lv}" for a, lv in bins[:50]))
+                if len(bins) > 50:
+                    lines.append(_("... and %s more") % (len(bins) - 50))
+            if skipped_barcodes:
+                lines.append(_("Barcodes already in use, left empty: %s") % ', '.join(sorted(skipped_barcodes)))
+            record.write({
+                'missing_aisle_count': len(missing_aisles),
+                'missing_bin_count': len(bins),
+                'preview': '\n'.join(lines),
+            })
+
+    def action_generate(self):
+        """Create the missing aisles and bins, one bulk create per level"""
+        Location = self.env['stock.location']
+        for record in self:
+            aisles, bins, skipped_barcodes = record._get_plan()
+            parent = record.parent_location_id
+
+            def barcode(pattern, *names):
+                value = record._format_barcode(pattern, *names)
+                return False if value in skipped_barcodes else value
+
+            missing_aisles = [name for name, loc_id in aisles.items() if not loc_id]
+            if missing_aisles:
+                created = Location.create([{
+                    'name': name,
+                    'location_id': parent.id,
+                    'barcode': barcode(record.aisle_barcode_pattern, name),
+                    'usage': 'internal',
+                } for name in missing_aisles])
+                aisles.update(zip(missing_aisles, created.ids))
+
+            if bins:
+                Location.create([{
+                    'name': level,
+                    'location_id': aisles[aisle],
+                    'barcode': barcode(record.level_barcode_pattern, aisle, level),
+                    'usage': 'internal',
+                } for aisle, level in bins])
+
+            _logger.info("Location grid %s: created %s aisles and %s bins",
+                         record.name, len(missing_aisles), len(bins))
+            record.write({
+                'missing_aisle_count': 0,
+                'missing_bin_count': 0,
+                'preview': _("%(aisles)s aisles and %(bins)s bins created.",
+                             aisles=len(missing_aisles), bins=len(bins)),
+            })
+        return True
+
+    @api.model
+    def _create_default_grids(self):
+        """Grids of the halls generated by the former hard coded crons, for the halls that exist"""
+        defaults = [
+            ('LOODS10', 'SPN/Stock/LOODS10', 1, 40, 1, 15),
+            # Bonded hall, aisles only
+            ('LOODS14', 'SPN/Stock/LOODS14', 37, 72, 0, 0),
+        ]
+        Location = self.env['stock.location']
+        for name, complete_name, aisle_from, aisle_to, level_from, level_to in defaults:
+            hall = Location.search([('complete_name', '=', complete_name)], limit=1)
+            if not hall or self.with_context(active_test=False).search_count([('parent_location_id', '=', hall.id)]):
+                continue
+            self.create({
+                'name': name,
+                'parent_location_id': hall.id,
+                'aisle_from': aisle_from,
+                'aisle_to': aisle_to,
+                'level_from': level_from,
+                'level_to': level_to,
+                'aisle_barcode_pattern': 'SPN-{hall}-{aisle}',
+                'level_barcode_pattern': 'SPN-{hall}-{aisle}-{level}',
+            })
+
+    @api.model
+    def _cron_generate(self):
+        """Complete all active grids"""
+        self.search([]).action_generate()
@@ -0,0 +1,51 @@
+import logging
+from datetime import timedelta
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+
+class DepotAPIIdempotency(models.Model):
+    _name = 'world.depot.api.idempotency'
+    _description = 'API Idempotency Keys'
+    _order = 'id desc'
+
+    # Keys older than this are purged by the cron job
+    _retention_days = 7
+
+    api_user_id = fields.Many2one('world.depot.api.user', string='API User', required=True, ondelete='cascade')
+    key = fields.Char(string='Idempotency Key', required=True, help='Value of the Idempotency-Key request header')
+    request_path = fields.Char(string='Request Path')
+    request_hash = fields.Char(string='Request Hash', help='SHA-256 of the request body the key was first used with')
+    response_data = fields.Text(string='Response Data', help='JSON response returned for the first request')
+
+    _sql_constraints = [
+        ('api_user_key_uniq', 'unique(api_user_id, key)', 'Idempotency key must be unique per API user!'),
+    ]
+
+    @api.model
+    def _claim(self, api_user_id, key, request_path, request_hash):
+        """Reserve an idempotency key for the current transaction.
+
+        Returns ``(record, True)`` when the key was inserted by this call, or the already stored
+        record and ``False`` otherwise. A concurrent request holding the same key makes the insert
+        wait until that transaction finishes, so a retry never runs the create path twice.
+        """
+        self.env.cr.execute("""
+            INSERT INTO world_depot_api_idempotency
+                   (api_user_id, key, request_path, request_hash, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+            ON CONFLICT (api_user_id, key) DO NOTHING
+            RETURNING id
+        """, (api_user_id, key, request_path, request_hash, self.env.uid, self.env.uid))
+        row = self.env.cr.fetchone()
+        if row:
+            return self.browse(row[0]), True
+        return self.search([('api_user_id', '=', api_user_id), ('key', '=', key)], limit=1), False
+
+    @api.model
+    def _cron_purge_expired(self):
+        """Remove idempotency keys past the retention window"""
+        limit = fields.Datetime.now() - timedelta(days=self._retention_days)
+        self.env.cr.execute("DELETE FROM world_depot_api_idempotency WHERE create_date < %s", (limit,))
+        _logger.info("Purged %s expired idempotency keys", self.env.cr.rowcount)
@@ -1,11 +1,24 @@
+import hashlib
+import hmac
 import logging
+import secrets
+import threading
+import time
 import uuid
+from datetime import timedelta
 from passlib.context import CryptContext
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
 
 _logger = logging.getLogger(__name__)
 
+# Successful secret verifications are remembered for this many seconds to skip repeated bcrypt checks
+_VERIFY_CACHE_TTL = 300
+# Per-process key so cached digests are useless outside this worker
+_VERIFY_CACHE_KEY = secrets.token_bytes(32)
+_verify_cache = {}  # digest -> (api_user_id, hashed_secret, expiry)
+_verify_cache_lock = threading.Lock()
+
 
 class DepotAPIUser(models.Model):
     _name = 'world.depot.api.user'
@@ -39,9 +52,22 @@ class DepotAPIUser(models.Model):
 
     project = fields.Many2one('project.project', string='Project')
 
+    # Admission control, enforced per worker process by validate_token (0 disables the limit)
+    rate_limit = fields.Float(string='Rate Limit (req/s)', default=0.0,
+                              help="Sustained number of requests per second allowed for this API user, "
+                                   "per HTTP worker: with N workers the user can reach N times this rate. "
+                                   "0 disables the limit.")
+    rate_limit_burst = fields.Integer(string='Burst Size', default=10,
+                                      help="Number of requests that may be sent at once before throttling, "
+                                           "per HTTP worker")
+    max_concurrent_requests = fields.Integer(string='Max Concurrent Requests', default=0,
+                                             help="Maximum number of requests processed at the same time, "
+                                                  "per HTTP worker. 0 disables the limit.")
 
     _sql_constraints = [
         ('api_key_uniq', 'unique(api_key)', 'API Key must be unique!'),
+        ('rate_limit_positive', 'CHECK(rate_limit >= 0 AND rate_limit_burst >= 0 AND max_concurrent_requests >= 0)',
+         'Rate limits cannot be negative!'),
     ]
 
     @api.model
@@ -96,6 +122,37 @@ class DepotAPIUser(models.Model):
             return False
         return self._crypt_context.verify(secret, self.hashed_secret)
 
+    @api.model
+    def authenticate(self, api_key, secret):
+        """Return the active API user matching the credentials, or an empty recordset.
+
+        Successful verifications are cached in memory for a few minutes, keyed by an HMAC of the
+        credentials. A cached entry is only honoured while the stored hash is unchanged, so
+        resetting the secret or archiving the user takes effect immediately.
+        """
+        if not api_key or not secret:
+            return self.browse()
+        digest = hmac.new(_VERIFY_CACHE_KEY, f'{api_key}\0{secret}'.encode(), hashlib.sha256).digest()
+        now = time.monotonic()
+
+        with _verify_cache_lock:
+            cached = _verify_cache.get(digest)
+        if cached and cached[2] > now:
+            api_user = self.browse(cached[0]).exists()
+            if api_user and api_user.active and api_user.api_key == api_key \
+                    and api_user.hashed_secret == cached[1]:
+                return api_user
+
+        api_user = self.search([('api_key', '=', api_key), ('active', '=', True)], limit=1)
+        if not api_user or not api_user.verify_secret(secret):
+            return self.browse()
+
+        with _verify_cache_lock:
+            for key in [k for k, v in _verify_cache.items() if v[2] <= now]:
+                del _verify_cache[key]
+            _verify_cache[digest] = (api_user.id, api_user.hashed_secret, now + _VERIFY_CACHE_TTL)
+        return api_user
+
     @api.constrains('hashed_secret')
     def _check_secret_strength(self):
         """Verify secret is properly hashed"""
@@ -108,12 +165,76 @@ class DepotAPIToken(models.Model):
     _name = 'world.depot.api.token'
     _description = 'API Access Tokens'
 
+    # Token lifetimes in seconds
+    _token_lifetime = 3600
+    _refresh_lifetime = 7 * 24 * 3600
+    # An existing token is handed out again only if it stays valid at least this long
+    _min_reuse_lifetime = 900
+
     user_id = fields.Many2one('res.users', string='User', required=True)
     token = fields.Char(string='Access Token', required=True, index=True)
     expires = fields.Datetime(string='Expiration', required=True)
+    refresh_token = fields.Char(string='Refresh Token', index=True)
+    refresh_expires = fields.Datetime(string='Refresh Expiration')
+
+    @api.model
+    def _issue_token(self, user):
+        """Return a valid token for the user, reusing the latest one when it lives long enough"""
+        now = fields.Datetime.now()
+        token_rec = self.search([
+            ('user_id', '=', user.id),
+            ('expires', '>', now + timedelta(seconds=self._min_reuse_lifetime)),
+        ], order='expires desc', limit=1)
+        if not token_rec:
+            token_rec = self._create_token(user)
+        return token_rec._get_token_response()
+
+    @api.model
+    def _create_token(self, user):
+        now = fields.Datetime.now()
+        return self.create({
+            'user_id': user.id,
+            'token': secrets.token_urlsafe(32),
+            'expires': now + timedelta(seconds=self._token_lifetime),
+            'refresh_token': secrets.token_urlsafe(32),
+            'refresh_expires': now + timedelta(seconds=self._refresh_lifetime),
+        })
+
+    @api.model
+    def _refresh(self, refresh_token):
+        """Exchange a refresh token for a new token pair.
+
+        Only the refresh token is revoked. The access token may be shared with other clients of
+        the same user through ``_issue_token``, so it stays valid until it expires. Returns False
+        when the refresh token is unknown or expired.
+        """
+        if not refresh_token:
+            return False
+        token_rec = self.search([
+            ('refresh_token', '=', refresh_token),
+            ('refresh_expires', '>', fields.Datetime.now()),
+        ], limit=1)
+        if not token_rec:
+            return False
+        token_rec.write({'refresh_token': False, 'refresh_expires': False})
+        return self._create_token(token_rec.user_id)._get_token_response()
+
+    def _get_token_response(self):
+        self.ensure_one()
+        return {
+            'access_token': self.token,
+            'expires_in': max(int((self.expires - fields.Datetime.now()).total_seconds()), 0),
+            'expires_at': self.expires.strftime('%Y-%m-%d %H:%M:%S'),
+            'refresh_token': self.refresh_token,
+            'refresh_expires_at': self.refresh_expires.strftime('%Y-%m-%d %H:%M:%S') if self.refresh_expires else False,
+        }
 
     @api.model
     def _cron_clean_expired_tokens(self):
         """Remove expired tokens hourly"""
-        expired = self.search([('expires', '<', fields.Datetime.now())])
+        now = fields.Datetime.now()
+        expired = self.search([
+            ('expires', '<', now),
+            '|', ('refresh_expires', '=', False), ('refresh_expires', '<', now),
+        ])
         expired.unlink()
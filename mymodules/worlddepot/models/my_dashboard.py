@@ -1,4 +1,5 @@
-from odoo import models, fields, api
+from markupsafe import Markup, escape
+from odoo import models, fields, api, _
 
 
 class WorldDepotDashboard(models.TransientModel):
@@ -7,17 +8,78 @@ class WorldDepotDashboard(models.TransientModel):
 
     inbound_count = fields.Integer(string="Inbound Count")
     outbound_count = fields.Integer(string="Outbound Count")
+    inbound_planning_count = fields.Integer(string="Inbound Planning")
+    inbound_arrived_count = fields.Integer(string="Inbound Arrived")
+    outbound_planning_count = fields.Integer(string="Outbound Planning")
+    outbound_picking_count = fields.Integer(string="Outbound Picking")
+    pallets_on_hand = fields.Integer(string="Pallets on Hand")
+    today_inbound_pallets = fields.Float(string="Inbound Pallets Today")
+    today_outbound_pallets = fields.Float(string="Outbound Pallets Today")
+    pending_sync_count = fields.Integer(string="Pending Partner Syncs")
+    kpi_updated = fields.Datetime(string="Updated At")
+    project_kpi_html = fields.Html(string="Per Project", sanitize=False)
 
     @api.model
     def default_get(self, fields):
-        """Compute counts dynamically when the dashboard is opened"""
+        """Read the KPI counters maintained by the refresh cron"""
         res = super(WorldDepotDashboard, self).default_get(fields)
+        totals = self.env['world.depot.kpi.counter'].sudo()._get_totals()
+        inbound_status = totals.get('inbound_status', {})
+        outbound_status = totals.get('outbound_status', {})
+        today_pallets = totals.get('today_pallets', {})
         res.update({
-            'inbound_count': self.env['world.depot.inbound.order'].search_count([]),
-            'outbound_count': self.env['world.depot.outbound.order'].search_count([]),
+            'inbound_count': sum(totals.get('inbound_state', {}).values()),
+            'outbound_count': sum(totals.get('outbound_state', {}).values()),
+            'inbound_planning_count': inbound_status.get('planning', 0),
+            'inbound_arrived_count': inbound_status.get('arrive', 0),
+            'outbound_planning_count': outbound_status.get('planning', 0),
+            'outbound_picking_count': outbound_status.get('picking', 0),
+            'pallets_on_hand': totals.get('pallets_on_hand', {}).get('on_hand', 0),
+            'today_inbound_pallets': today_pallets.get('inbound', 0.0),
+            'today_outbound_pallets': today_pallets.get('outbound', 0.0),
+            'pending_sync_count': sum(totals.get('pending_sync', {}).values()),
+            'kpi_updated': totals.get('updated') or False,
+            'project_kpi_html': self._get_project_kpi_html(),
         })
         return res
 
+    @api.model
+    def _get_project_kpi_html(self):
+        """Per project table of the main counters"""
+        columns = [
+            ('inbound_status', 'planning', _('Inbound Planning')),
+            ('inbound_status', 'arrive', _('Inbound Arrived')),
+            ('outbound_status', 'planning', _('Outbound Planning')),
+            ('outbound_status', 'picking', _('Outbound Picking')),
+            ('pallets_on_hand', 'on_hand', _('Pallets on Hand')),
+            ('today_pallets', 'inbound', _('Inbound Today')),
+            ('today_pallets', 'outbound', _('Outbound Today')),
+            ('pending_sync', None, _('Pending Syncs')),
+        ]
+        values = {}
+        for counter in self.env['world.depot.kpi.counter'].sudo().search([('project', '!=', False)]):
+            project_values = values.setdefault(counter.project, {})
+            for kpi, key, _label in columns:
+                if counter.kpi == kpi and (key is None or counter.key == key):
+                    project_values[(kpi, key)] = project_values.get((kpi, key), 0) + counter.value
+        if not values:
+            return False
+
+        header = ''.join(f'<th class="text-end">{escape(label)}</th>' for _kpi, _key, label in columns)
+        rows = []
+        for project in sorted(values, key=lambda p: p.name or ''):
+            cells = ''.join(
+                f'<td class="text-end">{values[project].get((kpi, key), 0):g}</td>' for kpi, key, _label in columns)
+            rows.append(f'<tr><td>{escape(project.name or "")}</td>{cells}</tr>')
+        return Markup(
+            f'<table class="table table-sm table-striped"><thead><tr><th>{escape(_("Project"))}</th>{header}</tr></thead>'
+            f'<tbody>{"".join(rows)}</tbody></table>'
+        )
+
+    def action_refresh_kpi(self):
+        self.env['world.depot.kpi.counter'].sudo()._cron_refresh()
+        return self.env['ir.actions.act_window']._for_xml_id('worlddepot.action_world_depot_dashboard')
+
     def action_open_inbound(self):
         return self._get_action('world.depot.inbound.order', 'Inbound Order')
 
@@ -33,4 +95,4 @@ class WorldDepotDashboard(models.TransientModel):
             'view_mode': 'list,form',
             'domain': [],
             'context': self.env.context,
-        }
\ No newline at end of file
+        }
@@ -1,3 +1,4 @@
+import base64
 from odoo import _, models, fields, api
 from odoo.exceptions import ValidationError
 
@@ -12,6 +13,13 @@ class ExcelTemplate(models.Model):
         required=True,
         help='Specify whether the template is for inbound or outbound operations.'
     )
+    report = fields.Selection(
+        selection=[('cmr', 'CMR'), ('packing_list', 'Packing List'), ('pallet_list', 'Pallet List')],
+        string='Document',
+        required=True,
+        default='cmr',
+        help='Document generated with this template.'
+    )
     project = fields.Many2one(
         'project.project',
         string='Project',
@@ -31,16 +39,38 @@ class ExcelTemplate(models.Model):
         string='Template File Name',
         help='The name of the uploaded template file.'
     )
+    repeat_row = fields.Integer(
+        string='Repeat Row',
+        default=0,
+        help='Row repeated once per line. Leave 0 to use the row holding the {{ line.x }} placeholders.'
+    )
 
-    @api.constrains('type', 'project')
+    @api.constrains('type', 'report', 'project')
     def _check_type_and_project(self):
-        """Ensure the combination of type and project is unique."""
+        """Ensure the combination of type, document and project is unique."""
         for record in self:
             if self.search_count([
                 ('type', '=', record.type),
-                ('project', '=', record.project),
+                ('report', '=', record.report),
+                ('project', '=', record.project.id),
                 ('id', '!=', record.id)
             ]):
                 raise ValidationError(
-                    _('The combination of Type and Project must be unique. Please choose a different combination.')
-                )
\ No newline at end of file
+                    _('The combination of Type, Document and Project must be unique. Please choose a different combination.')
+                )
+
+    @api.model
+    def _get_template(self, project, type, report):
+        return self.search([('project', '=', project.id), ('type', '=', type), ('report', '=', report)], limit=1)
+
+    def _get_compiled(self):
+        """Compiled form of the template, parsed once per worker until the record is written"""
+        self.ensure_one()
+        return self.env['world.depot.excel.template.registry']._get_compiled(
+            (self._name, self.id), self.write_date,
+            lambda: base64.b64decode(self.sudo().template_file), self.repeat_row)
+
+    def render(self, data, first_column=1):
+        """Render the template with ``data`` and return the xlsx file content"""
+        self.ensure_one()
+        return self.env['world.depot.excel.template.registry'].render(self._get_compiled(), data, first_column)
@@ -1,102 +1,67 @@
+import re
 from odoo import api, fields, models, _
 
+# Numbers in a location barcode or name, e.g. SPN-LOODS10-07-03 -> hall 10, aisle 7, level 3
+PICK_PATH_NUMBERS_RE = re.compile(r'\d+')
+
 
 class StockLocation(models.Model):
     _inherit = "stock.location"
 
-    from odoo import api, fields, models, _
-
-    class StockLocation(models.Model):
-        _inherit = "stock.location"
-
-        @api.model
-        def cron_auto_generate_locations(self):
-            """
-            Cron job to automatically generate locations based on the configured rules.
-            This method can be scheduled to run periodically.
-            """
-            # Fixed configuration values
-            parent_location_name = 'LOODS10'
-            parent_complete_name = 'SPN/Stock/LOODS10'
-
-            # Find parent location
-            parent_location = self.search([('complete_name', '=', parent_complete_name)], limit=1)
-            if not parent_location:
-                return  # Exit if parent location doesn't exist
-
-            # Generate first level locations (01)
-            for i in range(1, 41):  # Only creates location "01"
-                loc_name = f"{i:02d}"  # Format as 2-digit string (01)
-                # Build complete name without storing it permanently
-                level1_complete_name = f"{parent_complete_name}/{loc_name}"
-
-                # Find or create first-level location
-                level1_location = self.search([
-                    ('name', '=', loc_name),
-                    ('location_id', '=', parent_location.id)
-                ], limit=1)
-
-                if not level1_location:
-                    level1_location = self.create({
-                        'name': loc_name,
-                        'location_id': parent_location.id,
-                        'barcode': f"SPN-{parent_location_name}-{loc_name}",
-                        'usage': 'internal',
-                        'active': True,
-                    })
-
-                # Generate second level locations (01/01 and 01/02)
-                for j in range(1, 16):  # Creates locations "01" and "02"
-                    child_name = f"{j:02d}"  # Format as 2-digit string
-                    # Build complete name dynamically
-                    child_complete_name = f"{level1_complete_name}/{child_name}"
-
-                    # Check if child exists
-                    if not self.search([
-                        ('name', '=', child_name),
-                        ('location_id', '=', level1_location.id)
-                    ], limit=1):
-                        self.create({
-                            'name': child_name,
-                            'location_id': level1_location.id,
-                            'barcode': f"SPN-{parent_location_name}-{loc_name}-{child_name}",
-                            'usage': 'internal',
-                            'active': True,
-                        })
-
-        @api.model
-        def cron_auto_generate_locations_bond(self):
-            """
-            Cron job to automatically generate locations based on the configured rules.
-            This method can be scheduled to run periodically.
-            """
-            # Fixed configuration values
-            parent_location_name = 'LOODS14'
-            parent_complete_name = 'SPN/Stock/LOODS14'
-
-            # Find parent location
-            parent_location = self.search([('complete_name', '=', parent_complete_name)], limit=1)
-            if not parent_location:
-                return  # Exit if parent location doesn't exist
-
-            # Generate first level locations (01)
-            for i in range(37, 73):  # Only creates location "01"
-                loc_name = f"{i:02d}"  # Format as 2-digit string (01)
-                # Build complete name without storing it permanently
-                level1_complete_name = f"{parent_complete_name}/{loc_name}"
-
-                # Find or create first-level location
-                level1_location = self.search([
-                    ('name', '=', loc_name),
-                    ('location_id', '=', parent_location.id)
-                ], limit=1)
-
-                if not level1_location:
-                    level1_location = self.create({
-                        'name': loc_name,
-                        'location_id': parent_location.id,
-                        'barcode': f"SPN-{parent_location_name}-{loc_name}",
-                        'usage': 'internal',
-                        'active': True,
-                    })
-
+    is_adr_zone = fields.Boolean(string='ADR Zone',
+                                 help='Dangerous goods may be put away here. Applies to all sublocations.')
+    putaway_project_id = fields.Many2one('project.project', string='Reserved for Project',
+                                         help='Putaway only sends pallets of this project here. '
+                                              'Applies to the bins of an aisle when set on the aisle.')
+    pick_hall = fields.Integer(string='Hall No.', compute='_compute_pick_path', store=True)
+    pick_aisle = fields.Integer(string='Aisle No.', compute='_compute_pick_path', store=True)
+    pick_level = fields.Integer(string='Level No.', compute='_compute_pick_path', store=True)
+    pick_sequence = fields.Integer(string='Pick Sequence', compute='_compute_pick_path', store=True, index=True,
+                                   help='Position on a serpentine route: halls and aisles ascending, '
+                                        'levels ascending in odd aisles and descending in even aisles')
+
+    @api.depends('complete_name', 'barcode')
+    def _compute_pick_path(self):
+        for location in self:
+            numbers = PICK_PATH_NUMBERS_RE.findall(location.barcode or '') \
+                or PICK_PATH_NUMBERS_RE.findall(location.complete_name or '')
+            hall, aisle, level = [min(int(n), 999) for n in numbers[:3]] + [0] * (3 - len(numbers[:3]))
+            location.pick_hall = hall
+            location.pick_aisle = aisle
+            location.pick_level = level
+            location.pick_sequence = hall * 1000000 + aisle * 1000 + (level if aisle % 2 else 999 - level)
+
+    def _get_pick_path_ranks(self):
+        """Rank of each location of ``self`` on one serpentine route through them.
+
+        Only the aisles actually visited alternate direction, so skipping an aisle does not send
+        the picker back to the far end. Returns a dict location id -> rank.
+        """
+        reverse = {}
+        previous_hall = None
+        for hall, aisle in sorted({(location.pick_hall, location.pick_aisle) for location in self}):
+            if hall != previous_hall:
+                previous_hall, flip = hall, False
+            reverse[(hall, aisle)] = flip
+            flip = not flip
+
+        def key(location):
+            level = location.pick_level
+            if reverse[(location.pick_hall, location.pick_aisle)]:
+                level = -level
+            return location.pick_hall, location.pick_aisle, level, location.complete_name or ''
+
+        return {location.id: rank for rank, location in enumerate(sorted(self, key=key))}
+
+    @api.model
+    def cron_auto_generate_locations(self):
+        """
+        Cron job to automatically generate locations.
+        The halls, aisle and level ranges and barcodes are configured as location grids.
+        """
+        self.env['world.depot.location.grid']._cron_generate()
+
+    @api.model
+    def cron_auto_generate_locations_bond(self):
+        """Kept for existing scheduled actions, all grids are generated by cron_auto_generate_locations."""
+        self.cron_auto_generate_locations()
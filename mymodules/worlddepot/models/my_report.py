@@ -1,74 +1,108 @@
 # -*- coding: utf-8 -*-
+import logging
+import random
+import time
+from urllib.parse import urlencode
+
 from odoo import http
 from odoo.http import request
-import logging
 
 _logger = logging.getLogger(__name__)
 
+# Grouped rows shown per page
+PAGE_SIZE = 80
+# Share of requests whose timing is logged at debug level
+TIMING_SAMPLE_RATE = 0.05
+# Suggestions returned by the autocomplete endpoints
+AUTOCOMPLETE_LIMIT = 20
 
-class StockReportController(http.Controller):
-    @http.route('/my/stock_report', type='http', auth='user', website=True)
-    def stock_report(self, **kwargs):
-        """Render the stock report with dynamic filters."""
-        user = request.env.user
+# Filter parameter -> (model, extra name_search domain) used by the autocomplete endpoints
+FILTER_MODELS = {
+    'warehouse_id': ('stock.warehouse', []),
+    'location_id': ('stock.location', [('usage', '=', 'internal')]),
+    'product_id': ('product.product', [('is_storable', '=', True)]),
+    'owner_id': ('res.partner', []),
+}
 
-        # Fetch filter values from the request
-        warehouse_id = kwargs.get('warehouse_id')
-        location_id = kwargs.get('location_id')
-        product_id = kwargs.get('product_id')
 
-        # Build the domain based on filters
-        domain = [('location_id.usage', '=', 'internal')]
-        if warehouse_id:
-            domain.append(('location_id.warehouse_id', '=', int(warehouse_id)))
-        if location_id:
-            domain.append(('location_id', '=', int(location_id)))
-        if product_id:
-            domain.append(('product_id', '=', int(product_id)))
-
-        # Fetch filtered stock.quant records
-        stock_quants = request.env['stock.quant'].search(domain)
-
-        # Log fetched records for debugging
-        _logger.info(
-            f"Filtered Stock Quant Records: {[(quant.product_id.name, quant.location_id.name) for quant in stock_quants]}")
-
-        # Fetch options for filters
-        warehouses = request.env['stock.warehouse'].search([])
-        locations = request.env['stock.location'].search([])
-        products = request.env['product.product'].search([])
-
-        return request.render('worlddepot.template_stock_report', {
-            'stock_quants': stock_quants,
-            'warehouses': warehouses,
-            'locations': locations,
-            'products': products,
-            'selected_warehouse': warehouse_id,
-            'selected_location': location_id,
-            'selected_product': product_id,
-        })
+def _to_int(value):
+    try:
+        return int(value) if value else False
+    except (TypeError, ValueError):
+        return False
 
-    @http.route('/my/stock_report_1', type='http', auth='user', website=True)
-    def stock_report_(self, **kwargs):
-        """Render the stock report tree view."""
-        user = request.env.user
 
-        # Build the domain based on filters
-        domain = []
+class StockReportController(http.Controller):
 
-        # Fetch filtered stock.quant records
-        stock_quants = request.env['stock.quant'].search(domain)
+    def _get_filters(self, kwargs):
+        return {name: _to_int(kwargs.get(name)) for name in FILTER_MODELS}
 
-        # Log fetched records for debugging
-        _logger.info(
-            f"Filtered Stock Quant Records: {[(quant.product_id.name, quant.location_id.name) for quant in stock_quants]}")
+    def _get_domain(self, filters):
+        domain = [('location_id.usage', '=', 'internal')]
+        if filters['warehouse_id']:
+            domain.append(('location_id.warehouse_id', '=', filters['warehouse_id']))
+        if filters['location_id']:
+            domain.append(('location_id', '=', filters['location_id']))
+        if filters['product_id']:
+            domain.append(('product_id', '=', filters['product_id']))
+        if filters['owner_id']:
+            domain.append(('owner_id', '=', filters['owner_id']))
+        return domain
 
-        # Render the tree view dynamically
-        tree_view = request.env['ir.ui.view'].render('worlddepot.view_stock_quant_tree_my', {
-            'stock_quants': stock_quants,
+    @http.route('/my/stock_report', type='http', auth='user', website=True)
+    def stock_report(self, page=1, **kwargs):
+        """Render the stock report aggregated by product, location and owner, one page at a time."""
+        timed = _logger.isEnabledFor(logging.DEBUG) and random.random() < TIMING_SAMPLE_RATE
+        started = time.perf_counter()
+
+        filters = self._get_filters(kwargs)
+        page = max(_to_int(page) or 1, 1)
+
+        # One extra group tells whether a next page exists without counting all groups
+        groups = request.env['stock.quant'].read_group(
+            self._get_domain(filters),
+            ['quantity:sum', 'reserved_quantity:sum'],
+            ['product_id', 'location_id', 'owner_id'],
+            offset=(page - 1) * PAGE_SIZE,
+            limit=PAGE_SIZE + 1,
+            orderby='product_id, location_id, owner_id',
+            lazy=False,
+        )
+        has_next = len(groups) > PAGE_SIZE
+        groups = groups[:PAGE_SIZE]
+
+        # Labels of the selected filters, the options themselves come from the autocomplete endpoints
+        selected = {}
+        for name, (model, _domain) in FILTER_MODELS.items():
+            if filters[name]:
+                record = request.env[model].browse(filters[name]).exists()
+                selected[name] = {'id': record.id, 'text': record.display_name} if record else False
+
+        params = {name: value for name, value in filters.items() if value}
+        response = request.render('worlddepot.template_stock_report', {
+            'groups': groups,
+            'selected': selected,
+            'page': page,
+            'prev_url': page > 1 and '/my/stock_report?%s' % urlencode(dict(params, page=page - 1)),
+            'next_url': has_next and '/my/stock_report?%s' % urlencode(dict(params, page=page + 1)),
         })
 
-        return tree_view
+        if timed:
+            _logger.debug("Stock report page %s with %s groups built in %.1f ms (filters %s)",
+                          page, len(groups), (time.perf_counter() - started) * 1000, params)
+        return response
+
+    @http.route('/my/stock_report/autocomplete/<string:field_name>', type='json', auth='user')
+    def stock_report_autocomplete(self, field_name, term='', limit=AUTOCOMPLETE_LIMIT):
+        """Suggestions for one report filter as a list of ``{'id', 'text'}``."""
+        if field_name not in FILTER_MODELS:
+            return []
+        model, domain = FILTER_MODELS[field_name]
+        limit = min(_to_int(limit) or AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_LIMIT)
+        return [
+            {'id': record_id, 'text': name}
+            for record_id, name in request.env[model].name_search(term or '', domain, limit=limit)
+        ]
 
     @http.route('/my/stock_report_2', type='http', auth='user', website=True)
     def stock_report_2(self, **kwargs):
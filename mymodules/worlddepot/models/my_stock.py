@@ -1,6 +1,7 @@
+from collections import defaultdict
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
-from odoo.tools import float_is_zero, float_compare
+from odoo.tools import float_is_zero, float_compare, float_round
 
 
 class StockRoute(models.Model):
@@ -39,6 +40,32 @@ class StockLocation(models.Model):
         return super(StockLocation, self)._get_removal_strategy_order(removal_strategy)
 
 
+class StockQuant(models.Model):
+    _inherit = 'stock.quant'
+
+    # Changes of these fields move stock between available to promise rows
+    _atp_fields = {'product_id', 'package_id', 'location_id', 'owner_id', 'quantity'}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        quants = super().create(vals_list)
+        quants._schedule_atp_refresh()
+        return quants
+
+    def write(self, vals):
+        if not self._atp_fields.intersection(vals):
+            return super().write(vals)
+        # Both the pallets the quants leave and the ones they go to
+        self._schedule_atp_refresh()
+        res = super().write(vals)
+        self._schedule_atp_refresh()
+        return res
+
+    def _schedule_atp_refresh(self):
+        self.env['world.depot.stock.atp']._schedule_refresh(
+            {(quant.product_id.id, quant.package_id.id) for quant in self})
+
+
 class StockMove(models.Model):
     _inherit = 'stock.move'
 
@@ -51,25 +78,50 @@ class StockMove(models.Model):
     )
     outbound_order_product_id = fields.Integer('Outbound Order ProductID')
     
+    # Merge suppression flags, stored so merge decisions do not walk routes and origin pickings
+    auto_merge_disabled = fields.Boolean(
+        string='Auto Merge Disabled',
+        compute='_compute_auto_merge_disabled',
+        store=True,
+        index=True,
+        recursive=True,
+        help='Set when the route or rule of the move, or an internal origin transfer, disables auto merge'
+    )
+    no_merge = fields.Boolean(
+        string='No Merge',
+        compute='_compute_no_merge',
+        store=True,
+        index=True,
+        help='Set when the move must never be merged or grouped with other moves'
+    )
+
+    @api.depends('route_ids.disable_auto_merge', 'rule_id.disable_auto_merge',
+                 'move_orig_ids.picking_type_id.code', 'move_orig_ids.picking_id.move_ids.auto_merge_disabled')
+    def _compute_auto_merge_disabled(self):
+        for move in self:
+            # Check explicit route on move, then the rule's route setting
+            disabled = any(move.route_ids.mapped('disable_auto_merge')) or move.rule_id.disable_auto_merge
+            # Check if originating from internal transfer with disabled merge routes
+            if not disabled:
+                disabled = any(
+                    orig_move.picking_id and orig_move.picking_type_id.code == 'internal'
+                    and any(orig_move.picking_id.move_ids.mapped('auto_merge_disabled'))
+                    for orig_move in move.move_orig_ids
+                )
+            move.auto_merge_disabled = disabled
+
+    @api.depends('auto_merge_disabled', 'picking_type_id.code', 'move_orig_ids.picking_type_id.code')
+    def _compute_no_merge(self):
+        for move in self:
+            # Internal transfers should never merge their outgoing moves
+            move.no_merge = move.auto_merge_disabled or (
+                move.picking_type_id.code == 'outgoing'
+                and any(orig.picking_type_id.code == 'internal' for orig in move.move_orig_ids)
+            )
+
     def _has_disable_auto_merge(self):
         """Return True if this move should avoid auto-merge based on route/rule settings"""
-        # Check explicit route on move
-        if self.route_ids and any(route.disable_auto_merge for route in self.route_ids):
-            return True
-        
-        # Check rule's route setting
-        if self.rule_id and self.rule_id.route_id and self.rule_id.route_id.disable_auto_merge:
-            return True
-            
-        # Check if originating from internal transfer with disabled merge routes
-        if self.move_orig_ids:
-            for orig_move in self.move_orig_ids:
-                if (orig_move.picking_id and 
-                    orig_move.picking_type_id.code == 'internal' and
-                    any(move._has_disable_auto_merge() for move in orig_move.picking_id.move_ids)):
-                    return True
-                    
-        return False
+        return self.auto_merge_disabled
 
     def _prepare_merge_moves_distinct_fields(self):
         distinct_fields = super()._prepare_merge_moves_distinct_fields()
@@ -78,7 +130,7 @@ class StockMove(models.Model):
         distinct_fields.append('route_ids')
         
         # Critical: Always include these fields when auto-merge is disabled
-        if any(m._has_disable_auto_merge() for m in self):
+        if any(self.mapped('auto_merge_disabled')):
             distinct_fields.extend(['origin', 'picking_id', 'group_id', 'rule_id'])
             
         return distinct_fields
@@ -86,19 +138,16 @@ class StockMove(models.Model):
     def _action_confirm(self, merge=True, merge_into=False):
         """COMPLETELY OVERRIDE - Prevent any merging for moves with disabled auto-merge"""
         # Separate moves into two groups
-        moves_no_merge = self.filtered(lambda m: m._should_completely_disable_merge())
+        moves_no_merge = self.filtered('no_merge')
         moves_can_merge = self - moves_no_merge
         
         result = self.env['stock.move']
         
-        # Process moves that should NEVER be merged
+        # Process moves that should NEVER be merged; _assign_picking isolates each of them
         if moves_no_merge:
-            # Process each move individually to ensure complete isolation
-            for move in moves_no_merge:
-                # Ensure move has no group_id before confirmation
-                if move.group_id:
-                    move.write({'group_id': False})
-                result |= super(StockMove, move)._action_confirm(merge=False, merge_into=False)
+            # Ensure moves have no group_id before confirmation
+            moves_no_merge.filtered('group_id').write({'group_id': False})
+            result |= super(StockMove, moves_no_merge)._action_confirm(merge=False, merge_into=False)
         
         # Process moves that can be merged normally
         if moves_can_merge:
@@ -106,23 +155,28 @@ class StockMove(models.Model):
         
         return result
 
+    def _action_done(self, cancel_backorder=False):
+        moves = super()._action_done(cancel_backorder=cancel_backorder)
+        Atp = self.env['world.depot.stock.atp']
+        Atp._schedule_refresh(Atp._get_move_line_pairs(moves.move_line_ids))
+        return moves
+
+    def _action_cancel(self):
+        # The move lines are unlinked by the cancel, collect their pallets first
+        Atp = self.env['world.depot.stock.atp']
+        pairs = Atp._get_move_line_pairs(self.move_line_ids)
+        res = super()._action_cancel()
+        Atp._schedule_refresh(pairs)
+        return res
+
     def _should_completely_disable_merge(self):
         """More comprehensive check for complete merge disabling"""
-        if self._has_disable_auto_merge():
-            return True
-            
-        # Internal transfers should never merge their outgoing moves
-        if (self.picking_type_id.code == 'outgoing' and 
-            self.move_orig_ids and 
-            any(orig.picking_type_id.code == 'internal' for orig in self.move_orig_ids)):
-            return True
-            
-        return False
+        return self.no_merge
 
     def _assign_picking(self):
         """COMPLETELY OVERRIDDEN - Strict assignment logic to prevent merging"""
         # First separate moves by their merge requirements
-        moves_no_merge = self.filtered(lambda m: m._should_completely_disable_merge())
+        moves_no_merge = self.filtered('no_merge')
         moves_can_merge = self - moves_no_merge
         
         # Process moves that can merge normally first
@@ -130,73 +184,92 @@ class StockMove(models.Model):
             super(StockMove, moves_can_merge)._assign_picking()
         
         # Process moves that should not merge with strict isolation
-        for move in moves_no_merge:
-            if move.state in ('cancel', 'done'):
-                continue
-                
-            # Completely isolated assignment
-            self._assign_picking_strict_isolation(move)
+        moves_no_merge = moves_no_merge.filtered(lambda m: m.state not in ('cancel', 'done'))
+        if moves_no_merge:
+            self._assign_picking_strict_isolation(moves_no_merge)
         
         return True
 
-    def _assign_picking_strict_isolation(self, move):
-        """Assign picking with absolute isolation - no merging possible"""
+    def _assign_picking_strict_isolation(self, moves):
+        """Assign each move to its own picking with absolute isolation - no merging possible
+
+        Moves are partitioned by isolation key (operation type, locations, partner). Empty
+        matching pickings are looked up with one search and reused, the missing pickings are
+        created with a single create.
+        """
+        Picking = self.env['stock.picking']
         # Remove any existing group_id
-        if move.group_id:
-            move.write({'group_id': False})
-        
-        # Look for completely empty picking with same characteristics
-        domain = [
-            ('picking_type_id', '=', move.picking_type_id.id),
-            ('location_id', '=', move.location_id.id),
-            ('location_dest_id', '=', move.location_dest_id.id),
+        moves.filtered('group_id').write({'group_id': False})
+
+        # Look for completely empty pickings with same characteristics
+        empty_pickings = Picking.search([
+            ('picking_type_id', 'in', moves.picking_type_id.ids),
+            ('location_id', 'in', moves.location_id.ids),
+            ('location_dest_id', 'in', moves.location_dest_id.ids),
             ('state', 'in', ['draft', 'confirmed']),
             ('group_id', '=', False),
             ('move_ids', '=', False),  # Must be completely empty
-        ]
-        
-        # Additional domain for specific cases
-        if move.partner_id:
-            domain.append(('partner_id', '=', move.partner_id.id))
-        
-        picking = self.env['stock.picking'].search(domain, limit=1)
-        
-        if not picking:
-            # Create completely new isolated picking
-            picking_vals = {
-                'picking_type_id': move.picking_type_id.id,
-                'location_id': move.location_id.id,
-                'location_dest_id': move.location_dest_id.id,
-                'group_id': False,
-                'origin': move.origin or '',
-            }
-            
-            if move.partner_id:
-                picking_vals['partner_id'] = move.partner_id.id
-                
-            picking = self.env['stock.picking'].create(picking_vals)
-        
-        # Assign move to this picking
-        move.write({'picking_id': picking.id, 'group_id': False})
+        ])
+        # Candidates per isolation key; a move without partner accepts any partner
+        candidates = defaultdict(list)
+        for picking in empty_pickings:
+            key = (picking.picking_type_id.id, picking.location_id.id, picking.location_dest_id.id)
+            candidates[key + (None,)].append(picking)
+            candidates[key + (picking.partner_id.id,)].append(picking)
+
+        used = set()
+        assignments = []
+        moves_to_create = []
+        for move in moves:
+            key = (move.picking_type_id.id, move.location_id.id, move.location_dest_id.id, move.partner_id.id or None)
+            pickings = candidates[key]
+            while pickings and pickings[0].id in used:
+                pickings.pop(0)
+            if pickings:
+                picking = pickings.pop(0)
+                used.add(picking.id)
+                assignments.append((move, picking))
+            else:
+                moves_to_create.append(move)
+
+        if moves_to_create:
+            # Create completely new isolated pickings
+            vals_list = []
+            for move in moves_to_create:
+                picking_vals = {
+                    'picking_type_id': move.picking_type_id.id,
+                    'location_id': move.location_id.id,
+                    'location_dest_id': move.location_dest_id.id,
+                    'group_id': False,
+                    'origin': move.origin or '',
+                }
+                if move.partner_id:
+                    picking_vals['partner_id'] = move.partner_id.id
+                vals_list.append(picking_vals)
+            assignments.extend(zip(moves_to_create, Picking.create(vals_list)))
+
+        # Assign each move to its picking
+        for move, picking in assignments:
+            move.write({'picking_id': picking.id, 'group_id': False})
         
         return True
 
     def _check_assign_picking(self):
         """Override assignment check with strict isolation"""
-        if self._should_completely_disable_merge():
+        if self.no_merge:
             return self._assign_picking_strict_isolation(self)
         return super(StockMove, self)._check_assign_picking()
 
     def _get_new_picking_values(self):
         """Override to ensure new pickings don't get group_id"""
         values = super(StockMove, self)._get_new_picking_values()
-        if self._should_completely_disable_merge():
+        if any(self.mapped('no_merge')):
             values['group_id'] = False
         return values
 
     def _merge_moves(self, merge_into=False):
         """COMPLETELY PREVENT merging for specific moves"""
-        if any(move._should_completely_disable_merge() for move in self):
+        if any(self.mapped('no_merge')):
             # Return moves as-is without any merging
             return self
             
@@ -204,13 +277,20 @@ class StockMove(models.Model):
 
     def _update_candidate_moves_list(self, candidate_moves_list):
         """Override to filter out moves that should not be merged"""
-        if self._should_completely_disable_merge():
+        if self.no_merge:
             # Return empty list to prevent this move from being considered for merging
             return []
             
         return super(StockMove, self)._update_candidate_moves_list(candidate_moves_list)
 
 
+class StockMoveLine(models.Model):
+    _inherit = 'stock.move.line'
+
+    pick_sequence = fields.Integer(string='Pick Sequence', default=0, copy=False,
+                                   help='Rank of the source location on the pick path of the picking')
+
+
 class StockPicking(models.Model):
     _inherit = 'stock.picking'
 
@@ -235,7 +315,7 @@ class StockPicking(models.Model):
 
     def _has_disable_auto_merge_routes(self):
         """Check if picking contains moves with disabled auto-merge"""
-        return any(move._has_disable_auto_merge() for move in self.move_ids)
+        return any(self.move_ids.mapped('auto_merge_disabled'))
 
     @api.model
     def _check_grouping_compatibility(self, picking, move):
@@ -244,7 +324,7 @@ class StockPicking(models.Model):
             return False
         
         # CRITICAL: Never group if either has disabled auto-merge
-        if picking._has_disable_auto_merge_routes() or move._has_disable_auto_merge():
+        if picking._has_disable_auto_merge_routes() or move.auto_merge_disabled:
             return False
             
         # Additional strict checks for internal transfers
@@ -280,7 +360,7 @@ class StockPicking(models.Model):
         """Ensure complete separation of moves with disabled auto-merge"""
         for picking in self:
             # Check if this picking contains mixed moves (should be separated vs can be merged)
-            moves_no_merge = picking.move_ids.filtered(lambda m: m._should_completely_disable_merge())
+            moves_no_merge = picking.move_ids.filtered('no_merge')
             moves_can_merge = picking.move_ids - moves_no_merge
             
             # If we have mixed moves, separate them
@@ -316,81 +396,19 @@ class StockPicking(models.Model):
         self._pre_validate_separation()
         
         # Perform standard validation checks
-        for picking in self:
-            if picking.picking_type_id.strict_quantity_control:
-                for move in picking.move_ids:
-                    if move.state in ('done', 'cancel'):
-                        continue
-                        
-                    if float_compare(float(move.quantity or 0.0), move.product_uom_qty,
-                                     precision_rounding=move.product_uom.rounding) != 0:
-                        raise UserError(_(
-                            "Recorded move quantity must equal demand quantity for product %s.\n"
-                            "Demand: %s %s, Recorded move.quantity: %s %s\n\n"
-                            "This is enforced by the operation type: %s"
-                        ) % (move.product_id.display_name, move.product_uom_qty,
-                            move.product_uom.name, move.quantity, move.product_uom.name,
-                            picking.picking_type_id.name))
-
-                    relevant_lines = move.move_line_ids.filtered(lambda ml: ml.state != 'cancel') # and float(ml.quantity or 0.0) >= 0.0)
-                    if relevant_lines:
-                        done_qty = sum(
-                            ml.product_uom_id._compute_quantity(ml.quantity, move.product_uom)
-                            for ml in relevant_lines
-                        )
-                        if float_compare(done_qty, move.product_uom_qty,
-                                        precision_rounding=move.product_uom.rounding) != 0:
-                            raise UserError(_(
-                                "Actual done quantity (from move lines) must equal demand quantity for product %s.\n"
-                                "Demand: %s %s, Actual done: %s %s\n\n"
-                                "This is enforced by the operation type: %s"
-                            ) % (move.product_id.display_name, move.product_uom_qty,
-                                move.product_uom.name, done_qty, move.product_uom.name,
-                                picking.picking_type_id.name))
-        
+        issues = self._get_strict_quantity_issues()
+        if issues:
+            raise UserError(self._format_strict_quantity_issue(issues[0]))
+
         # Call original validation
         res = super(StockPicking, self).button_validate()
         
         # Post-validation processing
-        for picking in self:
-            # Propagate Bill of Lading / Container info to lots
-            for move_line in picking.move_line_ids:
-                if move_line.lot_id and not (move_line.lot_id.bill_of_lading or move_line.lot_id.cntrno):
-                    move_line.lot_id.write({
-                        'bill_of_lading': picking.bill_of_lading,
-                        'cntrno': picking.cntrno,
-                    })
+        self._propagate_lot_shipping_info()
+        self._update_depot_orders_after_validation()
 
-            # Update inbound orders
-            if getattr(picking.picking_type_id, 'code', '') == 'incoming' and picking.inbound_order_id:
-                picking.inbound_order_id.write({
-                    'i_date': picking.date_done,
-                    'status': 'inbound',
-                })
-
-            # Update outbound orders
-            if getattr(picking.picking_type_id, 'code', '') != 'outgoing' and picking.outbound_order_id:
-                origin_picking = self.search([('name', '=', picking.origin)], limit=1)
-                if not origin_picking:
-                    picking.outbound_order_id.write({
-                        'picking_PICK_date': picking.date_done,
-                        'status': 'picking',
-                    })
-                    
-            if getattr(picking.picking_type_id, 'code', '') == 'outgoing':
-                origin_picking = self.search([('name', '=', picking.origin)], limit=1)
-                if origin_picking and origin_picking.picking_type_id and getattr(origin_picking.picking_type_id, 'code', '') == 'internal':
-                    try:
-                        if origin_picking.outbound_order_id:
-                            origin_picking.outbound_order_id.write({
-                                'picking_Out': picking.id,
-                                'picking_Out_date': picking.date_done,
-                                'status': 'outbound',
-                            })
-                    except Exception:
-                        picking.message_post(body=_('Warning: could not update outbound order link for %s') % picking.display_name)
-
-            # Ensure separate deliveries for internal transfers
+        # Ensure separate deliveries for internal transfers
+        for picking in self:
             if picking.picking_type_id and getattr(picking.picking_type_id, 'code', '') == 'internal' and picking.state == 'done':
                 try:
                     picking._ensure_separate_deliveries()
@@ -399,6 +417,176 @@ class StockPicking(models.Model):
 
         return res
 
+    def _get_strict_quantity_issues(self):
+        """Return the moves breaking the strict quantity control of their operation type.
+
+        Move line quantities are converted to the move UoM and summed in a single query; only the
+        mismatching moves are loaded. Each issue is a dict with the move, the picking, the kind of
+        mismatch ('quantity' for move.quantity, 'done' for the move lines) and the compared value.
+        """
+        if not self.ids:
+            return []
+        self.env['stock.move'].flush_model(['picking_id', 'state', 'product_uom', 'product_uom_qty', 'quantity'])
+        self.env['stock.move.line'].flush_model(['move_id', 'state', 'quantity', 'product_uom_id'])
+        self.env.cr.execute("""
+            SELECT m.id, m.picking_id, m.product_uom_qty, m.quantity, m_uom.rounding,
+                   SUM(ml.quantity / ml_uom.factor * m_uom.factor) AS done_qty,
+                   COUNT(ml.id) AS line_count
+              FROM stock_move m
+              JOIN stock_picking p ON p.id = m.picking_id
+              JOIN stock_picking_type pt ON pt.id = p.picking_type_id
+              JOIN uom_uom m_uom ON m_uom.id = m.product_uom
+              LEFT JOIN stock_move_line ml ON ml.move_id = m.id AND ml.state != 'cancel'
+              LEFT JOIN uom_uom ml_uom ON ml_uom.id = ml.product_uom_id
+             WHERE m.picking_id IN %s
+               AND pt.strict_quantity_control
+               AND m.state NOT IN ('done', 'cancel')
+          GROUP BY m.id, m_uom.rounding
+        """, [tuple(self.ids)])
+
+        mismatches = {}
+        for move_id, picking_id, demand, quantity, rounding, done_qty, line_count in self.env.cr.fetchall():
+            if float_compare(float(quantity or 0.0), demand, precision_rounding=rounding) != 0:
+                mismatches[move_id] = ('quantity', quantity or 0.0)
+            elif line_count and float_compare(done_qty, demand, precision_rounding=rounding) != 0:
+                mismatches[move_id] = ('done', done_qty)
+        if not mismatches:
+            return []
+
+        # Report in picking then move order, as the moves are shown to the user
+        picking_index = {picking_id: index for index, picking_id in enumerate(self.ids)}
+        moves = self.env['stock.move'].browse(list(mismatches)).sorted(
+            lambda m: (picking_index[m.picking_id.id], m.sequence, m.id))
+        return [{
+            'move': move,
+            'picking': move.picking_id,
+            'type': mismatches[move.id][0],
+            'quantity': mismatches[move.id][1],
+        } for move in moves]
+
+    @api.model
+    def _format_strict_quantity_issue(self, issue):
+        move = issue['move']
+        if issue['type'] == 'quantity':
+            return _(
+                "Recorded move quantity must equal demand quantity for product %s.\n"
+                "Demand: %s %s, Recorded move.quantity: %s %s\n\n"
+                "This is enforced by the operation type: %s"
+            ) % (move.product_id.display_name, move.product_uom_qty,
+                 move.product_uom.name, move.quantity, move.product_uom.name,
+                 issue['picking'].picking_type_id.name)
+        return _(
+            "Actual done quantity (from move lines) must equal demand quantity for product %s.\n"
+            "Demand: %s %s, Actual done: %s %s\n\n"
+            "This is enforced by the operation type: %s"
+        ) % (move.product_id.display_name, move.product_uom_qty,
+             move.product_uom.name, float_round(issue['quantity'], precision_rounding=move.product_uom.rounding), move.product_uom.name,
+             issue['picking'].picking_type_id.name)
+
+    def action_preflight_check(self):
+        """Check the strict quantity control without validating, e.g. from a scanner"""
+        issues = self._get_strict_quantity_issues()
+        if issues:
+            raise UserError("\n\n".join(self._format_strict_quantity_issue(issue) for issue in issues))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'success',
+                'message': _('Quantities match the demand, the transfer can be validated.'),
+            },
+        }
+
+    def action_open_pick_list(self):
+        """Move lines of the picking in pick path order"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Pick List'),
+            'res_model': 'stock.move.line',
+            'view_mode': 'list',
+            'views': [(self.env.ref('worlddepot.view_stock_move_line_pick_list').id, 'list')],
+            'domain': [('picking_id', '=', self.id)],
+            'context': {'create': False},
+            'target': 'current',
+        }
+
+    def _propagate_lot_shipping_info(self):
+        """Copy Bill of Lading / Container info of the pickings to lots that have neither.
+
+        A lot met in several pickings takes the values of the first one that has any. Lots are
+        written in one call per (Bill of Lading, Container) pair.
+        """
+        lot_values = {}
+        for picking in self:
+            if not (picking.bill_of_lading or picking.cntrno):
+                continue
+            for lot in picking.move_line_ids.lot_id:
+                if lot.id not in lot_values and not (lot.bill_of_lading or lot.cntrno):
+                    lot_values[lot.id] = (picking.bill_of_lading, picking.cntrno)
+
+        lots_by_values = defaultdict(list)
+        for lot_id, values in lot_values.items():
+            lots_by_values[values].append(lot_id)
+        for (bill_of_lading, cntrno), lot_ids in lots_by_values.items():
+            self.env['stock.lot'].browse(lot_ids).write({
+                'bill_of_lading': bill_of_lading,
+                'cntrno': cntrno,
+            })
+
+    def _update_depot_orders_after_validation(self):
+        """Write the inbound/outbound order status of validated pickings in bulk"""
+        origins = {picking.origin for picking in self if picking.origin}
+        origin_pickings = {}
+        if origins:
+            for origin_picking in self.search([('name', 'in', list(origins))]):
+                origin_pickings.setdefault(origin_picking.name, origin_picking)
+
+        inbound_updates = {}
+        picking_updates = {}
+        outbound_updates = []
+        for picking in self:
+            code = getattr(picking.picking_type_id, 'code', '')
+            if code == 'incoming' and picking.inbound_order_id:
+                inbound_updates[picking.inbound_order_id] = picking.date_done
+            origin_picking = origin_pickings.get(picking.origin)
+            if code != 'outgoing' and picking.outbound_order_id and not origin_picking:
+                picking_updates[picking.outbound_order_id] = picking.date_done
+            if code == 'outgoing' and origin_picking and origin_picking.picking_type_id \
+                    and getattr(origin_picking.picking_type_id, 'code', '') == 'internal' \
+                    and origin_picking.outbound_order_id:
+                outbound_updates.append((picking, origin_picking.outbound_order_id))
+
+        # Update inbound orders
+        orders_by_date = defaultdict(lambda: self.env['world.depot.inbound.order'])
+        for order, date_done in inbound_updates.items():
+            orders_by_date[date_done] |= order
+        for date_done, orders in orders_by_date.items():
+            orders.write({
+                'i_date': date_done,
+                'status': 'inbound',
+            })
+
+        # Update outbound orders
+        orders_by_date = defaultdict(lambda: self.env['world.depot.outbound.order'])
+        for order, date_done in picking_updates.items():
+            orders_by_date[date_done] |= order
+        for date_done, orders in orders_by_date.items():
+            orders.write({
+                'picking_PICK_date': date_done,
+                'status': 'picking',
+            })
+
+        for picking, order in outbound_updates:
+            try:
+                order.write({
+                    'picking_Out': picking.id,
+                    'picking_Out_date': picking.date_done,
+                    'status': 'outbound',
+                })
+            except Exception:
+                picking.message_post(body=_('Warning: could not update outbound order link for %s') % picking.display_name)
+
     def _pre_validate_separation(self):
         """Final separation check before validation"""
         for picking in self:
@@ -432,26 +620,40 @@ class StockPicking(models.Model):
         if moves_by_origin:
             first_origin = list(moves_by_origin.keys())[0]
             moves_to_keep = moves_by_origin.pop(first_origin)
-            
-            for origin, moves in moves_by_origin.items():
-                if moves:
-                    new_picking_vals = {
-                        'move_ids': [],
-                        'move_line_ids': [],
-                        'backorder_id': False,
-                        'origin': origin,
-                        'picking_type_id': picking.picking_type_id.id,
-                        'location_id': picking.location_id.id,
-                        'location_dest_id': picking.location_dest_id.id,
-                        'partner_id': picking.partner_id.id,
-                        'scheduled_date': picking.scheduled_date,
-                        'group_id': False,
-                    }
-                    
-                    new_picking = picking.copy(new_picking_vals)
-                    moves.write({'picking_id': new_picking.id})
-                    if moves.move_line_ids:
-                        moves.move_line_ids.write({'picking_id': new_picking.id})
+            picking._split_moves_to_copies([
+                (moves, {'origin': origin}) for origin, moves in moves_by_origin.items() if moves
+            ])
+
+    def _split_moves_to_copies(self, groups):
+        """Move each group of moves to its own copy of the picking.
+
+        ``groups`` is a list of (moves, values) pairs, values overriding the copied picking
+        fields. The copies are created in one create; moves and move lines are reassigned with
+        one write per new picking.
+        """
+        self.ensure_one()
+        if not groups:
+            return self.browse()
+        base_vals = {
+            'move_ids': [],
+            'move_line_ids': [],
+            'backorder_id': False,
+            'picking_type_id': self.picking_type_id.id,
+            'location_id': self.location_id.id,
+            'location_dest_id': self.location_dest_id.id,
+            'partner_id': self.partner_id.id,
+            'scheduled_date': self.scheduled_date,
+            'group_id': False,
+        }
+        vals_list = []
+        for _moves, values in groups:
+            vals_list.extend(self.copy_data(dict(base_vals, **values)))
+        new_pickings = self.create(vals_list)
+        for (moves, _values), new_picking in zip(groups, new_pickings):
+            moves.write({'picking_id': new_picking.id})
+            if moves.move_line_ids:
+                moves.move_line_ids.write({'picking_id': new_picking.id})
+        return new_pickings
 
     def _ensure_separate_deliveries(self):
         """Ensure each internal transfer creates a separate delivery"""
@@ -491,27 +693,14 @@ class StockPicking(models.Model):
         if moves_by_origin:
             first_origin = list(moves_by_origin.keys())[0]
             moves_to_keep = moves_by_origin.pop(first_origin)
-            
-            for origin_id, moves in moves_by_origin.items():
-                if moves:
-                    internal_transfer = self.env['stock.picking'].browse(origin_id)
-                    new_delivery_vals = {
-                        'move_ids': [],
-                        'move_line_ids': [],
-                        'backorder_id': False,
-                        'origin': internal_transfer.name,
-                        'picking_type_id': delivery.picking_type_id.id,
-                        'location_id': delivery.location_id.id,
-                        'location_dest_id': delivery.location_dest_id.id,
-                        'partner_id': delivery.partner_id.id,
-                        'scheduled_date': delivery.scheduled_date,
-                        'group_id': False,
-                    }
-                    
-                    new_delivery = delivery.copy(new_delivery_vals)
-                    moves.write({'picking_id': new_delivery.id})
-                    if moves.move_line_ids:
-                        moves.move_line_ids.write({'picking_id': new_delivery.id})
+            transfer_names = {
+                transfer.id: transfer.name
+                for transfer in self.env['stock.picking'].browse([o for o in moves_by_origin if o])
+            }
+            delivery._split_moves_to_copies([
+                (moves, {'origin': transfer_names.get(origin_id, False)})
+                for origin_id, moves in moves_by_origin.items() if moves
+            ])
 
     # COMPLETE REVERSE VALIDATION LOGIC
     def button_reverse_validate(self):    
@@ -572,18 +761,15 @@ class StockPicking(models.Model):
             
             with self.env.cr.savepoint():
                 try:
-                    # Store all quant modifications for potential rollback
-                    quant_modifications = []
-                    
                     # Select only the moves that were actually done and need reversal
                     moves_to_reverse = picking.move_ids.filtered(lambda m: m.state == 'done' and m.quantity > 0)
-                    for move in moves_to_reverse:
-                        for move_line in move.move_line_ids:
-                            # Reverse the quant impact for this move line
-                            picking._reverse_quant_impact(move_line, quant_modifications)
+                    move_lines = moves_to_reverse.move_line_ids
+
+                    # Reverse the quant impact of all move lines at once
+                    picking._reverse_quants(move_lines)
 
-                            # Reverse lot location if applicable
-                            picking._reverse_lot_location(move_line)
+                    # Reverse lot locations if applicable
+                    picking._reverse_lot_locations(move_lines)
 
                     # Update only the moves we processed (avoid touching cancelled moves)
                     if moves_to_reverse:
@@ -627,103 +813,127 @@ class StockPicking(models.Model):
                                 len(picking.move_ids.mapped('move_line_ids.lot_id')))
                         )
                 except Exception as e:
-                    # Rollback quant modifications on error
-                    picking._rollback_quant_modifications(quant_modifications)
+                    # Leaving the savepoint with an exception undoes every quant change
                     raise UserError(_("Reverse validation failed: %s") % str(e))
-                
-                return True
+
+        return True
     
-    def _reverse_quant_impact(self, move_line, quant_modifications):
-        """Reverse the quant impact for a specific move line"""
-        product = move_line.product_id
-        quantity = move_line.quantity
-        
-        # Handle destination location (remove quantity)
-        dest_domain = [
-            ('product_id', '=', product.id),
-            ('location_id', '=', move_line.location_dest_id.id),
-        ]
-        if move_line.lot_id:
-            dest_domain.append(('lot_id', '=', move_line.lot_id.id))
-        if move_line.owner_id:
-            dest_domain.append(('owner_id', '=', move_line.owner_id.id))
-        
-        dest_quants = self.env['stock.quant'].search(dest_domain)
-        remaining_qty = quantity
-
-        # Compute total available in destination to avoid creating negative quants
-        dest_total = sum(dest_quants.mapped('quantity'))
-        if dest_total < quantity:
-            # Fail early: do not create negative quants — require manual intervention or stock correction
-            raise UserError(_(
-                "Cannot reverse move line for product %s: destination location %s only has %s units available but %s are required to reverse.")
-                % (product.display_name, move_line.location_dest_id.display_name, dest_total, quantity))
-
-        for dest_quant in dest_quants:
-            if remaining_qty <= 0:
-                break
-
-            qty_to_remove = min(remaining_qty, dest_quant.quantity)
-            if qty_to_remove > 0:
-                quant_modifications.append(('decrement', dest_quant.id, qty_to_remove))
-                # Use write for safety so ORM triggers any necessary constraints
-                dest_quant.write({'quantity': float(dest_quant.quantity) - float(qty_to_remove)})
-                remaining_qty -= qty_to_remove
-        
-        # Handle source location (restore quantity)
-        source_domain = [
-            ('product_id', '=', product.id),
-            ('location_id', '=', move_line.location_id.id),
-        ]
-        if move_line.lot_id:
-            source_domain.append(('lot_id', '=', move_line.lot_id.id))
-        if move_line.owner_id:
-            source_domain.append(('owner_id', '=', move_line.owner_id.id))
-        
-        source_quants = self.env['stock.quant'].search(source_domain)
-        
-        if source_quants:
-            quant_modifications.append(('increment', source_quants[0].id, quantity))
-            source_quants[0].write({'quantity': float(source_quants[0].quantity) + float(quantity)})
-        else:
-            # Create new quant in source location
-            created = self.env['stock.quant'].create({
-                'product_id': product.id,
-                'location_id': move_line.location_id.id,
-                'quantity': quantity,
-                'lot_id': move_line.lot_id.id,
-                'owner_id': move_line.owner_id.id,
-            })
-            # Track created quant so rollback helper can remove it if needed
-            quant_modifications.append(('create', created.id, quantity))
-
-
-    def _reverse_lot_location(self, move_line):
-        """Reverse the lot location if the lot was moved"""
-        if move_line.lot_id:
-            # Find the quant for this lot and restore its location
-            lot_quant = self.env['stock.quant'].search([
-                ('lot_id', '=', move_line.lot_id.id),
-                ('product_id', '=', move_line.product_id.id),
-                ('quantity', '>', 0)
-            ], order='id desc', limit=1)
-            
+    def _reverse_quants(self, move_lines):
+        """Undo the quant impact of done move lines in bulk.
+
+        Move lines are netted per (product, location, lot, owner): quantities are taken back from
+        the destination and restored at the source. The quants involved are locked with
+        SELECT ... FOR UPDATE before being read, so concurrent stock changes wait for the
+        reversal. As before, a move line without lot or owner matches quants with any lot or owner.
+        """
+        Quant = self.env['stock.quant']
+        deltas = defaultdict(float)
+        for move_line in move_lines:
+            quantity = move_line.quantity_product_uom
+            if not quantity:
+                continue
+            key = (move_line.product_id.id, move_line.lot_id.id or None, move_line.owner_id.id or None)
+            deltas[(move_line.location_dest_id.id,) + key] -= quantity
+            deltas[(move_line.location_id.id,) + key] += quantity
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        # Lock and load every quant the reversal may touch
+        product_ids = tuple({key[1] for key in deltas})
+        location_ids = tuple({key[0] for key in deltas})
+        Quant.flush_model()
+        self.env.cr.execute("""
+            SELECT id FROM stock_quant
+             WHERE product_id IN %s AND location_id IN %s
+          ORDER BY id
+               FOR UPDATE
+        """, [product_ids, location_ids])
+        quants = Quant.browse([row[0] for row in self.env.cr.fetchall()])
+        quants.invalidate_recordset(['quantity'])
+
+        quants_by_place = defaultdict(list)
+        new_quantities = {}
+        for quant in quants:
+            quants_by_place[(quant.location_id.id, quant.product_id.id)].append(quant)
+            new_quantities[quant.id] = quant.quantity
+
+        def matching_quants(location_id, product_id, lot_id, owner_id):
+            return [quant for quant in quants_by_place[(location_id, product_id)]
+                    if (lot_id is None or quant.lot_id.id == lot_id)
+                    and (owner_id is None or quant.owner_id.id == owner_id)]
+
+        # Remove quantities from the destinations, without creating negative quants
+        for (location_id, product_id, lot_id, owner_id), delta in deltas.items():
+            if delta > 0:
+                continue
+            required = -delta
+            candidates = matching_quants(location_id, product_id, lot_id, owner_id)
+            available = sum(new_quantities[quant.id] for quant in candidates)
+            if available < required:
+                raise UserError(_(
+                    "Cannot reverse move line for product %s: destination location %s only has %s units available but %s are required to reverse.")
+                    % (self.env['product.product'].browse(product_id).display_name,
+                       self.env['stock.location'].browse(location_id).display_name, available, required))
+            for quant in candidates:
+                if required <= 0:
+                    break
+                qty_to_remove = min(required, new_quantities[quant.id])
+                if qty_to_remove > 0:
+                    new_quantities[quant.id] -= qty_to_remove
+                    required -= qty_to_remove
+
+        # Restore quantities at the sources
+        quants_to_create = []
+        for (location_id, product_id, lot_id, owner_id), delta in deltas.items():
+            if delta < 0:
+                continue
+            candidates = matching_quants(location_id, product_id, lot_id, owner_id)
+            if candidates:
+                new_quantities[candidates[0].id] += delta
+            else:
+                quants_to_create.append({
+                    'product_id': product_id,
+                    'location_id': location_id,
+                    'quantity': delta,
+                    'lot_id': lot_id or False,
+                    'owner_id': owner_id or False,
+                })
+
+        # Apply: one write per resulting quantity, one create for the new quants
+        quants_by_quantity = defaultdict(list)
+        for quant in quants:
+            if new_quantities[quant.id] != quant.quantity:
+                quants_by_quantity[new_quantities[quant.id]].append(quant.id)
+        for quantity, quant_ids in quants_by_quantity.items():
+            Quant.browse(quant_ids).write({'quantity': quantity})
+        if quants_to_create:
+            Quant.create(quants_to_create)
+
+    def _reverse_lot_locations(self, move_lines):
+        """Move lots back to their source location if they are still at the destination"""
+        lot_move_lines = {}
+        for move_line in move_lines:
+            if move_line.lot_id:
+                lot_move_lines.setdefault((move_line.lot_id.id, move_line.product_id.id), move_line)
+        if not lot_move_lines:
+            return
+
+        # Latest quant with stock per lot
+        lot_quants = {}
+        for quant in self.env['stock.quant'].search([
+            ('lot_id', 'in', list({lot_id for lot_id, _product_id in lot_move_lines})),
+            ('quantity', '>', 0),
+        ], order='id desc'):
+            lot_quants.setdefault((quant.lot_id.id, quant.product_id.id), quant)
+
+        quants_by_location = defaultdict(lambda: self.env['stock.quant'])
+        for key, move_line in lot_move_lines.items():
+            lot_quant = lot_quants.get(key)
             if lot_quant and lot_quant.location_id == move_line.location_dest_id:
-                # Move the lot back to source location
-                lot_quant.location_id = move_line.location_id
-
-    def _rollback_quant_modifications(self, modifications):
-        """Rollback quant modifications in case of error"""
-        for operation, quant_id, quantity in modifications:
-            quant = self.env['stock.quant'].browse(quant_id)
-            if quant.exists():
-                if operation == 'decrement':
-                    quant.quantity += quantity
-                elif operation == 'increment':
-                    quant.quantity -= quantity
-                elif operation == 'create':
-                    # Remove the created quant
-                    quant.unlink()
+                quants_by_location[move_line.location_id.id] |= lot_quant
+        for location_id, lot_quants_to_move in quants_by_location.items():
+            lot_quants_to_move.write({'location_id': location_id})
 
         # Do not call button_validate or perform other operations here.
         # Rollback should only revert quant changes to restore previous stock state.
@@ -745,23 +955,16 @@ class StockPicking(models.Model):
         return action
 
     def delete_done_pickings_confirm(self):
-        """Delete pickings in 'done' state after resetting their state and cleaning related records."""
-        done_pickings = self.search([('state', '=', 'done')])
-        for picking in done_pickings:
-            # Reset state of stock moves and move lines
-            for move in picking.move_ids:
-                move.state = 'draft'
-            for move_line in picking.move_line_ids:
-                move_line.state = 'draft'
-            # Skip deletion of quants due to access restrictions
-            # You can log or handle quants differently if needed
-            # Handle related quants
-            # for move_line in picking.move_line_ids:
-            #    quants = self.env['stock.quant'].search([('lot_id', '=', move_line.lot_id.id)])
-            #    quants.unlink()  # Delete related quants
-
-            # Forcefully reset picking state to 'draft'
-            picking.state = 'draft'
-
-            # Unlink the picking
-            picking.unlink()
\ No newline at end of file
+        """Start a background job deleting the pickings in 'done' state chunk by chunk."""
+        job = self.env['world.depot.picking.purge'].create({
+            'name': _('Purge all done pickings'),
+        })
+        job.action_start()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Picking Purge'),
+            'res_model': 'world.depot.picking.purge',
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
@@ -1,16 +1,13 @@
 import logging
 from markupsafe import Markup
-from openpyxl.utils import get_column_letter
 
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
-import base64
-from io import BytesIO
-import openpyxl
-from openpyxl.styles import Alignment
-from openpyxl.styles import Border, Side
-from copy import copy
+from .inbound_order import create_active_reference_index
 import random
+import zipfile
+from datetime import timedelta
+from io import BytesIO
 
 _logger = logging.getLogger(__name__)
 
@@ -47,7 +44,8 @@ class OutboundOrder(models.Model):
     unload_company = fields.Many2one('res.partner', string='Unload Company/Person', required=True, tracking=True)
     remark = fields.Text(string='Remark')
     remark1 = fields.Text(string='Remark 1')
-    reference = fields.Char(string='Reference', required=True, help='Reference for the Order No of Owner', )
+    reference = fields.Char(string='Reference', required=True, help='Reference for the Order No of Owner',
+                            index=True)
     load_ref = fields.Char(string='Loading Reference', required=False, help='Reference for the Delivery', )
     load_date = fields.Datetime(string='Loading Date', required=False, tracking=True,
                                 help='Date when the loading was completed')
@@ -129,6 +127,7 @@ class OutboundOrder(models.Model):
 
     picking_PICK = fields.Many2one('stock.picking', string='Picking', readonly=True,
                                    help='Reference to the related Stock Picking')
+    picking_batch_id = fields.Many2one(related='picking_PICK.batch_id', string='Wave')
     picking_PICK_date = fields.Datetime(string='Picking Date', readonly=True,
                                         help='Date when the stock picking was validated')
     picking_Out = fields.Many2one('stock.picking', string='Outbound', readonly=True,
@@ -229,6 +228,10 @@ class OutboundOrder(models.Model):
         return [('state', '!=', 'cancel')]
     '''
 
+    def init(self):
+        """Enforce one active order per project and reference."""
+        create_active_reference_index(self.env.cr, self._table)
+
     @api.model
     def create(self, values):
         """
@@ -335,148 +338,31 @@ class OutboundOrder(models.Model):
         """
         Create a stock picking for the outbound order
         """
-        if self.state != 'confirm':
-            raise UserError(_("Outbound order must be confirmed before creating a stock picking."))
-        if not self.pick_type:
-            raise UserError(_("Picking type must be set before creating a stock picking."))
-        if not self.p_date:
-            raise UserError(_("Planning date must be set before creating a stock picking."))
-        if not self.reference:
-            raise UserError(_("Reference must be set before creating a stock picking."))
-
-        for record in self:
-            # Check if stock picking already exists
-            existing_picking = self.env['stock.picking'].search(
-                [('outbound_order_id', '=', record.id),
-                 ('picking_type_id', '=', record.pick_type.id),
-                 ('state', '!=', 'cancel')],
-                limit=1)
-            if existing_picking:
-                raise UserError(_("A stock picking already exists for this Outbound Order."))
-
-            picking = self.env['stock.picking'].create({
-                'picking_type_id': record.pick_type.id,
-                'location_id': record.pick_type.default_location_src_id.id,
-                'location_dest_id': record.pick_type.default_location_dest_id.id,
-                'origin': record.billno,
-                'partner_id': record.unload_company.id,
-                'outbound_order_id': record.id,
-                'planning_date': record.p_date,
-                'ref_1': record.reference,
-                'load_ref': record.load_ref,
-            })
+        self.env['world.depot.outbound.wave']._create_pickings(self)
 
-            # Create stock moves
-            for product in record.outbound_order_product_ids:
-                stock_move = self.env['stock.move'].create({
-                    'name': product.product_id.name,
-                    'product_id': product.product_id.id,
-                    'product_uom_qty': product.quantity,
-                    'product_uom': product.product_id.uom_id.id,
-                    'picking_id': picking.id,
-                    'location_id': picking.location_id.id,
-                    'location_dest_id': picking.location_dest_id.id,
-                    'outbound_order_product_id': product.id,
-                })
-                if record.is_auto_moves:
-                    # Find pallets matching prefix with available stock
-                    prefix = product.pallet_prefix_code or ''
-                    # Build ilike pattern: when prefix is empty, match all packages; otherwise match containing the prefix
-                    like_prefix = '%'
-                    if prefix:
-                        like_prefix = f'%-{prefix}-%'
-                    pallets = self.env['stock.quant.package'].search([
-                        ('name', '=ilike', like_prefix),
-                        ('quant_ids.quantity', '>', 0),  # Directly filter on related quant fields
-                        ('quant_ids.product_id', '=', product.product_id.id),
-                        ('quant_ids.location_id.usage', '=', 'internal'), 
-                        ('quant_ids.location_id.name', '!=', 'Output'), 
-                        # Ensure pallets have stock for the specific product
-                    ], order='create_date,name')  # Prioritize oldest pallets first
-                    moves = []
-                    remaining_qty = product.quantity
-                    pallet_locations = []  # collect used pallet location names for this product
-                    for pallet in pallets:
-                        # Get total on-hand qty for the pallet
-                        pallet_qty = sum(pallet.quant_ids.mapped('quantity'))
-                        alloc_qty = min(pallet_qty, remaining_qty)
-
-                        if alloc_qty <= 0:
-                            continue
-
-                        # record the location name for later writing into product.locations
-                        loc_name = False
-                        if pallet.location_id:
-                            loc_name = pallet.location_id.complete_name
-                        if loc_name:
-                            # keep order and uniqueness
-                            if loc_name not in pallet_locations:
-                                pallet_locations.append(loc_name)
-
-                        # Create move line for full/partial pallet
-                        if product.product_id.tracking == 'serial':
-                            for i_index in range(1, int(alloc_qty) + 1):
-                                moves.append({
-                                    'move_id': stock_move.id,
-                                    'picking_id': picking.id,
-                                    'product_id': product.product_id.id,
-                                    'product_uom_id': product.product_id.uom_id.id,
-                                    'quantity': 1,  # Serial numbers are tracked one by one
-                                    'location_id': pallet.location_id.id,
-                                    'location_dest_id': picking.location_dest_id.id,
-                                    'package_id': pallet.id,
-                                    'owner_id': pallet.owner_id.id,
-                                })
-                        else:
-                            moves.append({
-                                'move_id': stock_move.id,
-                                'picking_id': picking.id,
-                                'product_id': product.product_id.id,
-                                'product_uom_id': product.product_id.uom_id.id,
-                                'quantity': alloc_qty,  # Planned quantity
-                                'location_id': pallet.location_id.id,
-                                'location_dest_id': picking.location_dest_id.id,
-                                'package_id': pallet.id,
-                                'owner_id': pallet.owner_id.id,
-                            })
-                        remaining_qty -= alloc_qty
-
-                        if remaining_qty <= 0:
-                            break  # Exit when requirement met
-                    # Handle insufficient stock
-                    if remaining_qty > 0:
-                        # Compose a helpful error message including product name and pallet prefix
-                        prod_name = ''
-                        try:
-                            prod_name = product.product_id.name if getattr(product, 'product_id', False) else (getattr(product, 'product_name', '') or '')
-                        except Exception:
-                            prod_name = ''
-                        raise UserError(f"Insufficient stock for {prod_name} (prefix: {prefix})! Shortfall: {remaining_qty} units")
-
-                    # write collected pallet locations into the product.locations field
-                    try:
-                        if pallet_locations:
-                            product.locations = ', '.join(pallet_locations)
-                    except Exception:
-                        # fallback: do not interrupt picking creation for writable issues
-                        _logger.exception('Failed to write pallet locations for product %s', product.id)
-
-                    self.env['stock.move.line'].create(moves)
+        # return a success message
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Stock Picking Created'),
+                'message': _('Stock picking has been created successfully.'),
+                'sticky': False,
+            }
+        }
 
-            # Update the stock picking reference in the outbound order
-            record.picking_PICK = picking.id
+    def action_create_wave(self):
+        """
+        Create the pickings of the selected orders grouped in waves, one picking batch per
+        planning date, delivery method, warehouse and picking type
+        """
+        batches = self.env['world.depot.outbound.wave']._create_waves(self)
+        action = self.env['ir.actions.act_window']._for_xml_id('stock_picking_batch.stock_picking_batch_action')
+        action['domain'] = [('id', 'in', batches.ids)]
+        if len(batches) == 1:
+            action.update({'view_mode': 'form', 'views': [(False, 'form')], 'res_id': batches.id})
+        return action
 
-            # return a success message
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': _('Stock Picking Created'),
-                    'message': _('Stock picking has been created successfully.'),
-                    'sticky': False,
-                }
-            }
-            
     # New method to check stock availability without creating pickings
     def action_check_avaliable(self):
         """
@@ -486,55 +372,13 @@ class OutboundOrder(models.Model):
         with a helpful message when allocation is impossible or partial.
         Returns True when all products can be fully allocated from matching pallets.
         """
-        all_errors = []
-        for record in self:
-            # Only check products when auto allocation by pallets is enabled
-            for product in record.outbound_order_product_ids:
-                if not record.is_auto_moves:
-                    continue
-                prefix = product.pallet_prefix_code or ''
-                # Build ilike pattern: when prefix is empty, match all packages; otherwise match containing the prefix
-                like_prefix = '%'
-                if prefix:
-                    like_prefix = f'%-{prefix}-%'
-                pallets = self.env['stock.quant.package'].search([
-                    ('name', '=ilike', like_prefix),
-                    ('quant_ids.quantity', '>', 0),
-                    ('quant_ids.product_id', '=', product.product_id.id),
-                    ('quant_ids.location_id.usage', '=', 'internal'), 
-                    ('quant_ids.location_id.name', '!=', 'Output'), 
-                ], order='create_date,name')
-
-                remaining_qty = float(product.quantity or 0)
-                allocated_any = False
-                for pallet in pallets:
-                    try:
-                        pallet_qty = float(sum(pallet.quant_ids.mapped('quantity')) or 0)
-                    except Exception:
-                        pallet_qty = 0.0
-                    alloc_qty = min(pallet_qty, remaining_qty)
-                    if alloc_qty <= 0:
-                        continue
-                    allocated_any = True
-                    remaining_qty -= alloc_qty
-                    if remaining_qty <= 0:
-                        break
-
-                # build per-product error messages (do not raise immediately so we can report all)
-                if not allocated_any:
-                    prod_name = ''
-                    try:
-                        prod_name = product.product_id.name or ''
-                    except Exception:
-                        prod_name = ''
-                    all_errors.append(f"Insufficient stock for {prod_name} (prefix: {prefix})! No allocatable pallets found.")
-                elif remaining_qty > 0:
-                    prod_name = ''
-                    try:
-                        prod_name = product.product_id.name or ''
-                    except Exception:
-                        prod_name = ''
-                    all_errors.append(f"Insufficient stock for {prod_name} (prefix: {prefix})! Shortfall: {int(remaining_qty)} units")
+        lines = self.filtered('is_auto_moves').outbound_order_product_ids
+        # Match the lines against the free quantity per pallet with the allocator's own matching,
+        # so lines of the same product share the stock the way picking creation would
+        Wave = self.env['world.depot.outbound.wave']
+        candidates = self.env['world.depot.stock.atp']._get_pallet_candidates(lines.product_id)
+        allocations, shortfalls = Wave._match_pallets(lines, candidates, set())
+        all_errors = Wave._get_shortfall_messages(allocations, shortfalls)
 
         if all_errors:
             # raise a single aggregated error to show all shortages at once
@@ -563,149 +407,110 @@ class OutboundOrder(models.Model):
         self.scanning_quantity = scanning_quantity
         self.is_adr = any(product.adr for product in self.outbound_order_product_ids)
 
-    def action_create_cmr(self):
+    def _get_cmr_values(self):
+        """Values filled into the CMR template: header cells and one line per product"""
+        self.ensure_one()
+        warehouse_address = [
+            self.warehouse.partner_id.street or '',
+            self.warehouse.partner_id.zip or '',
+            self.warehouse.partner_id.city or ''
+        ]
+        unload_company_address = [
+            self.unload_company.street or '',
+            self.unload_company.zip or '',
+            self.unload_company.city or ''
+        ]
+        lines = []
+        for product in self.outbound_order_product_ids:
+            quantity = product.quantity or 0.0
+            weight_per_box = product.product_id.weight or 0.0
+            lines.append([
+                product.product_id.name or '',  # Commodity/Product Name
+                quantity,  # Quantity
+                weight_per_box,  # Net Weight per Box (NW kg/Box)
+                quantity * weight_per_box,  # Gross Weight (GW kg)
+                '',  # Points
+                '',  # Pallets
+            ])
+        return {
+            'cells': {
+                'B3': self.owner.name or '',
+                'B4': ', '.join(warehouse_address),
+                'B8': self.unload_company.name or '',
+                'B9': ', '.join(unload_company_address),
+                'E19': self.load_ref or '',
+                'D16': self.load_date.strftime('%d/%m/%Y') if self.load_date else '',
+            },
+            'lines': lines,
+        }
+
+    def _create_cmr_attachments(self):
+        """Render the CMR of every order and attach them with a single create"""
+        renderer = self.env['world.depot.cmr.renderer']
+        vals_list = []
         for rec in self:
-            # Load template
-            template_data = base64.b64decode(rec.project.outbound_cmr_template_file)
-            template_buffer = BytesIO(template_data)
-            workbook = openpyxl.load_workbook(template_buffer, read_only=False)
-            worksheet = workbook.active
-
-            # Define alignment styles
-            ALIGN_TOP_RIGHT = Alignment(vertical="top", horizontal="right", wrap_text=True)
-            ALIGN_TOP_LEFT = Alignment(vertical="top", horizontal="left", wrap_text=True)
-            ALIGN_TOP_CENTER = Alignment(vertical="top", horizontal="center", wrap_text=True)
-
-            # Fill company information
-            worksheet['B3'] = rec.owner.name or ''
-            warehouse_address = [
-                rec.warehouse.partner_id.street or '',
-                rec.warehouse.partner_id.zip or '',
-                rec.warehouse.partner_id.city or ''
-            ]
-            worksheet['B4'] = ', '.join(warehouse_address)
-            worksheet['B8'] = rec.unload_company.name or ''
-            unload_company_address = [
-                rec.unload_company.street or '',
-                rec.unload_company.zip or '',
-                rec.unload_company.city or ''
-            ]
-            worksheet['B9'] = ', '.join(unload_company_address)
-            worksheet['E19'] = rec.load_ref or ''
-            worksheet['D16'] = rec.load_date.strftime('%d/%m/%Y') if rec.load_date else ''
-
-            # Set initial row positions
-            row_index = 24  # Starting row for product data
-            template_row = 24  # Template row to copy styles from
-
-            # Process each product in the outbound order
-            for product in rec.outbound_order_product_ids:
-                self.insert_row_manually(worksheet, row_index, template_row)
-                # Fill product data with proper alignment
-                # Column B: Commodity/Product Name
-                worksheet.cell(row=row_index, column=2, value=product.product_id.name or '').alignment = ALIGN_TOP_LEFT
-                # Column C: Quantity
-                quantity = product.quantity or 0.0
-                worksheet.cell(row=row_index, column=3, value=quantity).alignment = ALIGN_TOP_RIGHT
-                # Column D: Net Weight per Box (NW kg/Box)
-                weight_per_box = product.product_id.weight or 0.0
-                worksheet.cell(row=row_index, column=4, value=weight_per_box).alignment = ALIGN_TOP_RIGHT
-                # Column E: Gross Weight (GW kg) - calculated as quantity * weight per box
-                weight_subtotal = quantity * weight_per_box
-                worksheet.cell(row=row_index, column=5, value=weight_subtotal).alignment = ALIGN_TOP_RIGHT
-                # Column F: Points (empty in the example)
-                worksheet.cell(row=row_index, column=6, value='').alignment = ALIGN_TOP_RIGHT
-                # Column G: Pallets (empty in the example)
-                worksheet.cell(row=row_index, column=7, value='').alignment = ALIGN_TOP_RIGHT
-
-                row_index += 1
-
-            worksheet.delete_rows(row_index)
-            # Save the workbook
-            output = BytesIO()
-            workbook.save(output)
-            output.seek(0)
+            content = renderer.render(rec.project, rec._get_cmr_values())
 
             # Generate a random sequence (e.g., 001~999)
             random_seq = f"{random.randint(1, 999):03}"
 
             # Format the attachment name with the random sequence
-            attachment_name = f"CMR_{rec.billno}_{random_seq}.xlsx"
-            self.env['ir.attachment'].create({
-                'name': attachment_name,
+            vals_list.append({
+                'name': f"CMR_{rec.billno}_{random_seq}.xlsx",
                 'type': 'binary',
-                'datas': base64.b64encode(output.read()),
+                'raw': content,
                 'res_model': self._name,
                 'res_id': rec.id,
                 'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             })
+        return self.env['ir.attachment'].create(vals_list)
 
-            # Return success message and refresh the record
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': _('CMR Created'),
-                    'message': _('The CMR has been successfully created and attached.'),
-                    'sticky': False,
-                }
+    def action_create_cmr(self):
+        attachments = self._create_cmr_attachments()
+
+        # Return success message and refresh the record
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('CMR Created'),
+                'message': _('%s CMR document(s) have been successfully created and attached.') % len(attachments),
+                'sticky': False,
             }
+        }
 
-    def insert_row_manually(self, worksheet, new_row_index, template_row_index):
-        """
-        Copy styles, data, and borders from a template row to a new row.
-        :param worksheet: Target worksheet object
-        :param new_row_index: Index of the new row to insert
-        :param template_row_index: Index of the template row
-        """
-        # Insert new row
-        worksheet.insert_rows(new_row_index)
-
-        # Define default border style based on your template image
-        # Using thin black lines as shown in the image
-        default_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-
-        # Copy each cell in the template row
-        for col in range(1, worksheet.max_column + 1):
-            template_cell = worksheet.cell(row=template_row_index, column=col)
-            new_cell = worksheet.cell(row=new_row_index, column=col)
-
-            # 1. Copy data
-            new_cell.value = template_cell.value
-
-            # 2. Copy styles (font, fill, alignment, etc.)
-            if template_cell.has_style:
-                new_cell.font = copy(template_cell.font)
-                new_cell.fill = copy(template_cell.fill)
-                new_cell.alignment = copy(template_cell.alignment)
-                new_cell.number_format = template_cell.number_format
-
-            # 3. Apply borders - manually copy border properties to avoid recursion issues
-            if template_cell.border:
-                # Create new Border object with properties from template cell
-                # This avoids the deepcopy recursion error while preserving border styles
-                new_cell.border = Border(
-                    left=template_cell.border.left,
-                    right=template_cell.border.right,
-                    top=template_cell.border.top,
-                    bottom=template_cell.border.bottom,
-                    diagonal=template_cell.border.diagonal,
-                    diagonal_direction=template_cell.border.diagonal_direction,
-                    outline=template_cell.border.outline,
-                    vertical=template_cell.border.vertical,
-                    horizontal=template_cell.border.horizontal
-                )
-            else:
-                new_cell.border = default_border  # Apply default if no border in template
+    def action_download_cmr_zip(self):
+        """Create the CMRs of the selected orders and download them as one zip file"""
+        attachments = self._create_cmr_attachments()
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for attachment in attachments:
+                archive.writestr(attachment.name, attachment.raw)
+        # Not tied to one order, the download copy is purged by _cron_purge_cmr_zips
+        zip_attachment = self.env['ir.attachment'].create({
+            'name': f"CMR_{fields.Datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+            'type': 'binary',
+            'raw': buffer.getvalue(),
+            'res_model': self._name,
+            'mimetype': 'application/zip',
+        })
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{zip_attachment.id}?download=true',
+            'target': 'self',
+        }
 
-        # 4. Copy row height to maintain consistent row sizing
-        if template_row_index in worksheet.row_dimensions:
-            worksheet.row_dimensions[new_row_index].height = worksheet.row_dimensions[template_row_index].height
+    @api.model
+    def _cron_purge_cmr_zips(self):
+        """Delete the CMR zip downloads older than a day"""
+        zips = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', False),
+            ('mimetype', '=', 'application/zip'),
+            ('create_date', '<', fields.Datetime.now() - timedelta(days=1)),
+        ])
+        zips.unlink()
+        _logger.info("Purged %s CMR zip downloads", len(zips))
 
     def cron_update_outbound_date(self):
         """Scheduled action to update inbound dates for confirmed orders without an inbound date."""
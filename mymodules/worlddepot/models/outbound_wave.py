@@ -0,0 +1,303 @@
+import logging
+from collections import defaultdict
+from odoo import models, api, _
+from odoo.exceptions import UserError
+from odoo.tools import float_compare, float_is_zero
+
+_logger = logging.getLogger(__name__)
+
+
+class OutboundWave(models.AbstractModel):
+    _name = 'world.depot.outbound.wave'
+    _description = 'Outbound Wave Planning'
+
+    @api.model
+    def _get_wave_key(self, order):
+        """Orders picked together: same planning date, delivery method, warehouse and picking type"""
+        return order.p_date, order.delivery_method, order.warehouse.id, order.pick_type.id
+
+    @api.model
+    def _get_pallet_candidates(self, products):
+        """Pallets holding ``products`` in internal locations, oldest first, with the quantity still free.
+
+        Quantities planned on open move lines or reserved for open pickings are not free. They are
+        matched per owner, so a pallet holding stock of two owners is not charged twice.
+        :return: dict product id -> list of candidate dicts
+        """
+        self.env['stock.quant'].flush_model()
+        self.env['stock.move.line'].flush_model()
+        self.env['stock.quant.package'].flush_model(['name'])
+        self.env['world.depot.pallet.reservation'].flush_model()
+        self.env.cr.execute("""
+            WITH planned AS (
+                SELECT package_id, product_id, location_id, owner_id, SUM(quantity) AS quantity
+                  FROM stock_move_line
+                 WHERE state NOT IN ('done', 'cancel') AND package_id IS NOT NULL AND product_id = ANY(%(products)s)
+              GROUP BY package_id, product_id, location_id, owner_id
+            ), reserved AS (
+                SELECT r.package_id, r.product_id, r.location_id, r.owner_id, SUM(r.quantity) AS quantity
+                  FROM world_depot_pallet_reservation r
+                  JOIN stock_picking p ON p.id = r.picking_id
+                 WHERE p.state NOT IN ('done', 'cancel') AND r.product_id = ANY(%(products)s)
+              GROUP BY r.package_id, r.product_id, r.location_id, r.owner_id
+            )
+            SELECT q.product_id, q.package_id, pk.name, q.location_id, q.owner_id,
+                   SUM(q.quantity) - GREATEST(COALESCE(MAX(planned.quantity), 0), COALESCE(MAX(reserved.quantity), 0))
+              FROM stock_quant q
+              JOIN stock_quant_package pk ON pk.id = q.package_id
+              JOIN stock_location l ON l.id = q.location_id
+         LEFT JOIN planned ON planned.package_id = q.package_id AND planned.product_id = q.product_id
+                          AND planned.location_id = q.location_id AND planned.owner_id IS NOT DISTINCT FROM q.owner_id
+         LEFT JOIN reserved ON reserved.package_id = q.package_id AND reserved.product_id = q.product_id
+                           AND reserved.location_id = q.location_id AND reserved.owner_id IS NOT DISTINCT FROM q.owner_id
+             WHERE q.product_id = ANY(%(products)s) AND q.quantity > 0
+               AND l.usage = 'internal' AND l.name != 'Output'
+          GROUP BY q.product_id, q.package_id, pk.name, pk.create_date, q.location_id, q.owner_id
+          ORDER BY pk.create_date, pk.name
+        """, {'products': products.ids})
+        candidates = defaultdict(list)
+        for product_id, package_id, package_name, location_id, owner_id, available in self.env.cr.fetchall():
+            if available > 0:
+                candidates[product_id].append({
+                    'package_id': package_id,
+                    'name': (package_name or '').lower(),
+                    'location_id': location_id,
+                    'owner_id': owner_id,
+                    'available': available,
+                })
+        return candidates
+
+    @api.model
+    def _match_pallets(self, order_lines, candidates, excluded_package_ids):
+        """FIFO matching of the lines against the candidates, without touching ``candidates``"""
+        allocations = defaultdict(list)
+        shortfalls = {}
+        taken = defaultdict(float)
+        for line in order_lines:
+            rounding = line.product_id.uom_id.rounding
+            prefix = line.pallet_prefix_code
+            pattern = f'-{prefix.lower()}-' if prefix else ''
+            remaining = line.quantity
+            for index, candidate in enumerate(candidates[line.product_id.id]):
+                if float_is_zero(remaining, precision_rounding=rounding):
+                    break
+                available = candidate['available'] - taken[(line.product_id.id, index)]
+                if available <= 0 or pattern not in candidate['name'] \
+                        or candidate['package_id'] in excluded_package_ids:
+                    continue
+                quantity = min(available, remaining)
+                taken[(line.product_id.id, index)] += quantity
+                remaining -= quantity
+                allocations[line].append({
+                    'package_id': candidate['package_id'],
+                    'location_id': candidate['location_id'],
+                    'owner_id': candidate['owner_id'],
+                    'quantity': quantity,
+                })
+            if not float_is_zero(remaining, precision_rounding=rounding) and remaining > 0:
+                shortfalls[line] = remaining
+        return allocations, shortfalls
+
+    @api.model
+    def _allocate_pallets(self, order_lines, reserve=False):
+        """Allocate pallets to outbound order product lines in one scan, oldest pallets first.
+
+        The lines are served in the given order, so earlier orders take the oldest pallets. With
+        ``reserve``, the chosen pallets are locked with SKIP LOCKED: pallets locked by a concurrent
+        transaction are left out and the lines are matched again against the others. When that
+        leaves a line short while the locked pallets would have covered it, a UserError asks to
+        retry instead of reporting missing stock.
+
+        :return: ``(allocations, shortfalls)``, ``allocations`` maps each line to a list of dicts
+            with ``package_id``, ``location_id``, ``owner_id`` and ``quantity``, ``shortfalls`` maps
+            the lines that could not be fully allocated to the missing quantity
+        """
+        products = order_lines.product_id
+        if not products:
+            return defaultdict(list), {}
+
+        candidates = self._get_pallet_candidates(products)
+        Reservation = self.env['world.depot.pallet.reservation']
+        locked_ids = set()
+        excluded_ids = set()
+        while True:
+            allocations, shortfalls = self._match_pallets(order_lines, candidates, excluded_ids)
+            if not reserve:
+                break
+            wanted_ids = {a['package_id'] for line_allocations in allocations.values()
+                          for a in line_allocations} - locked_ids
+            if not wanted_ids:
+                break
+            locked_ids |= Reservation._lock_packages(wanted_ids)
+            skipped_ids = wanted_ids - locked_ids
+            if not skipped_ids:
+                break
+            _logger.info("Skipping %s pallets locked by a concurrent transaction", len(skipped_ids))
+            excluded_ids |= skipped_ids
+
+        if excluded_ids and shortfalls:
+            # Shortfalls that only exist because locked pallets were skipped are not missing stock
+            _unlocked, free_shortfalls = self._match_pallets(order_lines, candidates, set())
+            busy_lines = [
+                line for line, remaining in shortfalls.items()
+                if float_compare(remaining, free_shortfalls.get(line, 0.0),
+                                 precision_rounding=line.product_id.uom_id.rounding) > 0
+            ]
+            if busy_lines:
+                raise UserError(_("Pallets of %s are being moved or allocated by another user right now. "
+                                  "Please retry in a moment.")
+                                % ', '.join(dict.fromkeys(line.product_id.name or '' for line in busy_lines)))
+        return allocations, shortfalls
+
+    @api.model
+    def _get_shortfall_messages(self, allocations, shortfalls):
+        messages = []
+        for line, remaining in shortfalls.items():
+            name = line.product_id.name or ''
+            prefix = line.pallet_prefix_code or ''
+            if not allocations.get(line):
+                messages.append(f"Insufficient stock for {name} (prefix: {prefix})! No allocatable pallets found.")
+            else:
+                messages.append(f"Insufficient stock for {name} (prefix: {prefix})! Shortfall: {remaining} units")
+        return messages
+
+    @api.model
+    def _check_orders(self, orders):
+        for order in orders:
+            if order.state != 'confirm':
+                raise UserError(_("Outbound order must be confirmed before creating a stock picking."))
+            if not order.pick_type:
+                raise UserError(_("Picking type must be set before creating a stock picking."))
+            if not order.p_date:
+                raise UserError(_("Planning date must be set before creating a stock picking."))
+            if not order.reference:
+                raise UserError(_("Reference must be set before creating a stock picking."))
+
+        existing = self.env['stock.picking'].search([
+            ('outbound_order_id', 'in', orders.ids),
+            ('state', '!=', 'cancel'),
+        ]).filtered(lambda p: p.picking_type_id == p.outbound_order_id.pick_type)
+        if existing:
+            raise UserError(_("A stock picking already exists for Outbound Order %s.")
+                            % ', '.join(existing.outbound_order_id.mapped('billno')))
+
+    @api.model
+    def _create_pickings(self, orders):
+        """Create the pick pickings of ``orders`` with their moves and move lines.
+
+        Pallets are allocated for all orders in one pass, first orders first, and the move lines of
+        all pickings are created at once along the pick path.
+        """
+        self._check_orders(orders)
+        orders = orders.sorted(lambda o: (o.p_date, o.id))
+        auto_lines = orders.filtered('is_auto_moves').outbound_order_product_ids
+        allocations, shortfalls = self._allocate_pallets(auto_lines, reserve=True)
+        if shortfalls:
+            raise UserError('\n'.join(self._get_shortfall_messages(allocations, shortfalls)))
+
+        pickings = self.env['stock.picking'].create([{
+            'picking_type_id': order.pick_type.id,
+            'location_id': order.pick_type.default_location_src_id.id,
+            'location_dest_id': order.pick_type.default_location_dest_id.id,
+            'origin': order.billno,
+            'partner_id': order.unload_company.id,
+            'outbound_order_id': order.id,
+            'planning_date': order.p_date,
+            'ref_1': order.reference,
+            'load_ref': order.load_ref,
+        } for order in orders])
+        picking_by_order = dict(zip(orders, pickings))
+
+        lines = orders.outbound_order_product_ids
+        moves = self.env['stock.move'].create([{
+            'name': line.product_id.name,
+            'product_id': line.product_id.id,
+            'product_uom_qty': line.quantity,
+            'product_uom': line.product_id.uom_id.id,
+            'picking_id': picking_by_order[line.outbound_order_id].id,
+            'location_id': picking_by_order[line.outbound_order_id].location_id.id,
+            'location_dest_id': picking_by_order[line.outbound_order_id].location_dest_id.id,
+            'outbound_order_product_id': line.id,
+        } for line in lines])
+
+        self.env['world.depot.pallet.reservation'].create([{
+            'package_id': allocation['package_id'],
+            'product_id': line.product_id.id,
+            'location_id': allocation['location_id'],
+            'owner_id': allocation['owner_id'],
+            'quantity': allocation['quantity'],
+            'picking_id': picking_by_order[line.outbound_order_id].id,
+            'outbound_order_product_id': line.id,
+        } for line, line_allocations in allocations.items() for allocation in line_allocations])
+
+        move_line_vals = []
+        for line, move in zip(lines, moves):
+            picking = move.picking_id
+            for allocation in allocations.get(line, []):
+                vals = {
+                    'move_id': move.id,
+                    'picking_id': picking.id,
+                    'product_id': line.product_id.id,
+                    'product_uom_id': line.product_id.uom_id.id,
+                    'quantity': allocation['quantity'],
+                    'location_id': allocation['location_id'],
+                    'location_dest_id': picking.location_dest_id.id,
+                    'package_id': allocation['package_id'],
+                    'owner_id': allocation['owner_id'],
+                }
+                if line.product_id.tracking == 'serial':
+                    # Serial numbers are tracked one by one
+                    move_line_vals += [dict(vals, quantity=1) for _i in range(int(allocation['quantity']))]
+                else:
+                    move_line_vals.append(vals)
+
+        if move_line_vals:
+            locations = self.env['stock.location'].browse({vals['location_id'] for vals in move_line_vals})
+            location_names = {location.id: location.complete_name for location in locations}
+
+            # Pallet locations per product line, in allocation order
+            for line in lines:
+                names = []
+                for allocation in allocations.get(line, []):
+                    name = location_names[allocation['location_id']]
+                    if name not in names:
+                        names.append(name)
+                if names:
+                    line.locations = ', '.join(names)
+
+            # The rank is stored on the lines, the pick list is ordered by it
+            ranks = locations._get_pick_path_ranks()
+            for vals in move_line_vals:
+                vals['pick_sequence'] = ranks.get(vals['location_id'], 0) + 1
+            move_line_vals.sort(key=lambda vals: (vals['picking_id'], vals['pick_sequence']))
+            self.env['stock.move.line'].create(move_line_vals)
+
+        for order, picking in picking_by_order.items():
+            order.picking_PICK = picking.id
+        self.env['world.depot.stock.atp']._schedule_refresh({
+            (line.product_id.id, allocation['package_id'])
+            for line, line_allocations in allocations.items() for allocation in line_allocations})
+        return pickings
+
+    @api.model
+    def _create_waves(self, orders):
+        """Group ``orders`` into waves and create one picking batch per wave"""
+        waves = defaultdict(lambda: orders.browse())
+        for order in orders:
+            waves[self._get_wave_key(order)] |= order
+
+        Batch = self.env['stock.picking.batch']
+        batches = Batch.browse()
+        for (p_date, delivery_method, _warehouse_id, pick_type_id), wave_orders in waves.items():
+            pickings = self._create_pickings(wave_orders)
+            method = dict(wave_orders._fields['delivery_method']._description_selection(self.env)).get(
+                delivery_method, '')
+            batches |= Batch.create({
+                'description': ' '.join(filter(None, [
+                    _('Wave'), str(p_date or ''), method, wave_orders[0].warehouse.name or ''])),
+                'picking_type_id': pick_type_id,
+                'scheduled_date': p_date,
+                'picking_ids': [(6, 0, pickings.ids)],
+            })
+            _logger.info("Created wave batch with %s outbound orders", len(wave_orders))
+        return batches
@@ -0,0 +1,52 @@
+import logging
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+
+class PalletReservation(models.Model):
+    _name = 'world.depot.pallet.reservation'
+    _description = 'Pallet Reservation'
+    _order = 'id desc'
+
+    package_id = fields.Many2one('stock.quant.package', string='Pallet', required=True, index=True,
+                                 ondelete='cascade')
+    product_id = fields.Many2one('product.product', string='Product', required=True, index=True,
+                                 ondelete='cascade')
+    location_id = fields.Many2one('stock.location', string='Location', required=True, ondelete='cascade')
+    owner_id = fields.Many2one('res.partner', string='Owner', ondelete='cascade')
+    quantity = fields.Float(string='Reserved Quantity', digits='Product Unit of Measure')
+    picking_id = fields.Many2one('stock.picking', string='Picking', required=True, index=True, ondelete='cascade')
+    outbound_order_product_id = fields.Many2one('world.depot.outbound.order.product', string='Outbound Order Line',
+                                                ondelete='cascade')
+
+    @api.model
+    def _lock_packages(self, package_ids):
+        """Lock the given pallets for this transaction and return the ids that could be locked.
+
+        Pallets locked by a concurrent allocation are skipped instead of waited for. The locked rows
+        are also touched, so an allocation that read the stock before this transaction commits fails
+        with a serialization error and is retried, instead of claiming the same quantities.
+        """
+        if not package_ids:
+            return set()
+        self.env.cr.execute("""
+            SELECT id FROM stock_quant_package WHERE id = ANY(%s) ORDER BY id FOR UPDATE SKIP LOCKED
+        """, [list(package_ids)])
+        locked_ids = {row[0] for row in self.env.cr.fetchall()}
+        if locked_ids:
+            self.env.cr.execute("""
+                UPDATE stock_quant_package SET write_date = now() at time zone 'UTC' WHERE id = ANY(%s)
+            """, [list(locked_ids)])
+            self.env['stock.quant.package'].invalidate_model(['write_date'])
+        return locked_ids
+
+    @api.model
+    def _cron_purge_released(self):
+        """Delete the reservations of done and cancelled pickings"""
+        self.env.cr.execute(f"""
+            DELETE FROM {self._table} r
+             USING stock_picking p
+             WHERE p.id = r.picking_id AND p.state IN ('done', 'cancel')
+        """)
+        _logger.info("Purged %s released pallet reservations", self.env.cr.rowcount)
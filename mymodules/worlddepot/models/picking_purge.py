@@ -0,0 +1,145 @@
+import logging
+import time
+from datetime import timedelta
+
+from psycopg2 import errors
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+
+class PickingPurge(models.Model):
+    _name = 'world.depot.picking.purge'
+    _description = 'Done Pickings Purge Job'
+    _order = 'id desc'
+
+    # Maximum time spent by one cron run before handing back to the scheduler
+    _cron_time_budget = 300
+
+    name = fields.Char(string='Name', required=True, default=lambda self: _('Purge %s') % fields.Date.today())
+    project = fields.Many2one('project.project', string='Project',
+                              help='Only purge pickings of orders of this project. Leave empty for all pickings.')
+    date_from = fields.Date(string='Done From')
+    date_to = fields.Date(string='Done To')
+    chunk_size = fields.Integer(string='Chunk Size', default=200, required=True,
+                                help='Number of pickings deleted per transaction')
+    state = fields.Selection(
+        selection=[
+            ('draft', 'Draft'),
+            ('running', 'Running'),
+            ('paused', 'Paused'),
+            ('done', 'Done'),
+            ('failed', 'Failed'),
+        ],
+        default='draft',
+        string='State',
+        readonly=True,
+    )
+    total_count = fields.Integer(string='Pickings to Purge', readonly=True)
+    processed_count = fields.Integer(string='Pickings Purged', readonly=True)
+    progress = fields.Float(string='Progress', compute='_compute_progress')
+    last_picking_id = fields.Integer(string='Last Picking ID', readonly=True,
+                                     help='Pickings up to this ID have been handled; the job resumes after it')
+    message = fields.Text(string='Message', readonly=True)
+
+    _sql_constraints = [
+        ('chunk_size_positive', 'CHECK(chunk_size > 0)', 'Chunk size must be positive!'),
+    ]
+
+    @api.depends('total_count', 'processed_count')
+    def _compute_progress(self):
+        for record in self:
+            record.progress = 100.0 * record.processed_count / record.total_count if record.total_count else 0.0
+
+    def _get_picking_domain(self):
+        self.ensure_one()
+        domain = [('state', '=', 'done')]
+        if self.project:
+            domain += ['|', ('inbound_order_id.project', '=', self.project.id),
+                       ('outbound_order_id.project', '=', self.project.id)]
+        if self.date_from:
+            domain.append(('date_done', '>=', fields.Datetime.to_datetime(self.date_from)))
+        if self.date_to:
+            domain.append(('date_done', '<', fields.Datetime.to_datetime(self.date_to + timedelta(days=1))))
+        return domain
+
+    def action_start(self):
+        for record in self:
+            if record.state == 'running':
+                continue
+            if record.state == 'done':
+                raise UserError(_("Purge job %s is already done.") % record.name)
+            vals = {'state': 'running', 'message': False}
+            # A paused or failed job resumes with the total counted at its first start
+            if record.state == 'draft':
+                vals['total_count'] = self.env['stock.picking'].search_count(
+                    record._get_picking_domain() + [('id', '>', record.last_picking_id)])
+            record.write(vals)
+        self.env.ref('worlddepot.ir_cron_picking_purge')._trigger()
+
+    def action_pause(self):
+        self.filtered(lambda r: r.state == 'running').write({'state': 'paused'})
+
+    def _lock_state(self):
+        """Lock the job row for this transaction and return its committed state"""
+        self.ensure_one()
+        self.env.cr.execute(f"SELECT state FROM {self._table} WHERE id = %s FOR UPDATE NOWAIT", [self.id])
+        self.invalidate_recordset()
+        row = self.env.cr.fetchone()
+        return row and row[0]
+
+    def _process_chunk(self):
+        """Delete the next chunk of done pickings. Returns False once nothing is left."""
+        self.ensure_one()
+        pickings = self.env['stock.picking'].search(
+            self._get_picking_domain() + [('id', '>', self.last_picking_id)],
+            order='id', limit=self.chunk_size)
+        if not pickings:
+            self.write({'state': 'done', 'message': _('%s pickings purged.') % self.processed_count})
+            return False
+
+        # Reset states so the standard unlink checks allow the deletion
+        pickings.move_ids.write({'state': 'draft'})
+        pickings.move_line_ids.write({'state': 'draft'})
+        pickings.write({'state': 'draft'})
+        last_picking_id = max(pickings.ids)
+        count = len(pickings)
+        pickings.unlink()
+
+        self.write({
+            'last_picking_id': last_picking_id,
+            'processed_count': self.processed_count + count,
+        })
+        return True
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Run purge jobs chunk by chunk, committing after each chunk so an interrupted run resumes"""
+        started = time.monotonic()
+        for job in self.search([('state', '=', 'running')], order='id'):
+            while time.monotonic() - started < self._cron_time_budget:
+                try:
+                    # A pause committed since the last chunk stops the job here
+                    if job._lock_state() != 'running':
+                        self.env.cr.rollback()
+                        break
+                    more = job._process_chunk()
+                    self.env.cr.commit()
+                except (errors.SerializationFailure, errors.LockNotAvailable):
+                    # The job is being paused or edited right now, leave it to the next run
+                    self.env.cr.rollback()
+                    _logger.info("Picking purge %s changed concurrently, stopping this run", job.name)
+                    break
+                except Exception as e:
+                    self.env.cr.rollback()
+                    _logger.exception("Picking purge %s failed", job.name)
+                    job.write({'state': 'failed', 'message': str(e)})
+                    self.env.cr.commit()
+                    break
+                if not more:
+                    break
+            else:
+                # Time budget spent, continue in the next run
+                self.env.ref('worlddepot.ir_cron_picking_purge')._trigger()
+                return
@@ -0,0 +1,195 @@
+import csv
+import logging
+import os
+import tempfile
+
+from openpyxl import Workbook
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools.safe_eval import safe_eval
+
+_logger = logging.getLogger(__name__)
+
+# Ids fetched per round trip from the server-side cursor, records are read and evicted per chunk
+EXPORT_CHUNK_SIZE = 2000
+
+
+class ReportExport(models.Model):
+    _name = 'world.depot.report.export'
+    _description = 'Report Export Job'
+    _order = 'id desc'
+
+    name = fields.Char(string='Name', required=True, default=lambda self: _('Export %s') % fields.Datetime.now())
+    model_name = fields.Selection(
+        selection=[
+            ('world.depot.inbound.order.summary', 'Inbound Orders Summary'),
+            ('world.depot.outbound.order.summary', 'Outbound Orders Summary'),
+            ('world.depot.outbound.order.sn.detail', 'Outbound Orders SN Detail'),
+        ],
+        string='Report',
+        required=True,
+    )
+    domain = fields.Char(string='Filter', default='[]', required=True)
+    file_format = fields.Selection(
+        selection=[
+            ('xlsx', 'Excel (xlsx)'),
+            ('csv', 'CSV'),
+        ],
+        string='Format',
+        default='xlsx',
+        required=True,
+    )
+    state = fields.Selection(
+        selection=[
+            ('draft', 'Draft'),
+            ('queued', 'Queued'),
+            ('done', 'Done'),
+            ('failed', 'Failed'),
+        ],
+        default='draft',
+        string='State',
+        readonly=True,
+    )
+    row_count = fields.Integer(string='Rows', readonly=True)
+    attachment_id = fields.Many2one('ir.attachment', string='File', readonly=True, ondelete='set null')
+    datas = fields.Binary(related='attachment_id.datas', string='Download')
+    filename = fields.Char(related='attachment_id.name', string='File Name')
+    message = fields.Text(string='Message', readonly=True)
+
+    @api.model
+    def action_export_records(self, model_name, records, active_domain=None):
+        """Queue an export of the given records, or of the whole domain when it was selected.
+
+        The web client sends ``active_domain`` for any filtered list, only "select all" makes it
+        match more records than the ones in ``records``.
+        """
+        domain = [('id', 'in', records.ids)]
+        if active_domain and self.env[model_name].search_count(active_domain) > len(records):
+            domain = active_domain
+        job = self.create({'model_name': model_name, 'domain': repr(domain)})
+        job.action_queue()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Report Export'),
+            'res_model': self._name,
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    def write(self, vals):
+        # The job runs as its creator, what it exports is fixed once it exists
+        if {'model_name', 'domain'}.intersection(vals) and not self.env.su:
+            raise UserError(_("The report and filter of an export cannot be changed. Create a new export."))
+        return super().write(vals)
+
+    def action_queue(self):
+        if any(job.state == 'done' for job in self):
+            raise UserError(_("This export is already done. Create a new one."))
+        self.write({'state': 'queued', 'message': False})
+        self.env.ref('worlddepot.ir_cron_report_export')._trigger()
+
+    def _get_export_fields(self, Model):
+        """Fields exported for the report, in definition order"""
+        return [
+            name for name, field in Model._fields.items()
+            if name not in models.MAGIC_COLUMNS and name != 'display_name'
+            and field.type not in ('binary', 'one2many', 'many2many')
+        ]
+
+    def _iter_rows(self, Model, field_names):
+        """Yield one list of values per record, read in chunks through a server-side cursor"""
+        converters = []
+        for name in field_names:
+            field = Model._fields[name]
+            if field.type == 'many2one':
+                converters.append(lambda value: value[1] if value else None)
+            elif field.type == 'selection':
+                labels = dict(field._description_selection(self.env))
+                converters.append(lambda value, labels=labels: labels.get(value, value) if value else None)
+            elif field.type == 'boolean':
+                converters.append(bool)
+            else:
+                converters.append(lambda value: None if value is False else value)
+
+        query = Model._search(safe_eval(self.domain))
+        sql = query.select()
+        with self.env.cr._cnx.cursor(name=f'world_depot_export_{self.id}') as named_cr:
+            named_cr.itersize = EXPORT_CHUNK_SIZE
+            named_cr.execute(sql.code, sql.params)
+            while True:
+                ids = [row[0] for row in named_cr.fetchmany(EXPORT_CHUNK_SIZE)]
+                if not ids:
+                    break
+                for values in Model.browse(ids).read(field_names):
+                    yield [convert(values[name]) for convert, name in zip(converters, field_names)]
+                # Keep memory flat: drop the chunk from the cache
+                self.env.invalidate_all()
+
+    def _write_file(self, path):
+        """Write the export to ``path`` and return the number of rows"""
+        self.ensure_one()
+        Model = self.env[self.model_name]
+        field_names = self._get_export_fields(Model)
+        header = [Model._fields[name].string for name in field_names]
+        count = 0
+        if self.file_format == 'csv':
+            with open(path, 'w', newline='', encoding='utf-8-sig') as output:
+                writer = csv.writer(output)
+                writer.writerow(header)
+                for row in self._iter_rows(Model, field_names):
+                    writer.writerow(['' if value is None else value for value in row])
+                    count += 1
+        else:
+            workbook = Workbook(write_only=True)
+            worksheet = workbook.create_sheet(title=Model._description[:31])
+            worksheet.append(header)
+            for row in self._iter_rows(Model, field_names):
+                worksheet.append(row)
+                count += 1
+            workbook.save(path)
+        return count
+
+    def _run(self):
+        self.ensure_one()
+        fd, path = tempfile.mkstemp(suffix=f'.{self.file_format}')
+        os.close(fd)
+        try:
+            count = self._write_file(path)
+            # The rows are streamed to disk; only the finished file is loaded, once, for the attachment
+            with open(path, 'rb') as output:
+                content = output.read()
+        finally:
+            os.unlink(path)
+
+        mimetype = 'text/csv' if self.file_format == 'csv' \
+            else 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        attachment = self.env['ir.attachment'].create({
+            'name': f"{self.model_name.replace('.', '_')}_{fields.Date.today()}.{self.file_format}",
+            'type': 'binary',
+            'res_model': self._name,
+            'res_id': self.id,
+            'raw': content,
+            'mimetype': mimetype,
+        })
+        self.write({
+            'state': 'done',
+            'row_count': count,
+            'attachment_id': attachment.id,
+            'message': _('%s rows exported.') % count,
+        })
+
+    @api.model
+    def _cron_run_exports(self):
+        """Run queued exports, one transaction per job"""
+        for job in self.search([('state', '=', 'queued')], order='id'):
+            try:
+                # Record rules of the user who asked for the export apply
+                job.with_user(job.create_uid)._run()
+                self.env.cr.commit()
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.exception("Report export %s failed", job.name)
+                job.write({'state': 'failed', 'message': str(e)})
+                self.env.cr.commit()
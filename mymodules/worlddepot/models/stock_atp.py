@@ -0,0 +1,210 @@
+import logging
+from collections import defaultdict
+from odoo import models, fields, api
+from odoo.tools.sql import index_exists
+
+_logger = logging.getLogger(__name__)
+
+# Rows of stock_atp per owner, product, pallet and location class, for the (product, package) pairs
+# of the enclosing ``pairs`` CTE, or for all stock when %(all)s is true. Stock without a package uses
+# package 0 in the pairs. Quantities planned on open move lines or reserved for open pickings are
+# reserved. The pallet prefix is only the container segment of the package name, e.g. CNTR in
+# REF-CNTR-0001, used to group the partner stock answer; allocation matches on the package name.
+ATP_SELECT = """
+    WITH planned AS (
+        SELECT package_id, product_id, location_id, owner_id, SUM(quantity) AS quantity
+          FROM stock_move_line
+         WHERE state NOT IN ('done', 'cancel') AND package_id IS NOT NULL
+           AND (%(all)s OR (product_id, package_id) IN (SELECT product_id, package_id FROM pairs))
+      GROUP BY package_id, product_id, location_id, owner_id
+    ), reserved AS (
+        SELECT r.package_id, r.product_id, r.location_id, r.owner_id, SUM(r.quantity) AS quantity
+          FROM world_depot_pallet_reservation r
+          JOIN stock_picking p ON p.id = r.picking_id
+         WHERE p.state NOT IN ('done', 'cancel')
+           AND (%(all)s OR (r.product_id, r.package_id) IN (SELECT product_id, package_id FROM pairs))
+      GROUP BY r.package_id, r.product_id, r.location_id, r.owner_id
+    ), stock AS (
+        SELECT q.owner_id, q.product_id, q.package_id,
+               substring(pk.name from '-([^-]+)-[^-]*$') AS pallet_prefix,
+               CASE WHEN l.name = 'Output' THEN 'output' ELSE 'stock' END AS location_class,
+               SUM(q.quantity) AS on_hand,
+               LEAST(SUM(q.quantity), GREATEST(COALESCE(MAX(planned.quantity), 0),
+                                               COALESCE(MAX(reserved.quantity), 0))) AS reserved
+          FROM stock_quant q
+          JOIN stock_location l ON l.id = q.location_id AND l.usage = 'internal'
+     LEFT JOIN stock_quant_package pk ON pk.id = q.package_id
+     LEFT JOIN planned ON planned.package_id = q.package_id AND planned.product_id = q.product_id
+                      AND planned.location_id = q.location_id AND planned.owner_id IS NOT DISTINCT FROM q.owner_id
+     LEFT JOIN reserved ON reserved.package_id = q.package_id AND reserved.product_id = q.product_id
+                       AND reserved.location_id = q.location_id AND reserved.owner_id IS NOT DISTINCT FROM q.owner_id
+         WHERE q.quantity > 0
+           AND (%(all)s OR (q.product_id, COALESCE(q.package_id, 0)) IN (SELECT product_id, package_id FROM pairs))
+      GROUP BY q.owner_id, q.product_id, q.package_id, pk.name, q.location_id, l.name
+    )
+    SELECT owner_id, product_id, package_id, pallet_prefix, location_class,
+           SUM(on_hand) AS on_hand, SUM(reserved) AS reserved, SUM(on_hand) - SUM(reserved) AS free
+      FROM stock
+  GROUP BY owner_id, product_id, package_id, pallet_prefix, location_class
+"""
+
+
+class StockAtp(models.Model):
+    _name = 'world.depot.stock.atp'
+    _description = 'Available to Promise'
+    _order = 'owner_id, product_id, pallet_prefix, package_id'
+
+    owner_id = fields.Many2one('res.partner', string='Owner', ondelete='cascade')
+    product_id = fields.Many2one('product.product', string='Product', required=True, ondelete='cascade')
+    package_id = fields.Many2one('stock.quant.package', string='Pallet', ondelete='cascade')
+    pallet_prefix = fields.Char(string='Container')
+    location_class = fields.Selection(
+        selection=[
+            ('stock', 'Stock'),
+            ('output', 'Output'),
+        ],
+        string='Location Class',
+        required=True,
+    )
+    on_hand = fields.Float(string='On Hand', digits='Product Unit of Measure')
+    reserved = fields.Float(string='Reserved', digits='Product Unit of Measure')
+    free = fields.Float(string='Free', digits='Product Unit of Measure')
+
+    def init(self):
+        self.env.cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self._table}_owner_idx ON {self._table} (owner_id, location_class)
+        """)
+        if not index_exists(self.env.cr, f'{self._table}_key_uniq'):
+            # Rows used to be keyed per pallet prefix; the table is derived data, rebuild it per pallet
+            self.env.cr.execute(f"DROP INDEX IF EXISTS {self._table}_lookup_idx")
+            self.env.cr.execute(f"DELETE FROM {self._table}")
+            self.env.cr.execute(f"""
+                CREATE UNIQUE INDEX {self._table}_key_uniq
+                    ON {self._table} (product_id, (COALESCE(package_id, 0)), (COALESCE(owner_id, 0)), location_class)
+            """)
+            self._refresh()
+
+    @api.model
+    def _refresh(self, pairs=None):
+        """Upsert the rows of the given ``(product id, package id)`` pairs, or of the whole table.
+
+        Only rows whose quantities changed are written, so the nightly rebuild does not lock the
+        rows of pallets nobody touched. Rows of pallets that no longer hold the product are
+        deleted. Use package id 0 for stock without a package.
+        """
+        if pairs is not None and not pairs:
+            return
+        self.env.flush_all()
+        pairs = sorted(pairs or [])
+        self.env.cr.execute(f"""
+            WITH pairs AS (
+                SELECT * FROM unnest(%(products)s::int[], %(packages)s::int[]) AS pairs (product_id, package_id)
+            ), atp AS ({ATP_SELECT}), upserted AS (
+                INSERT INTO {self._table} (owner_id, product_id, package_id, pallet_prefix, location_class,
+                                           on_hand, reserved, free,
+                                           create_uid, create_date, write_uid, write_date)
+                SELECT atp.*, %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+                  FROM atp
+             LEFT JOIN {self._table} t ON t.product_id = atp.product_id
+                                      AND COALESCE(t.package_id, 0) = COALESCE(atp.package_id, 0)
+                                      AND COALESCE(t.owner_id, 0) = COALESCE(atp.owner_id, 0)
+                                      AND t.location_class = atp.location_class
+                 WHERE t.id IS NULL
+                    OR (t.on_hand, t.reserved, t.free, t.pallet_prefix)
+                       IS DISTINCT FROM (atp.on_hand, atp.reserved, atp.free, atp.pallet_prefix)
+                    ON CONFLICT (product_id, (COALESCE(package_id, 0)), (COALESCE(owner_id, 0)), location_class)
+                    DO UPDATE SET pallet_prefix = EXCLUDED.pallet_prefix, on_hand = EXCLUDED.on_hand,
+                                  reserved = EXCLUDED.reserved, free = EXCLUDED.free,
+                                  write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+                 WHERE ({self._table}.on_hand, {self._table}.reserved, {self._table}.free,
+                        {self._table}.pallet_prefix)
+                       IS DISTINCT FROM (EXCLUDED.on_hand, EXCLUDED.reserved, EXCLUDED.free,
+                                         EXCLUDED.pallet_prefix)
+             RETURNING id
+            )
+            DELETE FROM {self._table} t
+             WHERE (%(all)s OR (t.product_id, COALESCE(t.package_id, 0)) IN (SELECT product_id, package_id FROM pairs))
+               AND NOT EXISTS (SELECT 1 FROM atp
+                                WHERE atp.product_id = t.product_id
+                                  AND COALESCE(atp.package_id, 0) = COALESCE(t.package_id, 0)
+                                  AND COALESCE(atp.owner_id, 0) = COALESCE(t.owner_id, 0)
+                                  AND atp.location_class = t.location_class)
+               AND t.id NOT IN (SELECT id FROM upserted)
+        """, {
+            'all': not pairs,
+            'products': [product_id for product_id, _package_id in pairs],
+            'packages': [package_id or 0 for _product_id, package_id in pairs],
+            'uid': self.env.uid,
+        })
+        self.invalidate_model()
+
+    @api.model
+    def _schedule_refresh(self, pairs):
+        """Refresh the rows of ``pairs`` once the current transaction has committed.
+
+        The pairs of a transaction are collected and upserted in one go in a separate transaction,
+        so stock validations neither run the upsert nor conflict on its rows. A refresh that fails
+        is logged and caught up by the nightly rebuild.
+        """
+        pairs = {(product_id, package_id or 0) for product_id, package_id in pairs if product_id}
+        if not pairs:
+            return
+        data = self.env.cr.postcommit.data
+        key = 'world_depot_stock_atp_pairs'
+        if key not in data:
+            data[key] = set()
+            registry, uid, model_name = self.env.registry, self.env.uid, self._name
+
+            @self.env.cr.postcommit.add
+            def refresh():
+                scheduled = data.pop(key, set())
+                try:
+                    with registry.cursor() as cr:
+                        api.Environment(cr, uid, {})[model_name]._refresh(scheduled)
+                except Exception:
+                    _logger.exception("Refresh of %s available to promise rows failed", len(scheduled))
+        data[key] |= pairs
+
+    @api.model
+    def _get_move_line_pairs(self, move_lines):
+        """``(product id, package id)`` pairs of the pallets moved or planned by ``move_lines``"""
+        pairs = set()
+        for move_line in move_lines:
+            pairs.add((move_line.product_id.id, move_line.package_id.id or 0))
+            if move_line.result_package_id:
+                pairs.add((move_line.product_id.id, move_line.result_package_id.id))
+        return pairs
+
+    @api.model
+    def _cron_refresh(self):
+        """Full rebuild, catches quant changes made outside stock moves"""
+        self._refresh()
+        _logger.info("Rebuilt available to promise table")
+
+    @api.model
+    def _get_pallet_candidates(self, products, location_class='stock'):
+        """Free quantities per pallet from one indexed lookup, oldest pallets first.
+
+        :return: dict product id -> list of candidate dicts, in the format of
+            ``world.depot.outbound.wave._get_pallet_candidates`` so the same matching applies
+        """
+        self.flush_model()
+        self.env.cr.execute(f"""
+            SELECT atp.product_id, atp.package_id, pk.name, atp.owner_id, SUM(atp.free)
+              FROM {self._table} atp
+              JOIN stock_quant_package pk ON pk.id = atp.package_id
+             WHERE atp.product_id = ANY(%s) AND atp.location_class = %s
+          GROUP BY atp.product_id, atp.package_id, pk.name, pk.create_date, atp.owner_id
+          ORDER BY pk.create_date, pk.name
+        """, [products.ids, location_class])
+        candidates = defaultdict(list)
+        for product_id, package_id, package_name, owner_id, free in self.env.cr.fetchall():
+            if free > 0:
+                candidates[product_id].append({
+                    'package_id': package_id,
+                    'name': (package_name or '').lower(),
+                    'location_id': False,
+                    'owner_id': owner_id,
+                    'available': free,
+                })
+        return candidates
@@ -0,0 +1,240 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import pytz
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Move lines fetched per round trip from the server-side cursor during a backfill
+BACKFILL_FETCH_SIZE = 5000
+# Snapshot rows written per insert during a backfill
+BACKFILL_INSERT_SIZE = 1000
+# Storage days are calendar days in the company timezone; a snapshot taken before this hour of
+# the night books the day that just ended
+SNAPSHOT_DAY_CUTOFF = 6
+
+
+class StorageSnapshot(models.Model):
+    _name = 'world.depot.storage.snapshot'
+    _description = 'Storage Snapshot'
+    _order = 'date desc, owner_id, location_class'
+
+    date = fields.Date(string='Date', required=True, index=True)
+    owner_id = fields.Many2one('res.partner', string='Owner', required=True, index=True, ondelete='cascade')
+    project_id = fields.Many2one('project.project', string='Project', ondelete='set null')
+    location_class = fields.Selection(
+        selection=[
+            ('stock', 'Stock'),
+            ('output', 'Output'),
+        ],
+        string='Location Class',
+        required=True,
+    )
+    pallet_count = fields.Integer(string='Pallets', help='Packages with stock in internal locations at the end of the day')
+    source = fields.Selection(
+        selection=[
+            ('nightly', 'Nightly'),
+            ('backfill', 'Backfill'),
+        ],
+        string='Source',
+        default='nightly',
+    )
+
+    _sql_constraints = [
+        ('date_owner_class_uniq', 'unique(date, owner_id, location_class)',
+         'Only one storage snapshot per day, owner and location class!'),
+    ]
+
+    @api.model
+    def _get_storage_tz(self):
+        return pytz.timezone(self.env.company.partner_id.tz or 'UTC')
+
+    @api.model
+    def _get_storage_day(self, moment=None):
+        """Storage day of a UTC ``moment`` (now by default) for the nightly snapshot"""
+        moment = pytz.utc.localize(moment or fields.Datetime.now())
+        return (moment.astimezone(self._get_storage_tz()) - timedelta(hours=SNAPSHOT_DAY_CUTOFF)).date()
+
+    @api.model
+    def _take_snapshot(self, date=None):
+        """Record the pallets on hand per owner and location class in one statement.
+
+        Rows of that day for an owner and location class without pallets any more are deleted, so
+        a snapshot taken again on the same day does not keep their count.
+        """
+        date = date or self._get_storage_day()
+        self.env['stock.quant'].flush_model()
+        self.env.cr.execute(f"""
+            WITH counts AS (
+                SELECT q.owner_id,
+                       CASE WHEN l.name = 'Output' THEN 'output' ELSE 'stock' END AS location_class,
+                       COUNT(DISTINCT q.package_id) AS pallet_count
+                  FROM stock_quant q
+                  JOIN stock_location l ON l.id = q.location_id AND l.usage = 'internal'
+                 WHERE q.quantity > 0 AND q.package_id IS NOT NULL AND q.owner_id IS NOT NULL
+              GROUP BY q.owner_id, CASE WHEN l.name = 'Output' THEN 'output' ELSE 'stock' END
+            ), upserted AS (
+                INSERT INTO {self._table} (date, owner_id, project_id, location_class, pallet_count, source,
+                                           create_uid, create_date, write_uid, write_date)
+                SELECT %(date)s, c.owner_id,
+                       (SELECT MIN(p.id) FROM project_project p WHERE p.owner = c.owner_id),
+                       c.location_class, c.pallet_count, 'nightly',
+                       %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+                  FROM counts c
+                    ON CONFLICT (date, owner_id, location_class) DO UPDATE
+                   SET pallet_count = EXCLUDED.pallet_count, project_id = EXCLUDED.project_id,
+                       source = EXCLUDED.source, write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+             RETURNING id
+            ), removed AS (
+                DELETE FROM {self._table} t
+                 WHERE t.date = %(date)s
+                   AND NOT EXISTS (SELECT 1 FROM counts c
+                                    WHERE c.owner_id = t.owner_id AND c.location_class = t.location_class)
+             RETURNING id
+            )
+            SELECT (SELECT COUNT(*) FROM upserted), (SELECT COUNT(*) FROM removed)
+        """, {'date': date, 'uid': self.env.uid})
+        upserted, removed = self.env.cr.fetchone()
+        self.invalidate_model()
+        _logger.info("Storage snapshot of %s: %s rows, %s removed", date, upserted, removed)
+
+    @api.model
+    def _cron_take_snapshot(self):
+        self._take_snapshot()
+
+    @api.model
+    def _backfill(self, date_from, date_to):
+        """Rebuild missing snapshots between two dates from the done move lines.
+
+        Sweeps all done move lines up to ``date_to`` in date order through a server-side cursor,
+        keeping the quantity of each package per owner and location class. At every day boundary,
+        in the storage timezone, the packages with a positive quantity are counted. Days that
+        already have a snapshot keep it. Returns the number of rows written.
+        """
+        tz = self._get_storage_tz()
+        date_limit = tz.localize(datetime.combine(date_to + timedelta(days=1), time.min)) \
+            .astimezone(pytz.utc).replace(tzinfo=None)
+        self.flush_model()
+        self.env['stock.move.line'].flush_model()
+        self.env.cr.execute("SELECT owner, MIN(id) FROM project_project WHERE owner IS NOT NULL GROUP BY owner")
+        project_by_owner = dict(self.env.cr.fetchall())
+
+        balance = defaultdict(float)  # (package, owner, class) -> quantity
+        counts = defaultdict(int)     # (owner, class) -> packages with a positive quantity
+        pending = []
+        written = 0
+
+        def move(key, quantity):
+            before = balance[key] > 1e-6
+            balance[key] += quantity
+            after = balance[key] > 1e-6
+            if before != after:
+                counts[key[1:]] += 1 if after else -1
+            if not after and abs(balance[key]) <= 1e-6:
+                del balance[key]
+
+        def emit(day):
+            nonlocal pending, written
+            if day < date_from:
+                return
+            for (owner_id, location_class), count in counts.items():
+                if count:
+                    pending.append((day, owner_id, project_by_owner.get(owner_id), location_class, count))
+            if len(pending) >= BACKFILL_INSERT_SIZE:
+                written += self._insert_backfill_rows(pending)
+                pending = []
+
+        current_day = None
+        with self.env.cr._cnx.cursor(name='world_depot_storage_backfill') as named_cr:
+            named_cr.itersize = BACKFILL_FETCH_SIZE
+            named_cr.execute("""
+                SELECT (ml.date AT TIME ZONE 'UTC' AT TIME ZONE %s)::date, ml.package_id, ml.result_package_id,
+                       COALESCE(ml.owner_id, sp.owner_id), ml.quantity_product_uom,
+                       src.usage = 'internal', CASE WHEN src.name = 'Output' THEN 'output' ELSE 'stock' END,
+                       dest.usage = 'internal', CASE WHEN dest.name = 'Output' THEN 'output' ELSE 'stock' END
+                  FROM stock_move_line ml
+                  JOIN stock_location src ON src.id = ml.location_id
+                  JOIN stock_location dest ON dest.id = ml.location_dest_id
+             LEFT JOIN stock_picking sp ON sp.id = ml.picking_id
+                 WHERE ml.state = 'done' AND ml.date < %s
+                   AND (ml.package_id IS NOT NULL OR ml.result_package_id IS NOT NULL)
+              ORDER BY ml.date, ml.id
+            """, [tz.zone, date_limit])
+            for day, package_id, result_package_id, owner_id, quantity, \
+                    src_internal, src_class, dest_internal, dest_class in named_cr:
+                if current_day is None:
+                    current_day = day
+                while current_day < day:
+                    emit(current_day)
+                    current_day += timedelta(days=1)
+                if not owner_id:
+                    continue
+                if src_internal and package_id:
+                    move((package_id, owner_id, src_class), -quantity)
+                # Unpacking leaves the result package empty, the goods are no longer on a pallet
+                if dest_internal and result_package_id:
+                    move((result_package_id, owner_id, dest_class), quantity)
+
+        while current_day is not None and current_day <= date_to:
+            emit(current_day)
+            current_day += timedelta(days=1)
+        if pending:
+            written += self._insert_backfill_rows(pending)
+        self.invalidate_model()
+        _logger.info("Storage snapshot backfill %s - %s: %s rows", date_from, date_to, written)
+        return written
+
+    @api.model
+    def _insert_backfill_rows(self, rows):
+        values_sql = ", ".join(["(%s, %s, %s, %s, %s, 'backfill', %s, now() at time zone 'UTC', "
+                                "%s, now() at time zone 'UTC')"] * len(rows))
+        params = [value for row in rows for value in (*row, self.env.uid, self.env.uid)]
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table} (date, owner_id, project_id, location_class, pallet_count, source,
+                                       create_uid, create_date, write_uid, write_date)
+            VALUES {values_sql}
+            ON CONFLICT (date, owner_id, location_class) DO NOTHING
+        """, params)
+        return self.env.cr.rowcount
+
+    @api.model
+    def _get_pallet_days(self, date_from, date_to, owners=None, location_class='stock'):
+        """Pallet days per owner over a period, both dates included, from the snapshots.
+
+        :return: dict owner id -> pallet days
+        """
+        domain = [('date', '>=', date_from), ('date', '<=', date_to), ('location_class', '=', location_class)]
+        if owners is not None:
+            domain.append(('owner_id', 'in', owners.ids))
+        return {
+            owner.id: pallet_days
+            for owner, pallet_days in self._read_group(domain, ['owner_id'], ['pallet_count:sum'])
+        }
+
+
+class StorageSnapshotBackfill(models.TransientModel):
+    _name = 'world.depot.storage.snapshot.backfill'
+    _description = 'Storage Snapshot Backfill'
+
+    date_from = fields.Date(string='From', required=True)
+    date_to = fields.Date(string='To', required=True, default=lambda self: fields.Date.context_today(self))
+
+    def action_backfill(self):
+        self.ensure_one()
+        if self.date_from > self.date_to:
+            raise UserError(_("The start date must be before the end date."))
+        written = self.env['world.depot.storage.snapshot']._backfill(self.date_from, self.date_to)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Storage Snapshots'),
+                'message': _('%s snapshot rows rebuilt.') % written,
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }